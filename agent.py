@@ -1,59 +1,181 @@
+import logging
+import numpy as np
 from abc import ABC, abstractmethod
-from typing import Dict, Any
-from llm import LLMClient, MockLLM
-from memory import MemoryCache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import llm
+import metrics
+from chunking import split_document
+from llm import Generation, generate
+from memory import SemanticMemory, SearchResult
+from namespaces import NamespacedMemory
+from coalesce import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# (prompt) -> Generation; fallback text has is_fallback set and is never cached
+GenerateFn = Callable[[str], Generation]
 
 class BaseAgent(ABC):
     """Base class for all agents"""
-    
-    def __init__(self, llm_client, memory_cache: MemoryCache):
-        self.llm_client = llm_client
-        self.memory_cache = memory_cache
+
+    # Default similarity threshold for this agent's cache partition
+    similarity_threshold = 0.7
+    # Whether inputs longer than chunk_chars are answered chunk by chunk (see _process_long)
+    chunk_inputs = False
+    # Sent to the LLM ahead of the query, never part of the cache key
+    prompt_prefix = ""
+
+    def __init__(self, memory: SemanticMemory, generate_fn: GenerateFn = generate,
+                 single_flight: Optional[SingleFlight] = None, chunk_chars: int = 1000):
+        # This agent's own partition: its index, threshold and eviction budget
+        self.memory = memory
+        self.generate_fn = generate_fn
+        # The embedding model truncates long inputs (~256 tokens for MiniLM), so
+        # documents past this size would be keyed by their opening only
+        self.chunk_chars = chunk_chars
+        # Per partition, so the same question asked of two agents is two generations
+        self.single_flight = single_flight or SingleFlight(similarity_threshold=lambda: memory.similarity_threshold)
         self.name = self.__class__.__name__
-    
-    @abstractmethod
+
     def get_prompt_prefix(self) -> str:
         """Get the prompt prefix for this agent"""
-        pass
-    
+        return self.prompt_prefix
+
     @abstractmethod
     def get_description(self) -> str:
         """Get a description of what this agent does"""
         pass
-    
+
     def process_query(self, user_query: str) -> Dict[str, Any]:
         """Process a user query with caching"""
-        # Create the full prompt with agent prefix
-        full_prompt = f"{self.get_prompt_prefix()} {user_query}"
-        
+        if self._is_long(user_query):
+            return self._process_long(user_query)
+        # The prefix only goes to the LLM; the cache is keyed by the bare query
+        # within this agent's partition, so the prefix cannot dilute the embedding.
+        # An exact repeat is answered before anything is encoded.
+        exact = self.memory.search_exact(user_query)
+        if exact.hit:
+            return self._hit(exact)
+        embedding = self.memory.encode(user_query)
+
         # Check cache first
-        cached_response, is_hit, similarity = self.memory_cache.get_cached_response(full_prompt)
-        
-        if is_hit:
-            return {
-                'response': cached_response,
-                'is_cache_hit': True,
-                'similarity_score': similarity,
-                'agent': self.name,
-                'model_used': None
-            }
-        
-        # Cache miss - generate new response
+        lookup = self.memory.search_detailed(user_query, embedding=embedding, exact=exact)
+        if lookup.hit:
+            return self._hit(lookup)
+        return self._answer_miss(user_query, embedding, exact)
+
+    def process_batch(self, user_queries: List[str], max_concurrency: int = 4) -> List[Dict[str, Any]]:
+        """Process many queries: one encode pass, one index search, bounded concurrent LLM calls.
+
+        Results come back in input order, one dict per query as from process_query().
+        """
+        long_inputs = [i for i, query in enumerate(user_queries) if self._is_long(query)]
+        if not long_inputs:
+            return self._process_batch(user_queries, max_concurrency)
+        # Long inputs fan out into their own chunk batches
+        results: List[Optional[Dict[str, Any]]] = [None] * len(user_queries)
+        short = sorted(set(range(len(user_queries))) - set(long_inputs))
+        for i, result in zip(short, self._process_batch([user_queries[i] for i in short], max_concurrency)):
+            results[i] = result
+        for i in long_inputs:
+            results[i] = self._process_long(user_queries[i], max_concurrency)
+        return results
+
+    def _process_batch(self, user_queries: List[str], max_concurrency: int) -> List[Dict[str, Any]]:
+        if not user_queries:
+            return []
+        # Exact repeats are answered first; only the rest are encoded and searched
+        exact = [self.memory.search_exact(query) for query in user_queries]
+        lookups = list(exact)
+        pending = [i for i, lookup in enumerate(lookups) if not lookup.hit]
+        embeddings = {}
+        if pending:
+            pending_queries = [user_queries[i] for i in pending]
+            vectors = self.memory.encode_many(pending_queries)
+            embeddings = dict(zip(pending, vectors))
+            pending_exact = [exact[i] for i in pending]
+            for i, lookup in zip(pending, self.memory.search_many_detailed(pending_queries, vectors,
+                                                                            exact=pending_exact)):
+                lookups[i] = lookup
+
+        results: List[Optional[Dict[str, Any]]] = [
+            self._hit(lookup) if lookup.hit else None for lookup in lookups
+        ]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            # Equivalent misses in the batch coalesce in single-flight, or hit the
+            # cache on their re-check once an earlier one has been stored
+            with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(misses))),
+                                    thread_name_prefix=f"batch-{self.name}") as pool:
+                answers = pool.map(lambda i: self._answer_miss(user_queries[i], embeddings[i], exact[i]), misses)
+                for i, answer in zip(misses, answers):
+                    results[i] = answer
+        return results
+
+    def _is_long(self, user_query: str) -> bool:
+        return self.chunk_inputs and len(user_query) > self.chunk_chars
+
+    def _process_long(self, user_query: str, max_concurrency: int = 4) -> Dict[str, Any]:
+        """Answer a long input chunk by chunk and join the parts in document order.
+
+        Each chunk is cached in this partition like a short query, so a document
+        that is mostly unchanged only generates its edited chunks again. The
+        answer is a per-chunk list, also returned as ``parts``: no final pass
+        combines them, as that would be an uncached LLM call for every document.
+        """
+        chunks = split_document(user_query, self.chunk_chars)
+        parts = self._process_batch(chunks, max_concurrency)
+        cached = sum(1 for part in parts if part['is_cache_hit'])
+        metrics.CHUNK_LOOKUPS.inc(cached, namespace=self.memory.name, result="hit")
+        metrics.CHUNK_LOOKUPS.inc(len(parts) - cached, namespace=self.memory.name, result="miss")
+        logger.info("🧩 %s answered %d of %d chunks from cache", self.name, cached, len(parts))
+
+        result = {
+            'response': "\n\n".join(part['response'] for part in parts),
+            'parts': [part['response'] for part in parts],
+            'is_cache_hit': cached == len(parts),
+            'similarity_score': min(part['similarity_score'] for part in parts),
+            'agent': self.name,
+            'model_used': next((part['model_used'] for part in parts if part['model_used']), None),
+            'chunks': len(parts),
+            'chunks_cached': cached,
+            'is_fallback': any(part.get('is_fallback') for part in parts)
+        }
+        if any(part.get('error') for part in parts):
+            result['error'] = True
+        return result
+
+    def _hit(self, lookup: SearchResult) -> Dict[str, Any]:
+        return {
+            'response': lookup.response,
+            'is_cache_hit': True,
+            'similarity_score': lookup.score,
+            'margin': lookup.margin,
+            'tier': lookup.tier,
+            'agent': self.name,
+            'model_used': None
+        }
+
+    def _answer_miss(self, user_query: str, embedding: np.ndarray, exact: SearchResult) -> Dict[str, Any]:
+        """Generate new response, joining an equivalent one in flight; ``exact`` is the tier-0 miss"""
         try:
-            response = self.llm_client.generate_response(full_prompt)
-            
-            # Store in cache
-            self.memory_cache.add_to_cache(full_prompt, response)
-            
+            (response, model, cached), coalesced = self.single_flight.do(
+                user_query, embedding, lambda: self._generate_and_cache(user_query, embedding, exact)
+            )
+
             return {
                 'response': response,
-                'is_cache_hit': False,
+                'is_cache_hit': cached,
+                'coalesced': coalesced,
                 'similarity_score': 0.0,
                 'agent': self.name,
-                'model_used': self.llm_client.get_current_model()
+                'model_used': model,
+                'is_fallback': model is None and not cached
             }
-            
+
         except Exception as e:
+            logger.exception("❌ %s failed to answer: %s", self.name, e)
             return {
                 'response': f"Error generating response: {str(e)}",
                 'is_cache_hit': False,
@@ -63,96 +185,152 @@ class BaseAgent(ABC):
                 'error': True
             }
 
+    def _generate_and_cache(self, user_query: str, embedding: np.ndarray,
+                            exact: SearchResult) -> Tuple[str, Optional[str], bool]:
+        """Generate a response and store it in the cache; returns (response, model, cached)"""
+        # An equivalent generation may have finished since our cache lookup; tier 0 is not repeated
+        cached = self.memory.search_detailed(user_query, embedding=embedding, record_lookup=False, exact=exact)
+        if cached.hit:
+            return cached.response, None, True
+
+        prefix = self.get_prompt_prefix()
+        full_prompt = f"{prefix} {user_query}" if prefix else user_query
+        generation = self.generate_fn(full_prompt)
+
+        # Only real model answers are cached; the fallback is a placeholder
+        if not generation.is_fallback:
+            self.memory.store_async(user_query, generation.text, embedding=embedding)
+        return generation.text, generation.model, False
+
 class SummarizationAgent(BaseAgent):
     """Agent specialized in summarizing content"""
-    
-    def get_prompt_prefix(self) -> str:
-        return "Summarize this:"
-    
+
+    # Different documents often embed close together; only reuse near-identical ones
+    similarity_threshold = 0.85
+    chunk_inputs = True
+    prompt_prefix = "Summarize this:"
+
     def get_description(self) -> str:
         return "Summarizes long text into key points and main ideas"
 
 class PlanningAgent(BaseAgent):
     """Agent specialized in creating plans and strategies"""
-    
-    def get_prompt_prefix(self) -> str:
-        return "Plan the following task:"
-    
+
+    similarity_threshold = 0.8
+    prompt_prefix = "Plan the following task:"
+
     def get_description(self) -> str:
         return "Creates step-by-step plans and strategies for tasks and projects"
 
 class RetrievalAgent(BaseAgent):
     """Agent specialized in extracting key information"""
-    
-    def get_prompt_prefix(self) -> str:
-        return "Extract key info from this:"
-    
+
+    similarity_threshold = 0.85
+    chunk_inputs = True
+    prompt_prefix = "Extract key info from this:"
+
     def get_description(self) -> str:
         return "Extracts and highlights the most important information from text"
 
+class DirectAgent(BaseAgent):
+    """Sends the query unchanged, like /chat; serves plain namespaces in batch and replay"""
+
+    def get_description(self) -> str:
+        return "Answers the query as asked"
+
+AGENT_CLASSES = {
+    'summarization': SummarizationAgent,
+    'planning': PlanningAgent,
+    'retrieval': RetrievalAgent
+}
+
 class AgentManager:
     """Manages multiple agents and handles routing"""
-    
-    def __init__(self, use_mock_llm: bool = False):
-        # Initialize LLM client
-        try:
-            if use_mock_llm:
-                raise ValueError("Using mock LLM")
-            self.llm_client = LLMClient()
-            # Test connection
-            if not self.llm_client.test_connection():
-                print("LLM API connection failed, switching to mock LLM")
-                self.llm_client = MockLLM()
-        except Exception as e:
-            print(f"Failed to initialize LLM client: {e}")
-            print("Using mock LLM for demonstration")
-            self.llm_client = MockLLM()
-        
-        # Initialize memory cache
-        self.memory_cache = MemoryCache()
-        
+
+    def __init__(self, memory: Optional[NamespacedMemory] = None,
+                 namespace_config: Optional[Dict[str, dict]] = None, max_concurrency: int = 4,
+                 chunk_chars: int = 1000):
+        # One cache partition per agent; namespace_config overrides an agent's
+        # threshold or budget, e.g. {"planning": {"max_entries": 5000}}
+        overrides = {
+            name: {'similarity_threshold': cls.similarity_threshold, **(namespace_config or {}).get(name, {})}
+            for name, cls in AGENT_CLASSES.items()
+        }
+        if memory is None:
+            memory = NamespacedMemory(overrides=overrides)
+        else:
+            # Settings for partitions the shared memory has not opened yet
+            for name, config in overrides.items():
+                if name in memory.overrides:
+                    continue
+                memory.overrides[name] = config
+                if name in memory:
+                    # Reopened from disk before we could configure it
+                    memory.partition(name).similarity_threshold = config['similarity_threshold']
+        self.memory = memory
+        self.max_concurrency = max_concurrency
+
+        # Model preference for agent calls; switch_llm_model() moves one to the front
+        self.model_order = list(llm.MODELS)
+
         # Initialize agents
         self.agents = {
-            'summarization': SummarizationAgent(self.llm_client, self.memory_cache),
-            'planning': PlanningAgent(self.llm_client, self.memory_cache),
-            'retrieval': RetrievalAgent(self.llm_client, self.memory_cache)
+            name: cls(self.memory.partition(name), generate_fn=self._generate, chunk_chars=chunk_chars)
+            for name, cls in AGENT_CLASSES.items()
         }
-    
+
+    def _generate(self, prompt: str) -> Generation:
+        # Agent batches and replays are bulk work; interactive /chat calls go first
+        return generate(prompt, models=self.model_order, priority="bulk")
+
     def get_available_agents(self) -> Dict[str, str]:
         """Get list of available agents with descriptions"""
         return {
-            name: agent.get_description() 
+            name: agent.get_description()
             for name, agent in self.agents.items()
         }
-    
+
     def process_query(self, agent_name: str, user_query: str) -> Dict[str, Any]:
         """Process a query using the specified agent"""
         if agent_name not in self.agents:
-            return {
-                'response': f"Unknown agent: {agent_name}",
-                'is_cache_hit': False,
-                'similarity_score': 0.0,
-                'agent': 'error',
-                'error': True
-            }
-        
+            return self._unknown_agent(agent_name)
+
         agent = self.agents[agent_name]
         result = agent.process_query(user_query)
-        
+
         return result
-    
+
+    def process_batch(self, agent_name: str, queries: List[str],
+                      max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Process a batch of queries with one agent; see BaseAgent.process_batch"""
+        if agent_name not in self.agents:
+            return [self._unknown_agent(agent_name) for _ in queries]
+        return self.agents[agent_name].process_batch(queries, max_concurrency or self.max_concurrency)
+
+    def _unknown_agent(self, agent_name: str) -> Dict[str, Any]:
+        return {
+            'response': f"Unknown agent: {agent_name}",
+            'is_cache_hit': False,
+            'similarity_score': 0.0,
+            'agent': 'error',
+            'error': True
+        }
+
     def get_cache_stats(self) -> Dict[str, Any]:
-        """Get cache statistics"""
-        return self.memory_cache.get_stats()
-    
-    def clear_cache(self):
-        """Clear the memory cache"""
-        self.memory_cache.clear_cache()
-    
+        """Get cache statistics, per agent partition"""
+        return self.memory.get_stats()
+
+    def clear_cache(self, agent_name: Optional[str] = None):
+        """Clear one agent's cache partition, or all of them"""
+        self.memory.clear(agent_name)
+
     def switch_llm_model(self, model_name: str) -> bool:
-        """Switch the LLM model for all agents"""
-        return self.llm_client.switch_model(model_name)
-    
+        """Try ``model_name`` first for all agents; the others remain as fallbacks"""
+        if model_name not in llm.MODELS:
+            return False
+        self.model_order = [model_name] + [m for m in llm.MODELS if m != model_name]
+        return True
+
     def get_current_model(self) -> str:
-        """Get the current LLM model name"""
-        return self.llm_client.get_current_model()
\ No newline at end of file
+        """Get the preferred LLM model name"""
+        return self.model_order[0]
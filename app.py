@@ -1,73 +1,363 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from dotenv import load_dotenv
-from memory import SemanticMemory
-from llm import generate, test_api_connectivity
+from log import configure_logging, SAMPLED
+from memory import SearchResult, SemanticMemory
+from namespaces import DEFAULT_NAMESPACE
+from config import encoder_from_env, memories_from_env
+from coalesce import SingleFlight
+from agent import AgentManager
+from feedback import FeedbackTracker
+from llm import generate, generate_stream, test_api_connectivity, circuit_breaker, negative_cache, scheduler
+from request_log import RequestLog
+from replay import warm_from_log
+import metrics
+import logging
 import time
+import json
 import os
+import threading
 
 # Load environment variables
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-memory = SemanticMemory(similarity_threshold=0.7)
+# The embedding model is loaded lazily; see _warm_up() below
+encoder = encoder_from_env()
+# One cache partition per namespace (e.g. per agent), all sharing the encoder;
+# see config.py for the MEMORY_* settings
+memories = memories_from_env(encoder)
+memory = memories.partition(DEFAULT_NAMESPACE)
+# Agents get their own partitions in the same memory (see agent.AGENT_CLASSES)
+# Summarization and retrieval inputs longer than AGENT_CHUNK_CHARS are cached chunk by chunk
+agents = AgentManager(memory=memories, max_concurrency=int(os.getenv("BATCH_CONCURRENCY", "4")),
+                      chunk_chars=int(os.getenv("AGENT_CHUNK_CHARS", "1000")))
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "256"))
+# Thumbs up/down and re-asks after a hit; ADAPTIVE_THRESHOLD=1 tunes each namespace's threshold from them
+feedback = FeedbackTracker(
+    memories,
+    log_dir=memories.persist_dir,
+    adapt=os.getenv("ADAPTIVE_THRESHOLD") == "1",
+    reask_window=float(os.getenv("REASK_WINDOW_SECONDS", "120")),
+    reask_similarity=float(os.getenv("REASK_SIMILARITY", "0.6")),
+    target=float(os.getenv("THRESHOLD_TARGET_FALSE_HIT_RATE", "0.05")),
+    floor=float(os.getenv("THRESHOLD_FLOOR", "0.6")),
+    ceiling=float(os.getenv("THRESHOLD_CEILING", "0.95")),
+    min_confirmed=int(os.getenv("THRESHOLD_MIN_CONFIRMED", "5"))
+)
+# Append-only log of served queries, off unless REQUEST_LOG=1 (it holds every user query);
+# replay.py warms a cache from it
+request_log = RequestLog(
+    os.getenv("REQUEST_LOG_DIR", "logs") if os.getenv("REQUEST_LOG") == "1" else None,
+    max_bytes=int(os.getenv("REQUEST_LOG_MAX_BYTES", str(64 * 1024 * 1024))),
+    backup_count=int(os.getenv("REQUEST_LOG_BACKUPS", "10"))
+)
+_cache_warm = threading.Event()
+
+# Coalescing is per namespace: equivalent queries in different partitions are different requests
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _session(data: dict) -> str:
+    """Client-supplied session id for re-ask detection, else the client address"""
+    return str(data.get('session') or request.remote_addr or '')
+
+def _partition(data: dict):
+    """(memory, single-flight) for the request's namespace; only configured namespaces are accepted"""
+    namespace = data.get('namespace') or DEFAULT_NAMESPACE
+    if namespace not in memories:
+        raise KeyError(namespace)
+    with _inflight_lock:
+        if namespace not in _inflight:
+            # Read per match: the feedback controller may move the threshold
+            memory = memories.partition(namespace)
+            _inflight[namespace] = SingleFlight(similarity_threshold=lambda: memory.similarity_threshold)
+        return memories.partition(namespace), _inflight[namespace]
+
+def _per_namespace(fn):
+    return lambda: {(name,): fn(memories.partition(name)) for name in memories.namespaces}
+
+# Size gauges are read from memory when /metrics is scraped, not on every request
+metrics.MEMORY_ENTRIES.set_function(_per_namespace(lambda m: m.entry_stats.live_count))
+metrics.MEMORY_BYTES.set_function(_per_namespace(lambda m: m.entry_stats.live_bytes))
+metrics.INDEX_VECTORS.set_function(_per_namespace(lambda m: m.index.ntotal))
+metrics.TOMBSTONES.set_function(_per_namespace(lambda m: m.entry_stats.tombstones))
+
+def _warm_up():
+    """Load the embedding model per EMBED_WARMUP: background (default), eager or lazy"""
+    mode = os.getenv("EMBED_WARMUP", "background")
+    if mode == "eager":
+        encoder.warm_up(background=False)
+    elif mode == "background":
+        encoder.warm_up(background=True)
+
+def _warm_cache():
+    """With WARM_FROM_LOG=1, replay the request log into the cache before reporting ready"""
+    try:
+        warm_from_log(
+            memories, os.getenv("WARM_LOG_PATH", os.getenv("REQUEST_LOG_DIR", "logs")), agents,
+            limit=int(os.environ["WARM_LIMIT"]) if os.getenv("WARM_LIMIT") else None,
+            concurrency=int(os.getenv("BATCH_CONCURRENCY", "4"))
+        )
+    except Exception as e:
+        logger.exception("❌ Cache warm-up from the request log failed: %s", e)
+    finally:
+        _cache_warm.set()
+
+_warm_up()
+if os.getenv("WARM_FROM_LOG") == "1":
+    threading.Thread(target=_warm_cache, name="cache-warm", daemon=True).start()
+else:
+    _cache_warm.set()
 
 @app.route('/')
 def index():
     """Serve the main page"""
     return render_template('index.html')
 
+def _generate_and_store(memory: SemanticMemory, query: str, embedding, exact: SearchResult):
+    """Generate and cache a response; returns (response, api_success, cached, model)"""
+    # An equivalent generation may have finished between our search and now;
+    # tier 0 already missed (``exact``), so only the index is searched again
+    cached = memory.search_detailed(query, embedding=embedding, record_lookup=False, exact=exact)
+    if cached.hit:
+        return cached.response, True, True, None
+    
+    generation = generate(query)
+    
+    # Canned fallbacks (every model failed, or failed moments ago) are never cached
+    api_success = not generation.is_fallback
+    
+    if api_success:
+        # Store successful API responses in memory, off the response path
+        memory.store_async(query, generation.text, embedding=embedding)
+        logger.info("💾 Queued new response for memory", extra=SAMPLED)
+    else:
+        logger.warning("⚠️ Using fallback response (%s, not cached)", generation.status)
+    
+    return generation.text, api_success, False, generation.model
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """Handle chat requests with improved error handling"""
+    start_time = time.time()
+    start = time.perf_counter()
     try:
         data = request.json
         query = data.get('query', '').strip()
         
         if not query:
             return jsonify({'error': 'Query cannot be empty'}), 400
+        try:
+            memory, inflight = _partition(data)
+        except KeyError as e:
+            return jsonify({'error': f'Unknown namespace: {e.args[0]}'}), 400
         
-        start_time = time.time()
-        
-        # Check semantic memory first
-        cached_response = memory.search(query)
+        # Tier 0: a repeat of a cached query (up to case, spacing and punctuation)
+        # is answered without encoding; otherwise encode once, and the same vector
+        # is reused by store() on a miss
+        exact = memory.search_exact(query)
+        embedding = None if exact.hit else memory.encode(query)
+        encoded = time.perf_counter()
+        session = _session(data)
+        feedback.observe_query(session, memory.name, query, embedding)
+
+        # Then semantic memory
+        lookup = exact if exact.hit else memory.search_detailed(query, embedding=embedding, exact=exact)
+        searched = time.perf_counter()
+        latency_ms = {'encode': (encoded - start) * 1000, 'lookup': (searched - encoded) * 1000}
         
-        if cached_response:
+        if lookup.hit:
             response_time = time.time() - start_time
-            print(f"✅ Cache hit for: {query[:50]}...")
+            logger.info("✅ Cache hit for: %s...", query[:50], extra=SAMPLED)
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="chat", result="hit")
+            request_log.record("chat", memory.name, query, "hit", embedding, similarity=round(lookup.score, 4),
+                               tier=lookup.tier, latency_ms={**latency_ms, 'total': (time.perf_counter() - start) * 1000})
             return jsonify({
-                'response': cached_response,
+                'response': lookup.response,
                 'cached': True,
+                'tier': lookup.tier,
+                'hit_id': feedback.record_hit(session, memory.name, query, embedding, lookup),
+                'similarity': round(lookup.score, 4),
+                'margin': round(lookup.margin, 4) if lookup.margin is not None else None,
                 'response_time': f"{response_time:.2f}s",
                 'stats': memory.get_stats()
             })
         
-        # Generate new response
-        print(f"🔄 Cache miss - generating new response for: {query[:50]}...")
-        llm_response = generate(query)
-        
-        # Determine if response was generated successfully
-        api_success = llm_response and not llm_response.startswith("Error:") and "fallback" not in llm_response.lower()
-        
-        if api_success:
-            # Store successful API responses in memory
-            memory.store(query, llm_response)
-            print(f"💾 Stored new response in memory")
-        else:
-            print(f"⚠️ Using fallback response (not cached)")
+        # Generate new response, sharing it with concurrent equivalent misses
+        logger.info("🔄 Cache miss - generating new response for: %s...", query[:50], extra=SAMPLED)
+        (llm_response, api_success, cached, model), coalesced = inflight.do(
+            query, embedding, lambda: _generate_and_store(memory, query, embedding, exact)
+        )
         
         response_time = time.time() - start_time
+        result = "coalesced" if coalesced else "miss" if api_success else "fallback"
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="chat", result=result)
+        request_log.record("chat", memory.name, query, result, embedding, model=model, latency_ms={
+            **latency_ms, 'generate': (time.perf_counter() - searched) * 1000, 'total': (time.perf_counter() - start) * 1000
+        })
         
         return jsonify({
             'response': llm_response,
-            'cached': False,
+            'cached': cached,
+            'coalesced': coalesced,
             'api_success': api_success,
             'response_time': f"{response_time:.2f}s",
             'stats': memory.get_stats()
         })
         
     except Exception as e:
-        print(f"❌ Server error: {str(e)}")
+        logger.exception("❌ Server error: %s", e)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="chat", result="error")
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+def _sse(payload: dict) -> str:
+    """Format one server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream the response as server-sent events, caching it once complete"""
+    data = request.json or {}
+    query = data.get('query', '').strip()
+    
+    if not query:
+        return jsonify({'error': 'Query cannot be empty'}), 400
+    try:
+        memory, _ = _partition(data)
+    except KeyError as e:
+        return jsonify({'error': f'Unknown namespace: {e.args[0]}'}), 400
+    
+    start_time = time.time()
+    start = time.perf_counter()
+    lookup = memory.search_exact(query)
+    embedding = None if lookup.hit else memory.encode(query)
+    encoded = time.perf_counter()
+    session = _session(data)
+    feedback.observe_query(session, memory.name, query, embedding)
+    if not lookup.hit:
+        lookup = memory.search_detailed(query, embedding=embedding, exact=lookup)
+    searched = time.perf_counter()
+    hit_id = feedback.record_hit(session, memory.name, query, embedding, lookup) if lookup.hit else None
+    latency_ms = {'encode': (encoded - start) * 1000, 'lookup': (searched - encoded) * 1000}
+    
+    def events():
+        if lookup.hit:
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="chat_stream", result="hit")
+            request_log.record("chat_stream", memory.name, query, "hit", embedding, similarity=round(lookup.score, 4),
+                               tier=lookup.tier, latency_ms={**latency_ms, 'total': (time.perf_counter() - start) * 1000})
+            yield _sse({'token': lookup.response})
+            yield _sse({
+                'done': True,
+                'cached': True,
+                'tier': lookup.tier,
+                'hit_id': hit_id,
+                'response_time': f"{time.time() - start_time:.2f}s",
+                'stats': memory.get_stats()
+            })
+            return
+        
+        chunks = []
+        api_success = True
+        used_model = None
+        try:
+            for model, token in generate_stream(query):
+                if model is None:
+                    api_success = False
+                used_model = model
+                if token:
+                    if not chunks:
+                        latency_ms['first_token'] = (time.perf_counter() - searched) * 1000
+                    chunks.append(token)
+                    yield _sse({'token': token})
+        except Exception as e:
+            logger.exception("❌ Streaming error: %s", e)
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="chat_stream", result="error")
+            request_log.record("chat_stream", memory.name, query, "error", embedding, model=used_model,
+                               latency_ms={**latency_ms, 'total': (time.perf_counter() - start) * 1000})
+            yield _sse({'error': f'Server error: {str(e)}'})
+            return
+        
+        llm_response = "".join(chunks).strip()
+        if api_success and llm_response:
+            memory.store_async(query, llm_response, embedding=embedding)
+            logger.info("💾 Queued streamed response for memory", extra=SAMPLED)
+        else:
+            api_success = False
+            logger.warning("⚠️ Streamed fallback or incomplete response (not cached)")
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="chat_stream",
+                                        result="miss" if api_success else "fallback")
+        request_log.record("chat_stream", memory.name, query, "miss" if api_success else "fallback", embedding,
+                           model=used_model if api_success else None,
+                           latency_ms={**latency_ms, 'total': (time.perf_counter() - start) * 1000})
+        
+        yield _sse({
+            'done': True,
+            'cached': False,
+            'api_success': api_success,
+            'response_time': f"{time.time() - start_time:.2f}s",
+            'stats': memory.get_stats()
+        })
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """Answer many queries with one agent: one encode pass, one index search, bounded concurrent LLM calls"""
+    data = request.get_json(silent=True) or {}
+    agent_name = data.get('agent', '')
+    queries = data.get('queries')
+    
+    if agent_name not in agents.agents:
+        return jsonify({'error': f'Unknown agent: {agent_name}', 'agents': agents.get_available_agents()}), 400
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        return jsonify({'error': 'queries must be a non-empty list of non-empty strings'}), 400
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({'error': f'At most {BATCH_MAX_QUERIES} queries per batch'}), 400
+    
+    start = time.perf_counter()
+    try:
+        results = agents.process_batch(agent_name, [q.strip() for q in queries])
+    except Exception as e:
+        logger.exception("❌ Batch error: %s", e)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="batch", result="error")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
+    elapsed = time.perf_counter() - start
+    
+    hits = sum(1 for r in results if r['is_cache_hit'])
+    errors = sum(1 for r in results if r.get('error'))
+    for query, r in zip(queries, results):
+        outcome = 'error' if r.get('error') else 'hit' if r['is_cache_hit'] else 'fallback' if r.get('is_fallback') else 'miss'
+        request_log.record("batch", agent_name, query.strip(), outcome, model=r.get('model_used'), agent=agent_name,
+                           batch=len(results), latency_ms={'batch_total': elapsed * 1000})
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint="batch", result="error" if errors else "ok")
+    logger.info("📦 Batch of %d for %s: %d hits, %d errors in %.2fs",
+                len(results), agent_name, hits, errors, elapsed, extra=SAMPLED)
+    
+    return jsonify({
+        'agent': agent_name,
+        'results': results,
+        'hits': hits,
+        'misses': len(results) - hits,
+        'errors': errors,
+        'response_time': f"{elapsed:.2f}s"
+    })
+
+@app.route('/feedback', methods=['POST'])
+def rate_hit():
+    """Thumbs up/down on a cached answer: {"hit_id": ..., "helpful": false}"""
+    data = request.get_json(silent=True) or {}
+    hit_id = data.get('hit_id')
+    if not hit_id or not isinstance(data.get('helpful'), bool):
+        return jsonify({'error': 'hit_id and a boolean helpful are required'}), 400
+    if not feedback.feedback(str(hit_id), data['helpful']):
+        return jsonify({'error': 'Unknown or already rated hit'}), 404
+    return jsonify({'message': 'Thanks for the feedback'})
 
 @app.route('/stats')
 def stats():
@@ -81,7 +371,15 @@ def stats():
             **memory.get_stats(),
             'api_status': api_status,
             'available_models_count': len(available_models),
-            'sample_models': available_models[:5] if available_models else []
+            'sample_models': available_models[:5] if available_models else [],
+            'model_health': circuit_breaker.get_stats(),
+            'negative_cache': negative_cache.get_stats(),
+            'llm_scheduler': scheduler.get_stats(),
+            'metrics': metrics.summary(),
+            'namespaces': memories.get_stats()['namespaces'],
+            'feedback': feedback.get_stats(),
+            'inflight_generations': sum(f.get_stats()['inflight_generations'] for f in list(_inflight.values())),
+            'coalesced_requests': sum(f.get_stats()['coalesced_requests'] for f in list(_inflight.values()))
         })
     except Exception as e:
         return jsonify({
@@ -90,16 +388,37 @@ def stats():
             'error': str(e)
         })
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint for this process"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once the embedding model is loaded (and the cache warmed, with WARM_FROM_LOG), 503 before"""
+    ready = encoder.ready and _cache_warm.is_set()
+    body = {
+        'ready': ready,
+        'cache_warm': _cache_warm.is_set(),
+        'model_load_seconds': encoder.load_seconds,
+        'total_entries': memories.get_stats()['total_entries']
+    }
+    if encoder.load_error:
+        body['error'] = encoder.load_error
+    return jsonify(body), 200 if ready else 503
+
 @app.route('/clear', methods=['POST'])
 def clear_memory():
-    """Clear semantic memory"""
-    global memory
+    """Clear semantic memory (one namespace if given, else all); the loaded encoder is kept"""
     try:
-        memory = SemanticMemory(similarity_threshold=0.7)
-        print("🧹 Memory cleared successfully")
+        namespace = (request.get_json(silent=True) or {}).get('namespace')
+        if namespace and namespace not in memories:
+            return jsonify({'error': f'Unknown namespace: {namespace}'}), 400
+        memories.clear(namespace)
+        logger.info("🧹 Memory cleared successfully")
         return jsonify({'message': 'Memory cleared successfully'})
     except Exception as e:
-        print(f"❌ Error clearing memory: {e}")
+        logger.exception("❌ Error clearing memory: %s", e)
         return jsonify({'error': f'Failed to clear memory: {str(e)}'}), 500
 
 @app.route('/test-api')
@@ -108,14 +427,16 @@ def test_api():
     try:
         test_prompt = "Hello, how are you?"
         start_time = time.time()
-        response = generate(test_prompt)
+        generation = generate(test_prompt)
         response_time = time.time() - start_time
         
         return jsonify({
             'test_prompt': test_prompt,
-            'response': response,
+            'response': generation.text,
+            'model': generation.model,
+            'status': generation.status,
             'response_time': f"{response_time:.2f}s",
-            'api_working': response and not response.lower().startswith('error')
+            'api_working': not generation.is_fallback
         })
     except Exception as e:
         return jsonify({
@@ -123,29 +444,35 @@ def test_api():
             'api_working': False
         })
 
-if __name__ == '__main__':
-    print("🚀 Starting Memory-Augmented LLM Demo...")
-    print(f"📊 Initial memory stats: {memory.get_stats()}")
-    
+def _startup_probe():
+    """Log API connectivity once at startup; also primes the model catalogue cache"""
     # Check if API key is available
     api_key = os.getenv("TOGETHER_API_KEY", "tgp_v1_5LFzL374MbMoNI6CNLhO5PF7qlosPj8bHazud7LbXJs")
     if api_key:
-        print(f"🔑 TogetherAI API key loaded: {api_key[:10]}...")
+        logger.info("🔑 TogetherAI API key loaded: %s...", api_key[:10])
         
         # Test API connectivity on startup
-        print("🔗 Testing API connectivity...")
+        logger.info("🔗 Testing API connectivity...")
         available_models = test_api_connectivity()
         if available_models:
-            print(f"✅ API is accessible with {len(available_models)} models")
+            logger.info("✅ API is accessible with %d models", len(available_models))
             chat_models = [m for m in available_models if any(keyword in m.lower() for keyword in ['instruct', 'chat', 'turbo'])]
             if chat_models:
-                print(f"🎯 Found {len(chat_models)} chat models: {chat_models[:3]}...")
+                logger.info("🎯 Found %d chat models: %s...", len(chat_models), chat_models[:3])
             else:
-                print("⚠️ No chat/instruct models found")
+                logger.warning("⚠️ No chat/instruct models found")
         else:
-            print("❌ API not accessible, will use fallback responses")
+            logger.warning("❌ API not accessible, will use fallback responses")
     else:
-        print("⚠️ No TogetherAI API key found, will use fallback responses")
+        logger.warning("⚠️ No TogetherAI API key found, will use fallback responses")
+
+if __name__ == '__main__':
+    logger.info("🚀 Starting Memory-Augmented LLM Demo...")
+    logger.info("📊 Initial memory stats: %s", memory.get_stats())
+    
+    # Probe the API in the background so the server binds immediately
+    threading.Thread(target=_startup_probe, name="startup-probe", daemon=True).start()
     
-    print("🌐 Starting Flask server...")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    logger.info("🌐 Starting Flask server...")
+    # Development server; use `gunicorn -c gunicorn.conf.py wsgi:app` in production
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", host='0.0.0.0', port=int(os.getenv("PORT", "5000")), threaded=True)
\ No newline at end of file
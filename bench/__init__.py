@@ -0,0 +1,5 @@
+"""Offline benchmarks for the cache and LLM request path.
+
+Run from the repository root, e.g. ``python -m bench.bench_memory``; see the
+Benchmarks section of the readme for every script and its options.
+"""
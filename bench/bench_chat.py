@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+End-to-end /chat throughput under concurrent clients.
+
+    # everything offline: stub LLM + a fresh app process on a temp store
+    python -m bench.bench_chat --spawn-app --scenario flaky --clients 1,8,32
+
+    # or against a server you started yourself
+    python -m bench.bench_chat --url http://127.0.0.1:5000 --clients 16
+
+Queries are drawn from a fixed pool with a Zipf-like popularity skew, so a
+run mixes cache hits, misses and concurrent repeats the way real traffic does.
+``--replay logs`` instead sends the /chat traffic recorded in the request log
+(request_log.py), in its original order and namespaces.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from bench.common import elapsed_ms, percentiles, print_table, write_results
+from bench.stub_llm import SCENARIOS, load_scenario, start_stub
+from bench.bench_encoder import sample_texts
+from request_log import read_log
+
+def workload(unique: int, total: int, skew: float, seed: int) -> list:
+    """``total`` /chat bodies over ``unique`` distinct texts, popular ones repeated more"""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, unique + 1) ** skew
+    picks = rng.choice(unique, size=total, p=weights / weights.sum())
+    pool = sample_texts(unique)
+    return [{"query": pool[i]} for i in picks]
+
+def replay_workload(path: str, total: int) -> list:
+    """The first ``total`` logged /chat requests as /chat bodies"""
+    bodies = []
+    for record in read_log(path):
+        if record.get("endpoint") in ("chat", "chat_stream") and record.get("query"):
+            bodies.append({"query": record["query"], "namespace": record.get("namespace")})
+            if len(bodies) == total:
+                break
+    if not bodies:
+        raise SystemExit(f"❌ No /chat requests found in {path}")
+    return bodies
+
+def wait_ready(url: str, timeout: float = 300.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/ready", timeout=2).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"❌ {url} did not become ready within {timeout:.0f}s")
+
+def spawn_app(port: int, api_base: str, memory_dir: str, log_path: str) -> subprocess.Popen:
+    """Run app.py in its own process so client threads do not share its GIL"""
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "TOGETHER_API_BASE": api_base,
+        "TOGETHER_API_KEY": os.getenv("TOGETHER_API_KEY", "stub"),
+        "MEMORY_DIR": memory_dir,
+        # Keep benchmark traffic out of the real request log
+        "REQUEST_LOG_DIR": os.path.join(os.path.dirname(memory_dir), "logs"),
+        "EMBED_WARMUP": "eager"
+    }
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    log = open(log_path, "w")
+    return subprocess.Popen([sys.executable, "app.py"], cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def run_load(url: str, queries: list, clients: int, timeout: float) -> dict:
+    local = threading.local()
+
+    def one(body):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = local.session.post(f"{url}/chat", json=body, timeout=timeout)
+            body = response.json() if response.status_code == 200 else {}
+            return elapsed_ms(start), response.status_code, body
+        except requests.exceptions.RequestException:
+            return elapsed_ms(start), None, {}
+
+    start_all = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(one, queries))
+    seconds = time.perf_counter() - start_all
+
+    hit_ms = [ms for ms, status, body in results if status == 200 and body.get("cached") and not body.get("coalesced")]
+    miss_ms = [ms for ms, status, body in results if status == 200 and not body.get("cached")]
+    overall = percentiles(ms for ms, status, _ in results if status == 200)
+    ok = sum(1 for _, status, _ in results if status == 200)
+    return {
+        "clients": clients,
+        "requests": len(queries),
+        "req_per_s": round(len(queries) / seconds, 1),
+        "errors": len(queries) - ok,
+        "hit_rate": round(len(hit_ms) / max(1, ok), 3),
+        "coalesced": sum(1 for _, _, body in results if body.get("coalesced")),
+        "fallbacks": sum(1 for _, status, body in results if status == 200 and body.get("api_success") is False),
+        "p50_ms": overall["p50"],
+        "p95_ms": overall["p95"],
+        "p99_ms": overall["p99"],
+        "hit_p50_ms": percentiles(hit_ms)["p50"],
+        "miss_p50_ms": percentiles(miss_ms)["p50"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end /chat load test")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--spawn-app", action="store_true", help="start a stub LLM and a fresh app process")
+    parser.add_argument("--port", type=int, default=5055, help="app port with --spawn-app")
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--scenario", default="healthy", help=f"stub scenario: {sorted(SCENARIOS)}")
+    parser.add_argument("--stub-config", help="JSON scenario file for the stub")
+    parser.add_argument("--clients", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=500, help="requests per client setting")
+    parser.add_argument("--unique", type=int, default=200, help="distinct queries in the pool")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of query popularity")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--replay", help="request log directory or file to use as the workload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    url, app_process, stub, workdir, completed = args.url, None, None, None, False
+    try:
+        if args.spawn_app:
+            stub = start_stub(args.stub_port, load_scenario(args.scenario, args.stub_config), args.seed)
+            workdir = tempfile.mkdtemp(prefix="bench_chat_")
+            log_path = os.path.join(workdir, "app.log")
+            url = f"http://127.0.0.1:{args.port}"
+            app_process = spawn_app(args.port, f"http://127.0.0.1:{args.stub_port}/v1",
+                                    os.path.join(workdir, "memory_store"), log_path)
+            print(f"🚀 App starting on {url} (log: {log_path})")
+        wait_ready(url)
+
+        rows = []
+        for i, clients in enumerate(int(c) for c in args.clients.split(",")):
+            # Each setting starts from an empty cache and a fresh query draw
+            requests.post(f"{url}/clear", timeout=args.timeout)
+            if args.replay:
+                queries = replay_workload(args.replay, args.requests)
+            else:
+                queries = workload(args.unique, args.requests, args.skew, args.seed + i)
+            print(f"⏱️  {len(queries)} requests from {clients} clients...")
+            rows.append(run_load(url, queries, clients, args.timeout))
+
+        print()
+        print_table(rows, ["clients", "requests", "req_per_s", "errors", "hit_rate", "coalesced", "fallbacks",
+                           "p50_ms", "p95_ms", "p99_ms", "hit_p50_ms", "miss_p50_ms"])
+        write_results(args.json, "chat", vars(args), rows)
+        completed = True
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(timeout=30)
+        if stub is not None:
+            stub.shutdown()
+        if workdir is not None and completed:
+            # Keep the app log around when something went wrong
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
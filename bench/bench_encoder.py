@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Embedding throughput by batch size, and through the micro-batching path.
+
+    python -m bench.bench_encoder --batch-sizes 1,8,32,128 --backend int8 --threads 4
+
+Uses the real model for the chosen EMBEDDING_* settings (downloaded on first
+run). The encoder's exact-repeat cache is disabled so every text is encoded.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bench.common import elapsed_ms, percentiles, print_table, quiet, write_results
+from embedding_backends import BACKENDS, DEFAULT_MODEL
+from encoder import BatchingEncoder
+
+TOPICS = ["python decorators", "a trip to goa", "binary search trees", "sourdough starters",
+          "the french revolution", "kubernetes networking", "index funds", "marathon training"]
+TEMPLATES = ["Explain {} in simple terms", "What are common mistakes with {}?",
+             "Summarize the key ideas behind {}", "Plan a weekend project around {}"]
+
+def sample_texts(n: int, offset: int = 0) -> list:
+    """Distinct, query-like texts of realistic length"""
+    return [
+        f"{TEMPLATES[i % len(TEMPLATES)].format(TOPICS[(i // len(TEMPLATES)) % len(TOPICS)])} (variant {i})"
+        for i in range(offset, offset + n)
+    ]
+
+def bench_batch(encoder: BatchingEncoder, batch_size: int, total: int, offset: int) -> dict:
+    texts = sample_texts(total, offset)
+    batch_ms = []
+    start_all = time.perf_counter()
+    for start in range(0, total, batch_size):
+        start_batch = time.perf_counter()
+        encoder.encode_many(texts[start:start + batch_size])
+        batch_ms.append(elapsed_ms(start_batch))
+    seconds = time.perf_counter() - start_all
+    latency = percentiles(batch_ms)
+    return {
+        "mode": "encode_many",
+        "batch_size": batch_size,
+        "texts": total,
+        "texts_per_s": round(total / seconds, 1),
+        "batch_p50_ms": latency["p50"],
+        "batch_p95_ms": latency["p95"]
+    }
+
+def bench_concurrent(encoder: BatchingEncoder, clients: int, total: int, offset: int) -> dict:
+    """Single-text encode() calls from many threads, as concurrent /chat requests make them"""
+    texts = sample_texts(total, offset)
+    batches_before, encoded_before = encoder.batches, encoder.encoded
+
+    def one(text):
+        start = time.perf_counter()
+        encoder.encode(text)
+        return elapsed_ms(start)
+
+    start_all = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        call_ms = list(pool.map(one, texts))
+    seconds = time.perf_counter() - start_all
+    latency = percentiles(call_ms)
+    batches = encoder.batches - batches_before
+    return {
+        "mode": f"encode x{clients} threads",
+        "batch_size": round((encoder.encoded - encoded_before) / max(1, batches), 1),
+        "texts": total,
+        "texts_per_s": round(total / seconds, 1),
+        "batch_p50_ms": latency["p50"],
+        "batch_p95_ms": latency["p95"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding throughput")
+    parser.add_argument("--batch-sizes", default="1,8,32,128")
+    parser.add_argument("--texts", type=int, default=1024, help="texts encoded per batch size")
+    parser.add_argument("--clients", default="8,32", help="thread counts for the micro-batching run")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--backend", default="sentence-transformers", choices=BACKENDS)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--onnx-file")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    encoder = BatchingEncoder(
+        model_name=args.model,
+        backend=args.backend,
+        threads=args.threads,
+        onnx_file=args.onnx_file,
+        cache_size=0,
+        max_wait_ms=args.max_wait_ms
+    )
+    with quiet():
+        encoder.warm_up(background=False)
+    if not encoder.ready:
+        raise SystemExit(f"❌ Could not load {args.model} ({args.backend}): {encoder.load_error}")
+    print(f"🔥 {args.model} ({args.backend}) loaded in {encoder.load_seconds}s")
+
+    rows, offset = [], 0
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        rows.append(bench_batch(encoder, batch_size, args.texts, offset))
+        offset += args.texts
+    for clients in (int(c) for c in args.clients.split(",")):
+        rows.append(bench_concurrent(encoder, clients, args.texts, offset))
+        offset += args.texts
+
+    print()
+    print_table(rows, ["mode", "batch_size", "texts", "texts_per_s", "batch_p50_ms", "batch_p95_ms"])
+    write_results(args.json, "encoder", vars(args), rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+SemanticMemory search/store latency by cache size and index type.
+
+    python -m bench.bench_memory --sizes 1k,10k,100k,1m --index-types flat,ivf,hnsw,ivfpq
+
+Stores are pre-filled on disk with clustered synthetic vectors, then opened
+the way the app opens them, so the numbers include the real load path, lock
+and disk append costs but not the embedding model (see bench_encoder).
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+import numpy as np
+from bench.common import (clustered_vectors, elapsed_ms, parse_sizes, percentiles, print_table,
+                          quiet, synthetic_entries, write_results)
+from encoder import BatchingEncoder
+from memory import SemanticMemory
+from storage import DiskStore
+from vector_index import INDEX_TYPES
+
+def build_store(path: str, vectors: np.ndarray, fingerprint: str, chunk: int = 100000) -> None:
+    """Write a store directly, skipping SemanticMemory.store's per-entry overhead"""
+    disk = DiskStore(path, vectors.shape[1], encoder=fingerprint)
+    entries = synthetic_entries(len(vectors))
+    for start in range(0, len(vectors), chunk):
+        disk.append(vectors[start:start + chunk], entries[start:start + chunk])
+    disk.close()
+
+def run_case(index_type: str, size: int, args, encoder: BatchingEncoder) -> dict:
+    dimension = encoder.dimension
+    vectors = clustered_vectors(size + args.stores, dimension, seed=args.seed)
+    stored, fresh = vectors[:size], vectors[size:]
+    path = tempfile.mkdtemp(prefix="bench_memory_")
+    try:
+        build_store(path, stored, encoder.fingerprint)
+
+        start = time.perf_counter()
+        with quiet():
+            memory = SemanticMemory(
+                persist_dir=path,
+                index_type=index_type,
+                migrate_at=args.migrate_at,
+                nprobe=args.nprobe,
+                ef_search=args.ef_search,
+                encoder=encoder
+            )
+        open_ms = elapsed_ms(start)
+
+        # Half near-duplicates of stored rows (should hit), half unseen vectors
+        rng = np.random.default_rng(args.seed + 1)
+        picks = rng.integers(0, size, args.searches)
+        queries = stored[picks] + 0.02 * rng.standard_normal((args.searches, dimension)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        queries[1::2] = clustered_vectors(len(queries[1::2]), dimension, seed=args.seed + 2)
+
+        search_ms, hits = [], 0
+        with quiet():
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                result = memory.search("", embedding=query)
+                search_ms.append(elapsed_ms(start))
+                if i % 2 == 0 and result == f"benchmark response {picks[i]}":
+                    hits += 1
+
+            store_ms = []
+            for i, vector in enumerate(fresh):
+                start = time.perf_counter()
+                memory.store(f"fresh query {i}", f"fresh response {i}", embedding=vector)
+                store_ms.append(elapsed_ms(start))
+
+        search, store = percentiles(search_ms), percentiles(store_ms)
+        return {
+            "index_type": index_type,
+            "active_index": memory.index.active_type,
+            "entries": size,
+            "open_ms": round(open_ms, 1),
+            "search_p50": search["p50"],
+            "search_p95": search["p95"],
+            "search_p99": search["p99"],
+            "store_p50": store["p50"],
+            "store_p95": store["p95"],
+            "store_p99": store["p99"],
+            "near_dup_hit_rate": round(hits / max(1, len(queries[0::2])), 3)
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="SemanticMemory search/store latency")
+    parser.add_argument("--sizes", default="1k,10k,100k", help="comma-separated, e.g. 1k,10k,100k,1m")
+    parser.add_argument("--index-types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--searches", type=int, default=2000)
+    parser.add_argument("--stores", type=int, default=500)
+    parser.add_argument("--migrate-at", type=int, default=0,
+                        help="entries before leaving the flat index (0 = use the target type at every size)")
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="only used for its dimension")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    encoder = BatchingEncoder(model_name=args.model)
+    rows = []
+    for size in parse_sizes(args.sizes):
+        for index_type in args.index_types.split(","):
+            print(f"⏱️  {index_type} @ {size} entries...")
+            rows.append(run_case(index_type.strip(), size, args, encoder))
+
+    print()
+    print_table(rows, ["index_type", "active_index", "entries", "open_ms", "search_p50", "search_p95",
+                       "search_p99", "store_p50", "store_p95", "store_p99", "near_dup_hit_rate"])
+    write_results(args.json, "memory", vars(args), rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Cold-load time of the legacy JSON cache file vs. the binary disk store.
+
+    python -m bench.bench_persistence --sizes 1k,10k,100k
+
+The JSON side replays the original memory_cache.json format (queries,
+responses and embeddings as nested lists); the binary side is DiskStore's
+memory-mapped vectors.bin plus entries.jsonl, opened both raw and through
+SemanticMemory with a flat index.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import faiss
+import numpy as np
+from bench.common import (clustered_vectors, parse_sizes, print_table, quiet, synthetic_entries,
+                          write_results)
+from encoder import BatchingEncoder
+from memory import SemanticMemory
+from storage import DiskStore
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def best_of(repeats: int, fn) -> float:
+    """Fastest of several runs in ms; loads are dominated by cold-start noise otherwise"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return round(min(times), 1)
+
+def run_case(size: int, args, encoder: BatchingEncoder) -> dict:
+    vectors = clustered_vectors(size, encoder.dimension, seed=args.seed)
+    entries = synthetic_entries(size)
+    root = tempfile.mkdtemp(prefix="bench_persistence_")
+    try:
+        json_path = os.path.join(root, "memory_cache.json")
+        with open(json_path, "w") as f:
+            json.dump({
+                "queries": [e["q"] for e in entries],
+                "responses": [e["r"] for e in entries],
+                "embeddings": vectors.tolist()
+            }, f)
+
+        store_path = os.path.join(root, "store")
+        disk = DiskStore(store_path, encoder.dimension, encoder=encoder.fingerprint)
+        disk.append(vectors, entries)
+        disk.close()
+
+        def load_json():
+            with open(json_path) as f:
+                data = json.load(f)
+            index = faiss.IndexFlatIP(encoder.dimension)
+            index.add(np.array(data["embeddings"], dtype=np.float32))
+
+        def load_binary():
+            store = DiskStore(store_path, encoder.dimension, encoder=encoder.fingerprint)
+            loaded, _, _ = store.load()
+            index = faiss.IndexFlatIP(encoder.dimension)
+            index.add(np.ascontiguousarray(loaded, dtype=np.float32))
+            store.close()
+
+        def open_memory():
+            with quiet():
+                SemanticMemory(persist_dir=store_path, encoder=encoder).disk.close()
+
+        return {
+            "entries": size,
+            "json_mb": round(os.path.getsize(json_path) / 1e6, 1),
+            "binary_mb": round(_dir_bytes(store_path) / 1e6, 1),
+            "json_load_ms": best_of(args.repeats, load_json),
+            "binary_load_ms": best_of(args.repeats, load_binary),
+            "memory_open_ms": best_of(args.repeats, open_memory)
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON vs binary persistence load time")
+    parser.add_argument("--sizes", default="1k,10k,100k")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="only used for its dimension")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    encoder = BatchingEncoder(model_name=args.model)
+    rows = []
+    for size in parse_sizes(args.sizes):
+        print(f"⏱️  loading {size} entries...")
+        rows.append(run_case(size, args, encoder))
+
+    print()
+    print_table(rows, ["entries", "json_mb", "binary_mb", "json_load_ms", "binary_load_ms", "memory_open_ms"])
+    write_results(args.json, "persistence", vars(args), rows)
+
+if __name__ == "__main__":
+    main()
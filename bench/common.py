@@ -0,0 +1,77 @@
+import contextlib
+import json
+import logging
+import os
+import time
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+
+def percentiles(samples_ms: Iterable[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of latency samples in milliseconds"""
+    samples = np.asarray(list(samples_ms), dtype=np.float64)
+    if samples.size == 0:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "mean": round(float(samples.mean()), 3),
+        "max": round(float(samples.max()), 3)
+    }
+
+def elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000.0
+
+@contextlib.contextmanager
+def quiet():
+    """Mute per-request INFO/DEBUG logging so it does not skew timings"""
+    previous = logging.root.manager.disable
+    logging.disable(logging.INFO)
+    try:
+        yield
+    finally:
+        logging.disable(previous)
+
+def clustered_vectors(n: int, dimension: int, clusters: int = 256, noise: float = 0.35,
+                      seed: int = 0) -> np.ndarray:
+    """Normalized vectors grouped around random centres, closer to real query
+    embeddings than uniform noise (which makes every IVF list equally full)"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = np.empty((n, dimension), dtype=np.float32)
+    for start in range(0, n, 65536):
+        stop = min(n, start + 65536)
+        picks = rng.integers(0, clusters, stop - start)
+        block = centres[picks] + noise * rng.standard_normal((stop - start, dimension)).astype(np.float32)
+        vectors[start:stop] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+def synthetic_entries(n: int, created: Optional[float] = None) -> List[dict]:
+    """Disk-store sidecar rows with short, distinct query/response text"""
+    created = created if created is not None else time.time()
+    return [{"q": f"benchmark query {i}", "r": f"benchmark response {i}", "t": created} for i in range(n)]
+
+def parse_sizes(value: str) -> List[int]:
+    """'1k,10k,1m' -> [1000, 10000, 1000000]"""
+    sizes = []
+    for part in value.split(","):
+        part = part.strip().lower()
+        scale = {"k": 1000, "m": 1000000}.get(part[-1:], 1)
+        sizes.append(int(float(part.rstrip("km")) * scale))
+    return sizes
+
+def print_table(rows: List[dict], columns: List[str]) -> None:
+    widths = [max(len(c), *(len(str(r.get(c, ""))) for r in rows)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(w) for c, w in zip(columns, widths)))
+
+def write_results(path: Optional[str], name: str, config: dict, rows: List[dict]) -> None:
+    """Save results as JSON so runs can be diffed across changes"""
+    if not path:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"benchmark": name, "timestamp": time.time(), "config": config, "results": rows}, f, indent=2)
+    print(f"📝 Results written to {path}")
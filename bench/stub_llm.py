@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Together chat completions API.
+
+Replays configurable latencies and failures per model so benchmarks run
+offline and repeatably:
+
+    python -m bench.stub_llm --port 8765 --scenario flaky
+    TOGETHER_API_BASE=http://127.0.0.1:8765/v1 python app.py
+
+A scenario maps each model (or "default") to a latency profile and a
+weighted mix of outcomes: "200", "400" (model_not_available), "404", "422",
+"429" (with a ``retry_after`` seconds header), "500" and "timeout" (hold the
+connection for ``hang_seconds``).
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+SCENARIOS = {
+    # Everything answers, at roughly hosted-model latency
+    "healthy": {
+        "default": {"latency_ms": 400, "jitter_ms": 150, "outcomes": {"200": 1.0}}
+    },
+    # What the live fleet looked like: the first model is gone, the rest mostly work
+    "flaky": {
+        "default": {"latency_ms": 600, "jitter_ms": 300, "outcomes": {"200": 0.9, "500": 0.05, "timeout": 0.05}},
+        "models": {
+            "mistralai/Mistral-7B-Instruct-v0.1": {"latency_ms": 80, "outcomes": {"400": 1.0}},
+            "arcee-ai/coder-large": {"outcomes": {"404": 1.0}},
+            "WhereIsAI/UAE-Large-V1": {"outcomes": {"422": 1.0}}
+        }
+    },
+    # Nothing works; exercises circuit breakers and the smart fallback
+    "outage": {
+        "default": {"latency_ms": 200, "jitter_ms": 50, "outcomes": {"500": 0.5, "timeout": 0.5}}
+    },
+    # The provider sheds load: exercises the scheduler's backoff and model switching
+    "throttled": {
+        "default": {"latency_ms": 300, "jitter_ms": 100, "outcomes": {"200": 0.7, "429": 0.25, "500": 0.05}}
+    },
+    # No upstream latency at all, for measuring our own overhead
+    "instant": {
+        "default": {"latency_ms": 0, "jitter_ms": 0, "outcomes": {"200": 1.0}}
+    }
+}
+
+DEFAULT_PROFILE = {
+    "latency_ms": 400,
+    "jitter_ms": 0,
+    "outcomes": {"200": 1.0},
+    "response_tokens": 60,
+    "token_interval_ms": 10,
+    "hang_seconds": 60,
+    "retry_after": 1
+}
+
+class StubBehaviour:
+    """Seeded outcome/latency picker shared by all handler threads"""
+
+    def __init__(self, scenario: dict, seed: int = 0):
+        self.default = {**DEFAULT_PROFILE, **scenario.get("default", {})}
+        self.models = {name: {**self.default, **profile} for name, profile in scenario.get("models", {}).items()}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def profile(self, model: str) -> dict:
+        return self.models.get(model, self.default)
+
+    def pick(self, model: str):
+        """(outcome, latency seconds, profile) for one request to ``model``"""
+        profile = self.profile(model)
+        outcomes = list(profile["outcomes"].items())
+        with self._lock:
+            outcome = self._rng.choices([o for o, _ in outcomes], weights=[w for _, w in outcomes])[0]
+            latency = max(0.0, profile["latency_ms"] + self._rng.uniform(-1, 1) * profile["jitter_ms"])
+            self.counts[f"{model}|{outcome}"] += 1
+        return outcome, latency / 1000.0, profile
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+def _answer(model: str, prompt: str, tokens: int) -> list:
+    """Deterministic answer for a prompt, as a list of stream chunks"""
+    words = [f"Stub answer from {model.split('/')[-1]} to: {prompt[:80]}"]
+    words += [f" word{i}" for i in range(max(0, tokens - 1))]
+    return words
+
+class StubHandler(BaseHTTPRequestHandler):
+    behaviour: StubBehaviour = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            models = sorted(set(self.behaviour.models) | {"stub/default"})
+            self._json(200, {"data": [{"id": m} for m in models]})
+        elif self.path.rstrip("/").endswith("/stub/stats"):
+            self._json(200, self.behaviour.get_stats())
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def handle_one_request(self):
+        # Hedged and timed-out clients hang up mid-response; that is expected here
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+
+        model = body.get("model", "")
+        outcome, latency, profile = self.behaviour.pick(model)
+        time.sleep(latency)
+
+        if outcome == "timeout":
+            time.sleep(profile["hang_seconds"])
+            self.close_connection = True
+            return
+        if outcome == "400":
+            self._json(400, {"error": {"code": "model_not_available", "message": f"{model} is not available"}})
+            return
+        if outcome == "429":
+            self._json(429, {"error": {"message": "rate limit exceeded"}},
+                       headers={"Retry-After": str(profile["retry_after"])})
+            return
+        if outcome != "200":
+            self._json(int(outcome), {"error": {"message": f"stub error {outcome}"}})
+            return
+
+        prompt = (body.get("messages") or [{}])[-1].get("content", "")
+        chunks = _answer(model, prompt, profile["response_tokens"])
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(chunks)}
+        if body.get("stream"):
+            self._stream(chunks, profile["token_interval_ms"] / 1000.0, usage)
+        else:
+            self._json(200, {
+                "model": model,
+                "choices": [{"message": {"role": "assistant", "content": "".join(chunks)}}],
+                "usage": usage
+            })
+
+    def _json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, chunks: list, interval: float, usage: dict) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for chunk in chunks:
+            event = {"choices": [{"delta": {"content": chunk}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(interval)
+        # Like the hosted API, the last chunk carries the token usage
+        self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def load_scenario(name: Optional[str] = None, config: Optional[str] = None) -> dict:
+    if config:
+        with open(config) as f:
+            return json.load(f)
+    if name not in SCENARIOS:
+        raise ValueError(f"Unknown scenario '{name}', expected one of {sorted(SCENARIOS)} or --config")
+    return SCENARIOS[name]
+
+def start_stub(port: int = 8765, scenario: Optional[dict] = None, seed: int = 0) -> ThreadingHTTPServer:
+    """Serve the stub from a daemon thread; returns the server (call shutdown() to stop)"""
+    handler = type("BoundStubHandler", (StubHandler,), {"behaviour": StubBehaviour(scenario or SCENARIOS["healthy"], seed)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline stub of the chat completions API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenario", default="healthy", help=f"one of {sorted(SCENARIOS)}")
+    parser.add_argument("--config", help="JSON scenario file, overrides --scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_stub(args.port, load_scenario(args.scenario, args.config), args.seed)
+    print(f"🧪 Stub LLM serving '{args.config or args.scenario}' on http://127.0.0.1:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
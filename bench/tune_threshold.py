@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Offline similarity-threshold tuner: hit rate vs. false-hit rate from logged queries.
+
+    python -m bench.tune_threshold --memory-dir memory_store
+    python -m bench.tune_threshold --queries queries.jsonl --namespace planning --plot curve.png
+
+Each logged query is replayed against the persisted cache: its nearest cached
+entry (other than itself) gives the similarity it would be served at. Feedback
+from ``feedback.jsonl`` (thumbs up/down and re-asks, see feedback.py) labels
+(query, cached query) pairs. For every candidate threshold this reports the
+share of queries that would hit and the share of those hits known to be wrong,
+and recommends the lowest threshold under ``--target``.
+
+Queries default to the request log (``--log``, see request_log.py): every
+served query, hit or miss, so the curve reflects real traffic. The feedback
+log only holds queries that were served from the cache, which would bias the
+hit rate upwards. ``--queries`` takes JSONL with a "query" (and optional
+"namespace") field, or plain text with one query per line, instead.
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from bench.common import print_table, write_results
+from encoder import BatchingEncoder
+from feedback import FEEDBACK_LOG
+from memory import SemanticMemory
+from namespaces import DEFAULT_NAMESPACE, NamespacedMemory
+from request_log import read_log
+
+def read_queries(path: str, default_namespace: str) -> List[Tuple[str, str]]:
+    """(namespace, query) pairs from JSONL or plain text"""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                if record.get("query"):
+                    queries.append((record.get("namespace") or default_namespace, record["query"]))
+            else:
+                queries.append((default_namespace, line))
+    return queries
+
+def logged_queries(path: str, default_namespace: str) -> List[Tuple[str, str]]:
+    """(namespace, query) of every request in the log; agent requests are keyed by their agent"""
+    return [
+        (record.get("agent") or record.get("namespace") or default_namespace, record["query"])
+        for record in read_log(path) if record.get("query")
+    ]
+
+def read_labels(path: str) -> Dict[Tuple[str, str, str], bool]:
+    """(namespace, query, cached query) -> helpful, the latest signal winning"""
+    labels = {}
+    if not os.path.exists(path):
+        return labels
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                event = json.loads(line)
+                labels[(event["namespace"], event["query"], event["cached_query"])] = bool(event["helpful"])
+    return labels
+
+def nearest(memory: SemanticMemory, queries: List[str], k: int = 8) -> List[Tuple[float, Optional[str]]]:
+    """(similarity, cached query) of each query's nearest live entry that is not the query itself"""
+    if memory.entry_stats.live_count == 0:
+        return [(-1.0, None)] * len(queries)
+    embeddings = memory.encode_many(queries)
+    scores, indices = memory.index.search(embeddings, min(k, memory.index.ntotal))
+    results = []
+    for query, row_scores, row_indices in zip(queries, scores, indices):
+        match = (-1.0, None)
+        for score, idx in zip(row_scores, row_indices):
+            # A logged miss was stored afterwards and would trivially match itself
+            if idx >= 0 and memory.entry_stats.alive[idx] and memory.queries[idx] != query:
+                match = (float(score), memory.queries[idx])
+                break
+        results.append(match)
+    return results
+
+def sweep(matches: List[Tuple[float, Optional[str]]], labels: List[Optional[bool]],
+          thresholds: np.ndarray) -> List[dict]:
+    scores = np.array([score for score, _ in matches], dtype=np.float64)
+    bad = np.array([label is False for label in labels])
+    labelled = np.array([label is not None for label in labels])
+    rows = []
+    for threshold in thresholds:
+        hits = scores >= threshold
+        n_hits = int(hits.sum())
+        rows.append({
+            "threshold": round(float(threshold), 3),
+            "hit_rate": round(n_hits / len(scores), 4) if len(scores) else 0.0,
+            "false_hit_rate": round(int((hits & bad).sum()) / n_hits, 4) if n_hits else 0.0,
+            "hits": n_hits,
+            "labelled_hits": int((hits & labelled).sum())
+        })
+    return rows
+
+def plot(path: str, curves: Dict[str, List[dict]], target: float) -> None:
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️ matplotlib is not installed, skipping --plot")
+        return
+    fig, (left, right) = plt.subplots(1, 2, figsize=(11, 4))
+    for namespace, rows in curves.items():
+        thresholds = [r["threshold"] for r in rows]
+        left.plot(thresholds, [r["hit_rate"] for r in rows], label=f"{namespace} hit rate")
+        left.plot(thresholds, [r["false_hit_rate"] for r in rows], linestyle="--", label=f"{namespace} false-hit rate")
+        right.plot([r["false_hit_rate"] for r in rows], [r["hit_rate"] for r in rows], marker=".", label=namespace)
+    left.axhline(target, color="grey", linewidth=0.8)
+    left.set_xlabel("similarity threshold")
+    left.legend(fontsize="small")
+    right.axvline(target, color="grey", linewidth=0.8)
+    right.set_xlabel("false-hit rate")
+    right.set_ylabel("hit rate")
+    right.legend(fontsize="small")
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f"📈 Plot written to {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the similarity threshold from logged queries and feedback")
+    parser.add_argument("--memory-dir", default=os.getenv("MEMORY_DIR", "memory_store"))
+    parser.add_argument("--log", default=os.getenv("REQUEST_LOG_DIR", "logs"),
+                        help="request log directory or file to take queries from")
+    parser.add_argument("--queries", help="JSONL or text file of queries, instead of the request log")
+    parser.add_argument("--feedback", help=f"feedback log; default: MEMORY_DIR/{FEEDBACK_LOG}")
+    parser.add_argument("--namespace", help="only this namespace (also the default for unlabelled queries)")
+    parser.add_argument("--target", type=float, default=0.05, help="acceptable false-hit rate")
+    parser.add_argument("--min", type=float, default=0.5)
+    parser.add_argument("--max", type=float, default=0.95)
+    parser.add_argument("--step", type=float, default=0.01)
+    parser.add_argument("--plot", help="write a PNG of the curves (needs matplotlib)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    feedback_path = args.feedback or os.path.join(args.memory_dir, FEEDBACK_LOG)
+    source = args.queries or args.log
+    if args.queries:
+        queries = read_queries(args.queries, args.namespace or DEFAULT_NAMESPACE)
+    elif os.path.exists(args.log):
+        queries = logged_queries(args.log, args.namespace or DEFAULT_NAMESPACE)
+    else:
+        queries = []
+    if args.namespace:
+        queries = [(ns, q) for ns, q in queries if ns == args.namespace]
+    if not queries:
+        parser.error(f"no queries found in {source}")
+    labels = read_labels(feedback_path)
+
+    encoder = BatchingEncoder(
+        model_name=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+        backend=os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+    )
+    memories = NamespacedMemory(encoder, persist_dir=args.memory_dir,
+                                defaults={"storage_backend": os.getenv("MEMORY_BACKEND", "disk")})
+    by_namespace = defaultdict(list)
+    for namespace, query in queries:
+        by_namespace[namespace].append(query)
+
+    thresholds = np.arange(args.min, args.max + args.step / 2, args.step)
+    curves, summary = {}, []
+    for namespace, texts in sorted(by_namespace.items()):
+        if namespace not in memories:
+            print(f"⚠️ No cache for namespace '{namespace}', skipping {len(texts)} queries")
+            continue
+        memory = memories.partition(namespace)
+        matches = nearest(memory, texts)
+        pair_labels = [labels.get((namespace, q, cached)) for q, (_, cached) in zip(texts, matches)]
+        rows = sweep(matches, pair_labels, thresholds)
+        curves[namespace] = rows
+
+        print(f"\n📊 {namespace}: {len(texts)} queries, {sum(l is not None for l in pair_labels)} labelled, "
+              f"current threshold {memory.similarity_threshold}")
+        print_table(rows, ["threshold", "hit_rate", "false_hit_rate", "hits", "labelled_hits"])
+        ok = [r for r in rows if r["false_hit_rate"] <= args.target]
+        best = ok[0] if ok else None
+        summary.append({
+            "namespace": namespace,
+            "recommended": best["threshold"] if best else None,
+            "hit_rate": best["hit_rate"] if best else None,
+            "false_hit_rate": best["false_hit_rate"] if best else None
+        })
+
+    print(f"\n🎯 Lowest threshold with false-hit rate <= {args.target}:")
+    print_table(summary, ["namespace", "recommended", "hit_rate", "false_hit_rate"])
+    if args.plot:
+        plot(args.plot, curves, args.target)
+    write_results(args.json, "tune_threshold", {**vars(args), "queries": len(queries)},
+                  [{**row, "curve": curves[row["namespace"]]} for row in summary])
+
+if __name__ == "__main__":
+    main()
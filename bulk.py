@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Bulk operations on a persisted cache: import a corpus, export it, re-embed it.
+
+    python bulk.py import faq.jsonl --namespace support --skip-existing
+    python bulk.py import memory_cache.json
+    python bulk.py export backup.jsonl.gz --with-vectors
+    python bulk.py reembed --model all-mpnet-base-v2 --workers 8
+
+Imports stream the input in ``--chunk-size`` records, so memory stays bounded
+however large the file. Each chunk is stored per namespace with one encode
+pass, one store append and one index add. Inputs are JSONL (optionally
+gzipped), Parquet (needs ``pip install pyarrow``), or the legacy
+memory_cache.json, whose agent-prefixed queries go to the agents' namespaces
+and whose cached errors and fallbacks are left out. Records look like export's output, {"query", "response"}
+(or the store's "q"/"r"), optionally with "namespace" and an "embedding"
+from the same "encoder", which is reused instead of encoding again.
+
+``reembed`` encodes every stored query with a new model in ``--workers``
+processes and rewrites each namespace's store. Stop the app first, then
+start it with the new EMBEDDING_MODEL; a node still on the old encoder
+cannot read the rewritten store.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+from agent import AGENT_CLASSES
+from encoder import BatchingEncoder
+from llm import is_fallback_text
+from log import configure_logging
+from namespaces import DEFAULT_NAMESPACE, NamespacedMemory, persist_path, persisted_namespaces
+from storage import StoreRewritten, open_store, read_store_meta
+
+logger = logging.getLogger(__name__)
+
+# What the old agent and LLM code returned (and cached) on failure
+_LEGACY_ERROR = re.compile(r"^(Error\b|Model unavailable\b|Unknown agent:)")
+
+def read_records(path: str, chunk_size: int = 10000) -> Iterator[List[dict]]:
+    """Records of a JSONL, JSONL.gz, Parquet or legacy memory_cache.json file, ``chunk_size`` at a time"""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+    if path.endswith(".json"):
+        # memory_cache.json: {"queries": [...], "responses": [...]}, small by nature
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        records = legacy_records(data.get("queries", []), data.get("responses", []))
+        for start in range(0, len(records), chunk_size):
+            yield records[start:start + chunk_size]
+        return
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        chunk = []
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                chunk.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Skipping malformed line in %s", path)
+                continue
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def legacy_records(queries: List[str], responses: List[str]) -> List[dict]:
+    """Records from the old single-cache format, cleaned up for namespaced memory.
+
+    The old cache keyed agent answers by "<agent prefix> <query>" and also
+    stored error and fallback text. Prefixed queries go to their agent's
+    namespace without the prefix; errors and fallbacks are dropped.
+    """
+    prefixes = {cls.prompt_prefix: name for name, cls in AGENT_CLASSES.items()}
+    records, dropped = [], 0
+    for query, response in zip(queries, responses):
+        if not isinstance(query, str) or not isinstance(response, str):
+            continue
+        if _LEGACY_ERROR.match(response) or is_fallback_text(query, response):
+            dropped += 1
+            continue
+        record = {"query": query, "response": response}
+        for prefix, name in prefixes.items():
+            if query.startswith(prefix):
+                record.update(query=query[len(prefix):].strip(), namespace=name)
+                break
+        records.append(record)
+    if dropped:
+        logger.warning("Skipping %d error or fallback responses from the legacy cache", dropped)
+    return records
+
+def import_records(memories: NamespacedMemory, chunks: Iterator[List[dict]], namespace: str = DEFAULT_NAMESPACE,
+                   ttl_seconds: Optional[float] = None, skip_existing: bool = False) -> Dict[str, int]:
+    """Store every record through store_many(), one call per namespace per chunk; returns counts by outcome"""
+    outcome = Counter()
+    start = time.perf_counter()
+    for chunk in chunks:
+        by_namespace: Dict[str, List[dict]] = {}
+        for record in chunk:
+            query = record.get("query", record.get("q"))
+            response = record.get("response", record.get("r"))
+            if not isinstance(query, str) or not isinstance(response, str) or not query.strip():
+                outcome["invalid"] += 1
+                continue
+            by_namespace.setdefault(record.get("namespace") or namespace, []).append(record)
+
+        for target, records in by_namespace.items():
+            try:
+                memory = memories.partition(target)
+            except ValueError as e:
+                logger.warning("Skipping %d records: %s", len(records), e)
+                outcome["invalid"] += len(records)
+                continue
+            queries = [r.get("query", r.get("q")) for r in records]
+            responses = [r.get("response", r.get("r")) for r in records]
+            # Exported vectors are reused when they come from the same encoder
+            embeddings = None
+            if all(r.get("embedding") is not None and r.get("encoder") == memory.encoder.fingerprint for r in records):
+                embeddings = np.asarray([r["embedding"] for r in records], dtype=np.float32)
+            stored = memory.store_many(queries, responses, embeddings=embeddings, ttl_seconds=ttl_seconds,
+                                       skip_existing=skip_existing)
+            outcome["stored"] += stored
+            outcome["skipped"] += len(records) - stored
+        logger.info("📥 %d records so far in %.1fs: %s", sum(outcome.values()), time.perf_counter() - start, dict(outcome))
+    return dict(outcome)
+
+def export_records(memories: NamespacedMemory, path: str, with_vectors: bool = False) -> int:
+    """Write every namespace's live entries as JSONL (gzipped for a .gz path); returns the count"""
+    opener = gzip.open if path.endswith(".gz") else open
+    count = 0
+    with opener(path, "wt", encoding="utf-8") as f:
+        for name in memories.namespaces:
+            memory = memories.partition(name)
+            for entry in memory.export_entries(with_vectors=with_vectors):
+                entry["namespace"] = name
+                if with_vectors:
+                    entry["encoder"] = memory.encoder.fingerprint
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                count += 1
+            logger.info("📤 Exported namespace '%s'", name)
+    return count
+
+_worker_encoder: Optional[BatchingEncoder] = None
+
+def _init_worker(model_name: str, backend: str, onnx_file: Optional[str]) -> None:
+    global _worker_encoder
+    # One intra-op thread per process; the pool supplies the parallelism
+    _worker_encoder = BatchingEncoder(model_name=model_name, backend=backend, threads=1, cache_size=0,
+                                      onnx_file=onnx_file)
+
+def _encode_chunk(texts: List[str]) -> np.ndarray:
+    return _worker_encoder.encode_many(texts)
+
+def encode_parallel(texts: List[str], model_name: str, backend: str = "sentence-transformers",
+                    workers: Optional[int] = None, chunk_size: int = 256,
+                    onnx_file: Optional[str] = None) -> np.ndarray:
+    """Encode ``texts`` in order across ``workers`` processes (default: one per CPU core)"""
+    workers = workers or os.cpu_count() or 1
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    if not chunks:
+        return np.empty((0, BatchingEncoder(model_name=model_name, backend=backend).dimension), dtype=np.float32)
+    if workers == 1 or len(chunks) == 1:
+        _init_worker(model_name, backend, onnx_file)
+        return np.vstack([_encode_chunk(chunk) for chunk in chunks])
+    # Spawned, not forked: the model libraries do not survive a fork with threads running
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(model_name, backend, onnx_file)) as pool:
+        return np.vstack(list(pool.map(_encode_chunk, chunks)))
+
+def reembed_store(location: str, namespace: str, backend: str, model_name: str, embedding_backend: str,
+                  workers: Optional[int] = None, onnx_file: Optional[str] = None) -> int:
+    """Re-encode one namespace's live entries with ``model_name`` and rewrite its store; returns the count.
+
+    Encoding runs without the store lock; rows written meanwhile are picked up
+    (and encoded) under the lock just before the rewrite.
+    """
+    meta = read_store_meta(backend, location, namespace)
+    if meta is None:
+        return 0
+    fingerprint = BatchingEncoder(model_name=model_name, backend=embedding_backend).fingerprint
+    for _ in range(3):
+        disk = open_store(backend, location, meta["dimension"], meta.get("dtype", "float32"),
+                          encoder=meta.get("encoder"), namespace=namespace)
+        _, entries, deleted = disk.load()
+        start = time.perf_counter()
+        vectors = encode_parallel([entry["q"] for entry in entries], model_name, embedding_backend, workers,
+                                  onnx_file=onnx_file)
+        with disk.locked():
+            try:
+                _, new_entries, new_deleted = disk.changes()
+            except StoreRewritten:
+                # Compacted or cleared meanwhile; start over
+                disk.close()
+                continue
+            if new_entries:
+                vectors = np.vstack([vectors, encode_parallel([entry["q"] for entry in new_entries], model_name,
+                                                              embedding_backend, workers, onnx_file=onnx_file)])
+            entries += new_entries
+            deleted |= set(new_deleted)
+            keep = [i for i in range(len(entries)) if i not in deleted]
+            disk.rewrite(vectors[keep], [entries[i] for i in keep], dimension=vectors.shape[1], encoder=fingerprint)
+        disk.close()
+        logger.info("🔁 Re-embedded %d entries of '%s' with %s in %.1fs",
+                    len(keep), namespace, fingerprint, time.perf_counter() - start)
+        return len(keep)
+    raise RuntimeError(f"Store for '{namespace}' kept being rewritten during re-embedding")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import, export and re-embedding for the semantic cache")
+    parser.add_argument("--memory-dir", default=os.getenv("MEMORY_DIR", "memory_store"))
+    parser.add_argument("--backend", default=os.getenv("MEMORY_BACKEND", "disk"), help="storage backend")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="load records from JSONL, Parquet or memory_cache.json")
+    importer.add_argument("path")
+    importer.add_argument("--namespace", default=DEFAULT_NAMESPACE, help="for records without one")
+    importer.add_argument("--chunk-size", type=int, default=10000, help="records held in memory at once")
+    importer.add_argument("--ttl-seconds", type=float)
+    importer.add_argument("--skip-existing", action="store_true", help="skip queries already cached")
+
+    exporter = commands.add_parser("export", help="write live entries as JSONL (.gz to compress)")
+    exporter.add_argument("path")
+    exporter.add_argument("--with-vectors", action="store_true", help="include embeddings for a faster re-import")
+
+    reembed = commands.add_parser("reembed", help="re-encode every stored query with a new model")
+    reembed.add_argument("--model", required=True, help="new embedding model")
+    reembed.add_argument("--embedding-backend", default=os.getenv("EMBEDDING_BACKEND", "sentence-transformers"))
+    reembed.add_argument("--onnx-file", default=os.getenv("EMBEDDING_ONNX_FILE"))
+    reembed.add_argument("--workers", type=int, help="encoder processes (default: one per CPU core)")
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.command == "reembed":
+        namespaces = [DEFAULT_NAMESPACE, *persisted_namespaces(args.memory_dir, args.backend)]
+        total = 0
+        for name in dict.fromkeys(namespaces):
+            total += reembed_store(persist_path(args.memory_dir, name, args.backend), name, args.backend,
+                                   args.model, args.embedding_backend, args.workers, args.onnx_file)
+        print(f"✅ Re-embedded {total} entries with {args.model}")
+        return
+
+    encoder = BatchingEncoder(
+        model_name=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+        backend=os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+    )
+    memories = NamespacedMemory(encoder, persist_dir=args.memory_dir,
+                                defaults={"storage_backend": args.backend})
+    if args.command == "import":
+        outcome = import_records(memories, read_records(args.path, args.chunk_size), args.namespace,
+                                 args.ttl_seconds, args.skip_existing)
+        print(f"✅ {outcome}")
+    else:
+        count = export_records(memories, args.path, args.with_vectors)
+        print(f"✅ Exported {count} entries to {args.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import re
+import zlib
+from typing import List, Optional
+
+# Sentence ends followed by whitespace; abbreviations may split early, which only costs a boundary
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# A chunk past min_chars ends after one in this many paragraphs, picked by content
+BOUNDARY_EVERY = 2
+
+def split_document(text: str, max_chars: int = 1000, min_chars: Optional[int] = None) -> List[str]:
+    """Split a long input into chunks of at most ``max_chars`` on paragraph and sentence breaks.
+
+    Short paragraphs are packed together, since every chunk is an LLM call.
+    Once a chunk holds ``min_chars`` (default half of ``max_chars``) it ends
+    after the next paragraph whose content hash marks a boundary, or earlier if
+    the next paragraph would not fit. Boundaries therefore follow the text, not
+    running offsets: an edit changes the chunks around it, and chunking is back
+    in step with the old one at the next boundary paragraph after it.
+    Paragraphs longer than ``max_chars`` are split into sentences, and
+    sentences longer than that at whitespace.
+    """
+    min_chars = max_chars // 2 if min_chars is None else min_chars
+    # (text, separator from the previous piece)
+    pieces = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append((paragraph, "\n\n"))
+            continue
+        sep = "\n\n"
+        for sentence in _SENTENCE_END.split(paragraph):
+            for part in _split_words(sentence, max_chars):
+                pieces.append((part, sep))
+                sep = " "
+
+    chunks, current = [], ""
+    for piece, sep in pieces:
+        if current and len(current) + len(sep) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}{sep}{piece}" if current else piece
+        if len(current) >= min_chars and _is_boundary(piece):
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _is_boundary(piece: str) -> bool:
+    """Whether a chunk may end after ``piece``: true for about one piece in BOUNDARY_EVERY"""
+    return zlib.crc32(piece.encode("utf-8")) % BOUNDARY_EVERY == 0
+
+def _split_words(text: str, max_chars: int) -> List[str]:
+    parts, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            parts.append(current)
+            current = ""
+        current = f"{current} {word}" if current else word
+    if current:
+        parts.append(current)
+    return parts
@@ -0,0 +1,79 @@
+import threading
+import numpy as np
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+class _Call:
+    """One in-flight generation that later arrivals can wait on"""
+
+    def __init__(self, key: str, embedding: Optional[np.ndarray]):
+        self.key = key
+        self.embedding = embedding
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesce concurrent cache misses for the same or an equivalent query.
+
+    The first caller for a query runs the work; anyone arriving while it is in
+    flight with the same key, or with an embedding whose inner product with the
+    pending one is at least ``similarity_threshold``, waits for that result
+    instead of starting a generation of their own. A callable threshold is
+    read on every match, so one that adapts at runtime applies at once.
+    """
+
+    def __init__(self, similarity_threshold: Union[float, Callable[[], float]] = 0.7):
+        self.similarity_threshold = similarity_threshold
+        self._pending: List[_Call] = []
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: str, embedding: Optional[np.ndarray], fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run ``fn`` or join a matching in-flight call; returns (result, shared)"""
+        with self._lock:
+            call = self._find(key, embedding)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call(key, embedding)
+                self._pending.append(call)
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._pending.remove(call)
+            call.done.set()
+        return call.result, False
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"inflight_generations": len(self._pending), "coalesced_requests": self.coalesced}
+
+    def _find(self, key: str, embedding: Optional[np.ndarray]) -> Optional[_Call]:
+        for call in self._pending:
+            if call.key == key:
+                return call
+        if embedding is None:
+            return None
+
+        candidates = [call for call in self._pending if call.embedding is not None]
+        if not candidates:
+            return None
+        scores = np.vstack([call.embedding for call in candidates]) @ embedding
+        best = int(np.argmax(scores))
+        threshold = self.similarity_threshold
+        if scores[best] >= (threshold() if callable(threshold) else threshold):
+            return candidates[best]
+        return None
@@ -0,0 +1,70 @@
+"""Encoder and cache settings from the environment, shared by app.py and the CLI tools"""
+
+import json
+import os
+from typing import Optional
+from embedding_backends import DEFAULT_MODEL, known_dimension
+from encoder import BatchingEncoder
+from namespaces import NamespacedMemory
+from rerank import get_reranker
+
+def encoder_from_env() -> BatchingEncoder:
+    """The embedding model is loaded lazily; see BatchingEncoder.warm_up()"""
+    model_name = os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+    dimension = int(os.environ["EMBEDDING_DIM"]) if os.getenv("EMBEDDING_DIM") else known_dimension(model_name)
+    if dimension is None:
+        # Reading it from the model would load the model while the memories are built, before any warm-up
+        raise ValueError(f"Unknown embedding dimension for {model_name}; set EMBEDDING_DIM")
+    return BatchingEncoder(
+        max_batch_size=int(os.getenv("EMBED_MAX_BATCH", "32")),
+        max_wait_ms=float(os.getenv("EMBED_MAX_WAIT_MS", "5")),
+        cache_size=int(os.getenv("EMBED_CACHE_SIZE", "4096")),
+        model_name=model_name,
+        backend=os.getenv("EMBEDDING_BACKEND", "sentence-transformers"),
+        threads=int(os.environ["EMBEDDING_THREADS"]) if os.getenv("EMBEDDING_THREADS") else None,
+        onnx_file=os.getenv("EMBEDDING_ONNX_FILE"),
+        dimension=dimension
+    )
+
+def memory_defaults_from_env() -> dict:
+    """SemanticMemory keyword arguments for every namespace, from the MEMORY_* variables"""
+    return dict(
+        similarity_threshold=float(os.getenv("MEMORY_SIMILARITY_THRESHOLD", "0.7")),
+        index_type=os.getenv("MEMORY_INDEX_TYPE", "flat"),
+        migrate_at=int(os.getenv("MEMORY_INDEX_MIGRATE_AT", "10000")),
+        nprobe=int(os.getenv("MEMORY_INDEX_NPROBE", "16")),
+        ef_search=int(os.getenv("MEMORY_INDEX_EF_SEARCH", "64")),
+        max_entries=int(os.environ["MEMORY_MAX_ENTRIES"]) if os.getenv("MEMORY_MAX_ENTRIES") else None,
+        max_bytes=int(os.environ["MEMORY_MAX_BYTES"]) if os.getenv("MEMORY_MAX_BYTES") else None,
+        ttl_seconds=float(os.environ["MEMORY_TTL_SECONDS"]) if os.getenv("MEMORY_TTL_SECONDS") else None,
+        eviction_policy=os.getenv("MEMORY_EVICTION_POLICY", "lru"),
+        reembed_on_mismatch=os.getenv("MEMORY_REEMBED_ON_MISMATCH") == "1",
+        top_k=int(os.getenv("MEMORY_TOP_K", "1")),
+        reranker=get_reranker(os.getenv("MEMORY_RERANK", "none"), os.getenv("MEMORY_RERANK_MODEL")),
+        rerank_weight=float(os.getenv("MEMORY_RERANK_WEIGHT", "0.3")),
+        rerank_budget_ms=float(os.getenv("MEMORY_RERANK_BUDGET_MS", "20")),
+        min_margin=float(os.getenv("MEMORY_MIN_MARGIN", "0")),
+        response_compression=os.getenv("MEMORY_RESPONSE_COMPRESSION", "none"),
+        compress_min_bytes=int(os.getenv("MEMORY_COMPRESS_MIN_BYTES", "1024")),
+        storage_backend=os.getenv("MEMORY_BACKEND", "disk"),
+        exact_match=os.getenv("MEMORY_EXACT_MATCH", "1") == "1",
+        sync_interval=float(os.getenv("MEMORY_SYNC_INTERVAL", "1.0")),
+        write_behind=os.getenv("MEMORY_WRITE_BEHIND") == "1",
+        write_batch=int(os.getenv("MEMORY_WRITE_BATCH", "64")),
+        write_max_wait_ms=float(os.getenv("MEMORY_WRITE_MAX_WAIT_MS", "50")),
+        snapshot_interval=float(os.environ["MEMORY_SNAPSHOT_INTERVAL"]) if os.getenv("MEMORY_SNAPSHOT_INTERVAL") else None
+    )
+
+def memories_from_env(encoder: BatchingEncoder, persist_dir: Optional[str] = None) -> NamespacedMemory:
+    """One cache partition per namespace (e.g. per agent), all sharing the encoder.
+
+    ``persist_dir`` defaults to MEMORY_DIR. MEMORY_NAMESPACES is JSON of
+    per-namespace overrides, for example
+    {"planning": {"similarity_threshold": 0.8, "max_entries": 5000}}
+    """
+    return NamespacedMemory(
+        encoder=encoder,
+        persist_dir=persist_dir or os.getenv("MEMORY_DIR", "memory_store"),
+        defaults=memory_defaults_from_env(),
+        overrides=json.loads(os.getenv("MEMORY_NAMESPACES", "{}"))
+    )
@@ -0,0 +1,28 @@
+import hashlib
+import numpy as np
+import pytest
+from encoder import BatchingEncoder
+
+# test_api.py is a manual connectivity check against the live API
+collect_ignore = ["test_api.py"]
+
+class HashingModel:
+    """Bag-of-words embeddings: texts sharing most words are near-duplicates"""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in str(text).lower().split():
+                vectors[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1.0
+            vectors[i, 0] += 0.01
+        return vectors
+
+@pytest.fixture
+def encoder() -> BatchingEncoder:
+    return BatchingEncoder(model=HashingModel(), model_name="all-MiniLM-L6-v2")
@@ -0,0 +1,103 @@
+import os
+import numpy as np
+from typing import List, Optional
+
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+BACKENDS = ("sentence-transformers", "int8", "onnx")
+
+# Output sizes of common sentence-transformers models, so a memory can size its
+# index and open its store without loading the model first
+KNOWN_DIMENSIONS = {
+    "all-MiniLM-L6-v2": 384,
+    "all-MiniLM-L12-v2": 384,
+    "paraphrase-MiniLM-L6-v2": 384,
+    "multi-qa-MiniLM-L6-cos-v1": 384,
+    "all-mpnet-base-v2": 768,
+    "multi-qa-mpnet-base-dot-v1": 768,
+    "bge-small-en-v1.5": 384,
+    "bge-base-en-v1.5": 768,
+}
+
+def short_model_name(model_name: str) -> str:
+    """'sentence-transformers/all-MiniLM-L6-v2' -> 'all-MiniLM-L6-v2'"""
+    return model_name.rstrip("/").split("/")[-1]
+
+def known_dimension(model_name: str) -> Optional[int]:
+    return KNOWN_DIMENSIONS.get(short_model_name(model_name))
+
+def load_embedding_model(model_name: str = DEFAULT_MODEL, backend: str = "sentence-transformers",
+                         threads: Optional[int] = None, onnx_file: Optional[str] = None):
+    """Build an embedding model exposing the SentenceTransformer encode() interface.
+
+    Backends:
+      sentence-transformers - the PyTorch model as published
+      int8                  - the same model with Linear layers dynamically quantized to int8
+      onnx                  - ONNX Runtime session over an exported copy of the model;
+                              point ``onnx_file`` at e.g. onnx/model_qint8_avx2.onnx for int8
+    Quantized variants keep the model's embedding space, so vectors stored by one
+    backend stay comparable with queries encoded by another.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+    if backend == "onnx":
+        return OnnxEmbeddingModel(model_name, threads=threads, onnx_file=onnx_file)
+
+    from sentence_transformers import SentenceTransformer
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+class OnnxEmbeddingModel:
+    """Mean-pooled sentence embeddings from an ONNX export of a sentence-transformers model"""
+
+    def __init__(self, model_name: str, threads: Optional[int] = None, onnx_file: Optional[str] = None,
+                 max_length: int = 256):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        onnx_file = onnx_file or "onnx/model.onnx"
+        if os.path.exists(onnx_file):
+            model_path = onnx_file
+        else:
+            from huggingface_hub import hf_hub_download
+            model_path = hf_hub_download(repo, onnx_file)
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(repo)
+        self.max_length = max_length
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.session.get_outputs()[0].shape[-1])
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            feed = {name: tokens[name].astype(np.int64) for name in self._input_names if name in tokens}
+            if "token_type_ids" in self._input_names and "token_type_ids" not in feed:
+                feed["token_type_ids"] = np.zeros_like(tokens["input_ids"], dtype=np.int64)
+            hidden = self.session.run(None, feed)[0]
+
+            # Mean pooling over real tokens, as the sentence-transformers pooling layer does
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            batches.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        return np.vstack(batches).astype(np.float32)
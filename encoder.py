@@ -0,0 +1,233 @@
+import logging
+import threading
+import queue
+import time
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+from embedding_backends import DEFAULT_MODEL, load_embedding_model, known_dimension, short_model_name
+from metrics import ENCODE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(text: str) -> str:
+    """Text sent to the model: surrounding and repeated whitespace removed"""
+    return " ".join(text.split())
+
+def cache_key(text: str) -> str:
+    """LRU key for a query: normalize_text() with case folded.
+
+    The default (uncased) models embed "What is X" and "what is x" alike, so
+    they share a slot; a cased model gets the first casing it was asked for.
+    """
+    return normalize_text(text).casefold()
+
+class BatchingEncoder:
+    """Embedding service shared by every SemanticMemory caller.
+
+    Single encode() calls from concurrent requests are collected by a worker
+    thread for up to ``max_wait_ms`` (or until ``max_batch_size`` texts are
+    queued) and sent through the model in one forward pass. Exact repeats of
+    a recently seen query are answered from an LRU cache without encoding.
+    All returned vectors are L2-normalized float32.
+
+    The model can be passed in directly or built on first use from
+    ``model_name``/``backend``/``threads`` (see embedding_backends); ``warm_up()``
+    loads it ahead of time, optionally in the background.
+    """
+
+    def __init__(self, model=None, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 cache_size: int = 4096, model_loader: Optional[Callable] = None,
+                 model_name: str = DEFAULT_MODEL, backend: str = "sentence-transformers",
+                 threads: Optional[int] = None, onnx_file: Optional[str] = None,
+                 dimension: Optional[int] = None):
+        if model is None and model_loader is None:
+            model_loader = lambda: load_embedding_model(model_name, backend, threads, onnx_file)
+        self.model_name = model_name
+        self.backend = backend
+        # Declared or known up front so building an index never loads the model;
+        # checked against the model once it loads
+        self._dimension = dimension or known_dimension(model_name)
+        self._model = model
+        self._model_loader = model_loader
+        self._model_lock = threading.Lock()
+        self._ready = threading.Event()
+        if model is not None:
+            self._ready.set()
+        self.load_error = None
+        self.load_seconds = None
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.encoded = 0
+
+    @property
+    def model(self):
+        """The underlying model, loaded on first access"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    start = time.monotonic()
+                    try:
+                        model = self._model_loader()
+                        self._check_dimension(model)
+                    except Exception as e:
+                        self.load_error = str(e)
+                        raise
+                    self._model = model
+                    self.load_seconds = round(time.monotonic() - start, 2)
+                    self.load_error = None
+        return self._model
+
+    @property
+    def fingerprint(self) -> str:
+        """Identity of the embedding space; vectors are only comparable within one"""
+        return short_model_name(self.model_name)
+
+    @property
+    def dimension(self) -> int:
+        """Embedding size: declared, from the known-model table, or by loading the model"""
+        if self._dimension is None:
+            self._dimension = int(self.model.get_sentence_embedding_dimension())
+        return self._dimension
+
+    def _check_dimension(self, model) -> None:
+        actual = int(model.get_sentence_embedding_dimension())
+        if self._dimension is not None and actual != self._dimension:
+            raise ValueError(f"{self.model_name} produces {actual}-dim embeddings, expected {self._dimension}")
+        self._dimension = actual
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def warm_up(self, background: bool = True) -> None:
+        """Load the model and run one forward pass so the first request is fast"""
+        def run():
+            try:
+                self.model.encode(["warm up"], batch_size=1)
+                self._ready.set()
+                logger.info("🔥 Embedding model ready in %ss", self.load_seconds)
+            except Exception as e:
+                logger.error("❌ Embedding model failed to load: %s", e)
+
+        if background:
+            threading.Thread(target=run, name="embedding-warmup", daemon=True).start()
+        else:
+            run()
+
+    def encode(self, text: str) -> np.ndarray:
+        """Encode one query, batching it with whatever else is in flight"""
+        start = time.perf_counter()
+        key = cache_key(text)
+        cached = self._cache_get(key)
+        if cached is None:
+            future = Future()
+            self._ensure_worker()
+            self._queue.put((key, normalize_text(text), future))
+            cached = future.result()
+        ENCODE_SECONDS.observe(time.perf_counter() - start)
+        return cached
+
+    def encode_many(self, texts: List[str]) -> np.ndarray:
+        """Encode a caller-side batch in one forward pass, skipping cached texts"""
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        keys = [cache_key(t) for t in texts]
+        vectors = [self._cache_get(k) for k in keys]
+        # First text per missing key, in order
+        missing = {}
+        for text, key, vector in zip(texts, keys, vectors):
+            if vector is None and key not in missing:
+                missing[key] = normalize_text(text)
+        if missing:
+            encoded = dict(zip(missing, self._encode_batch(list(missing), list(missing.values()))))
+            vectors = [v if v is not None else encoded[k] for k, v in zip(keys, vectors)]
+        return np.vstack(vectors)
+
+    def get_stats(self) -> dict:
+        return {
+            "encode_cache_hits": self.cache_hits,
+            "encode_cache_misses": self.cache_misses,
+            "encode_batches": self.batches,
+            "avg_encode_batch_size": round(self.encoded / self.batches, 2) if self.batches else 0.0,
+            "encoder_ready": self.ready,
+            "encoder_model": self.model_name,
+            "encoder_backend": self.backend
+        }
+
+    def _encode_batch(self, keys: List[str], texts: List[str]) -> np.ndarray:
+        embeddings = np.asarray(self.model.encode(texts, batch_size=len(texts)), dtype=np.float32)
+        self._ready.set()
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings.flags.writeable = False
+        self.batches += 1
+        self.encoded += len(keys)
+        for key, embedding in zip(keys, embeddings):
+            self._cache_put(key, embedding)
+        return embeddings
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._complete(batch)
+
+    def _complete(self, batch: List[Tuple[str, str, Future]]) -> None:
+        texts = {}
+        for key, text, _ in batch:
+            texts.setdefault(key, text)
+        try:
+            encoded = dict(zip(texts, self._encode_batch(list(texts), list(texts.values()))))
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for key, _, future in batch:
+            future.set_result(encoded[key])
+
+    def _cache_get(self, key: str):
+        with self._cache_lock:
+            embedding = self._cache.get(key)
+            if embedding is None:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return embedding
+
+    def _cache_put(self, key: str, embedding: np.ndarray) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
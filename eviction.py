@@ -0,0 +1,124 @@
+import numpy as np
+from typing import Optional
+
+class EntryStats:
+    """Per-entry bookkeeping for SemanticMemory, stored column-wise in NumPy arrays.
+
+    Row ``i`` describes the entry at FAISS row ``i``. Dead rows (evicted or
+    expired) stay in place as tombstones until the memory is compacted.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.last_access = np.zeros(capacity, dtype=np.float64)
+        self.expires = np.full(capacity, np.inf, dtype=np.float64)
+        self.hits = np.zeros(capacity, dtype=np.int64)
+        self.nbytes = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.live_count = 0
+        self.live_bytes = 0
+
+    def append(self, created: float, expires: Optional[float], nbytes: int) -> None:
+        if self.size == len(self.alive):
+            self._grow(max(1024, 2 * self.size))
+        i = self.size
+        self.created[i] = created
+        self.last_access[i] = created
+        self.expires[i] = np.inf if expires is None else expires
+        self.hits[i] = 0
+        self.nbytes[i] = nbytes
+        self.alive[i] = True
+        self.size += 1
+        self.live_count += 1
+        self.live_bytes += nbytes
+
+    def touch(self, i: int, now: float) -> None:
+        """Record a cache hit; O(1) so it can run inside search()"""
+        self.hits[i] += 1
+        self.last_access[i] = now
+
+    def kill(self, ids: np.ndarray) -> np.ndarray:
+        """Tombstone the given rows; returns the ones that were still alive"""
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[self.alive[ids]]
+        self.alive[ids] = False
+        self.live_count -= len(ids)
+        self.live_bytes -= int(self.nbytes[ids].sum())
+        return ids
+
+    def expired(self, now: float) -> np.ndarray:
+        n = self.size
+        return np.flatnonzero(self.alive[:n] & (self.expires[:n] <= now))
+
+    @property
+    def tombstones(self) -> int:
+        return self.size - self.live_count
+
+    def compact(self) -> np.ndarray:
+        """Drop tombstoned rows; returns the surviving old row ids in order"""
+        keep = np.flatnonzero(self.alive[:self.size])
+        for name in ("created", "last_access", "expires", "hits", "nbytes", "alive"):
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+        self.size = len(keep)
+        self.alive[self.size:] = False
+        return keep
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def _grow(self, capacity: int) -> None:
+        for name in ("created", "last_access", "expires", "hits", "nbytes", "alive"):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            if name == "expires":
+                grown[:] = np.inf
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+class EvictionPolicy:
+    """Chooses which live entries to evict when the memory is over budget"""
+
+    name = "base"
+
+    def select(self, stats: EntryStats, count: int) -> np.ndarray:
+        candidates = np.flatnonzero(stats.alive[:stats.size])
+        if count >= len(candidates):
+            return candidates
+        order = self._order(stats, candidates)
+        return candidates[order[:count]]
+
+    def _order(self, stats: EntryStats, candidates: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+class LRUPolicy(EvictionPolicy):
+    """Least recently hit (or stored) first"""
+
+    name = "lru"
+
+    def _order(self, stats, candidates):
+        return np.argsort(stats.last_access[candidates], kind="stable")
+
+class LFUPolicy(EvictionPolicy):
+    """Fewest hits first, least recently used among ties"""
+
+    name = "lfu"
+
+    def _order(self, stats, candidates):
+        return np.lexsort((stats.last_access[candidates], stats.hits[candidates]))
+
+class TTLPolicy(EvictionPolicy):
+    """Soonest to expire first, oldest first among entries without a TTL"""
+
+    name = "ttl"
+
+    def _order(self, stats, candidates):
+        return np.lexsort((stats.created[candidates], stats.expires[candidates]))
+
+POLICIES = {policy.name: policy for policy in (LRUPolicy, LFUPolicy, TTLPolicy)}
+
+def get_policy(name: str) -> EvictionPolicy:
+    if name not in POLICIES:
+        raise ValueError(f"Unknown eviction policy '{name}', expected one of {sorted(POLICIES)}")
+    return POLICIES[name]()
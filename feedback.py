@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+import numpy as np
+import metrics
+from log import SAMPLED
+from memory import SemanticMemory, SearchResult
+from namespaces import NamespacedMemory
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_LOG = "feedback.jsonl"
+THRESHOLDS_FILE = "thresholds.json"
+
+class AdaptiveThreshold:
+    """Online controller for one namespace's similarity threshold.
+
+    Every served hit's similarity is remembered, and hits flagged as wrong are
+    remembered again as bad. When the false-hit rate above the current threshold
+    exceeds ``target``, the threshold jumps to the lowest value that meets it.
+    It only creeps down by ``step`` (to win back hits) while the rate stays
+    under half the target *and* ``min_confirmed`` hits within ``band`` above
+    the threshold were rated helpful since it last moved: no complaints alone
+    is not evidence that looser matches would be right. It never leaves
+    [floor, ceiling].
+    """
+
+    def __init__(self, memory: SemanticMemory, target: float = 0.05, floor: float = 0.6,
+                 ceiling: float = 0.95, window: int = 2000, min_samples: int = 50,
+                 step: float = 0.005, update_every: int = 50, min_confirmed: int = 5,
+                 band: float = 0.05):
+        self.memory = memory
+        self.target = target
+        self.floor = floor
+        self.ceiling = ceiling
+        self.min_samples = min_samples
+        self.step = step
+        self.update_every = update_every
+        self.min_confirmed = min_confirmed
+        self.band = band
+        self.served = deque(maxlen=window)
+        self.bad = deque(maxlen=window)
+        self._since_update = 0
+        # Helpful ratings near the threshold since it last moved
+        self._confirmed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def threshold(self) -> float:
+        return self.memory.similarity_threshold
+
+    def record_hit(self, score: float) -> None:
+        """Remember a served hit's similarity"""
+        with self._lock:
+            self.served.append(score)
+
+    def record_query(self) -> bool:
+        """Count a lookup, hit or not, and re-evaluate every ``update_every`` of them.
+
+        Counting misses too means a threshold that stopped hitting is still revisited.
+        Returns True if the threshold moved.
+        """
+        with self._lock:
+            self._since_update += 1
+            if self._since_update < self.update_every:
+                return False
+            return self._update()
+
+    def record_good(self, score: float) -> None:
+        """Count a hit rated helpful; near the threshold it supports lowering it"""
+        with self._lock:
+            if self.threshold <= score < self.threshold + self.band:
+                self._confirmed += 1
+
+    def record_bad(self, score: float) -> bool:
+        """Count a hit that turned out wrong; returns True if the threshold moved"""
+        with self._lock:
+            self.bad.append(score)
+            return self._update()
+
+    def false_hit_rate(self, threshold: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            return self._false_hit_rate(threshold if threshold is not None else self.threshold)
+
+    def _false_hit_rate(self, threshold: float) -> Optional[float]:
+        served = np.fromiter(self.served, dtype=np.float64)
+        hits = int(np.count_nonzero(served >= threshold))
+        if hits == 0:
+            return None
+        bad = np.fromiter(self.bad, dtype=np.float64)
+        return min(1.0, np.count_nonzero(bad >= threshold) / hits)
+
+    def _update(self) -> bool:
+        self._since_update = 0
+        if len(self.served) < self.min_samples:
+            return False
+        current = self.threshold
+        # No hits above the threshold means nothing above it is known to be bad
+        rate = self._false_hit_rate(current) or 0.0
+
+        new = current
+        if rate > self.target:
+            new = self.ceiling
+            for candidate in np.arange(current + 0.01, self.ceiling, 0.01):
+                candidate_rate = self._false_hit_rate(candidate)
+                if candidate_rate is None or candidate_rate <= self.target:
+                    new = float(candidate)
+                    break
+        elif rate < self.target / 2 and self._confirmed >= self.min_confirmed:
+            new = current - self.step
+        new = round(min(self.ceiling, max(self.floor, new)), 4)
+        if new == current:
+            return False
+
+        self.memory.similarity_threshold = new
+        self._confirmed = 0
+        logger.info("🎚️ Threshold for '%s' %.3f -> %.3f (false-hit rate %.3f over %d hits)",
+                    self.memory.name, current, new, rate, len(self.served))
+        return True
+
+    def get_stats(self) -> dict:
+        rate = self.false_hit_rate()
+        return {
+            "similarity_threshold": self.threshold,
+            "false_hit_rate": round(rate, 4) if rate is not None else None,
+            "served_samples": len(self.served),
+            "bad_samples": len(self.bad),
+            "confirmed_near_threshold": self._confirmed
+        }
+
+class FeedbackTracker:
+    """Collects hit feedback and feeds it to per-namespace adaptive thresholds.
+
+    Signals are an explicit thumbs up/down on a served hit (by ``hit_id``) and a
+    re-ask: the same session asking a similar but different question within
+    ``reask_window`` seconds of a hit, which is taken to mean the hit missed.
+    Every signal is appended to ``feedback.jsonl`` for the offline tuner
+    (``python -m bench.tune_threshold``). With ``adapt=False`` signals are only
+    recorded and thresholds stay fixed.
+    """
+
+    def __init__(self, memories: NamespacedMemory, log_dir: Optional[str] = None, adapt: bool = False,
+                 reask_window: float = 120.0, reask_similarity: float = 0.6,
+                 max_tracked: int = 10000, **threshold_config):
+        self.memories = memories
+        self.adapt = adapt
+        self.reask_window = reask_window
+        self.reask_similarity = reask_similarity
+        self.max_tracked = max_tracked
+        self.threshold_config = threshold_config
+        self.log_path = os.path.join(log_dir, FEEDBACK_LOG) if log_dir else None
+        self.thresholds_path = os.path.join(log_dir, THRESHOLDS_FILE) if log_dir else None
+        self._controllers: Dict[str, AdaptiveThreshold] = {}
+        # hit_id -> served hit, and session -> its latest hit; both bounded LRUs
+        self._hits: "OrderedDict[str, dict]" = OrderedDict()
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        if self.adapt:
+            self._load_thresholds()
+
+    def controller(self, namespace: str) -> AdaptiveThreshold:
+        with self._lock:
+            if namespace not in self._controllers:
+                self._controllers[namespace] = AdaptiveThreshold(
+                    self.memories.partition(namespace), **self.threshold_config
+                )
+            return self._controllers[namespace]
+
+    def observe_query(self, session: Optional[str], namespace: str, query: str,
+                      embedding: Optional[np.ndarray]) -> None:
+        """Call before each lookup: a close rephrasing of the session's last hit counts against that hit.
+
+        Exact-tier hits are looked up without an embedding; they pass None and are not compared.
+        """
+        if self.adapt and self.controller(namespace).record_query():
+            self._save_thresholds()
+        if not session:
+            return
+        with self._lock:
+            last = self._sessions.pop(session, None)
+        if last is None or last["namespace"] != namespace or last["query"] == query:
+            return
+        if time.time() - last["ts"] > self.reask_window or embedding is None or last["embedding"] is None:
+            return
+        similarity = float(np.dot(np.ravel(embedding), np.ravel(last["embedding"])))
+        if similarity >= self.reask_similarity:
+            logger.info("🔁 Re-ask after a hit in '%s' (similarity %.3f)", namespace, similarity, extra=SAMPLED)
+            self._signal(last, "reask", helpful=False)
+
+    def record_hit(self, session: Optional[str], namespace: str, query: str, embedding: Optional[np.ndarray],
+                   lookup: SearchResult) -> str:
+        """Remember a served hit; returns the id the client uses to rate it.
+
+        Exact-tier hits are rated and logged but never move the threshold, which does not gate them.
+        """
+        hit = {
+            "hit_id": uuid.uuid4().hex[:16],
+            "namespace": namespace,
+            "query": query,
+            "cached_query": lookup.query,
+            "score": round(lookup.score, 4),
+            "tier": lookup.tier,
+            "ts": time.time(),
+            "embedding": embedding
+        }
+        with self._lock:
+            self._remember(self._hits, hit["hit_id"], hit)
+            if session:
+                self._remember(self._sessions, session, hit)
+        if self.adapt and lookup.tier != "exact":
+            self.controller(namespace).record_hit(lookup.score)
+        return hit["hit_id"]
+
+    def feedback(self, hit_id: str, helpful: bool) -> bool:
+        """Explicit rating of a served hit; False if the hit is unknown or already rated"""
+        with self._lock:
+            hit = self._hits.pop(hit_id, None)
+            # A rated hit is no longer a re-ask candidate
+            for session, last in list(self._sessions.items()):
+                if last is hit:
+                    del self._sessions[session]
+        if hit is None:
+            return False
+        self._signal(hit, "thumbs_up" if helpful else "thumbs_down", helpful)
+        return True
+
+    def _signal(self, hit: dict, signal: str, helpful: bool) -> None:
+        metrics.FEEDBACK.inc(namespace=hit["namespace"], signal=signal)
+        self._log({
+            "ts": round(time.time(), 3),
+            "namespace": hit["namespace"],
+            "query": hit["query"],
+            "cached_query": hit["cached_query"],
+            "score": hit["score"],
+            "signal": signal,
+            "helpful": helpful,
+            "tier": hit["tier"]
+        })
+        if hit["tier"] == "exact":
+            return
+        if not self.adapt:
+            return
+        if helpful:
+            self.controller(hit["namespace"]).record_good(hit["score"])
+        elif self.controller(hit["namespace"]).record_bad(hit["score"]):
+            self._save_thresholds()
+
+    def _remember(self, table: OrderedDict, key: str, value: dict) -> None:
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.max_tracked:
+            table.popitem(last=False)
+
+    def _log(self, event: dict) -> None:
+        if self.log_path is None:
+            return
+        with self._log_lock:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event) + "\n")
+
+    def _load_thresholds(self) -> None:
+        """Resume from thresholds adapted by an earlier run"""
+        if self.thresholds_path is None or not os.path.exists(self.thresholds_path):
+            return
+        with open(self.thresholds_path) as f:
+            saved = json.load(f)
+        for namespace, threshold in saved.items():
+            if namespace in self.memories:
+                self.memories.partition(namespace).similarity_threshold = float(threshold)
+                logger.info("Resumed adapted threshold %.3f for '%s'", threshold, namespace)
+
+    def _save_thresholds(self) -> None:
+        if self.thresholds_path is None:
+            return
+        with self._lock:
+            thresholds = {name: c.threshold for name, c in self._controllers.items()}
+        tmp = self.thresholds_path + ".tmp"
+        with self._log_lock:
+            os.makedirs(os.path.dirname(tmp) or ".", exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(thresholds, f, indent=2)
+            os.replace(tmp, self.thresholds_path)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            controllers = dict(self._controllers)
+        return {
+            "adaptive": self.adapt,
+            "tracked_hits": len(self._hits),
+            "namespaces": {name: c.get_stats() for name, c in controllers.items()}
+        }
@@ -0,0 +1,22 @@
+import os
+
+# One libgomp/BLAS thread per worker: the parallelism comes from workers and
+# threads, and an OpenMP pool created before fork can deadlock the children.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_WORKERS", "2"))
+
+# gthread workers serve searches concurrently; SemanticMemory's read-write
+# lock lets them run in parallel while stores are serialized.
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+
+# Import the app once in the master so the embedding model's weights are
+# shared copy-on-write by every forked worker instead of loaded per worker.
+# The model must finish loading before fork, so warm it up synchronously.
+preload_app = True
+os.environ.setdefault("EMBED_WARMUP", "eager")
+
+# Streaming responses can be long-lived
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
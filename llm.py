@@ -2,129 +2,440 @@ import requests
 import os
 from typing import Optional
 import random
+import hashlib
+import itertools
 import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterator, List, Tuple
+from metrics import LLM_ATTEMPT_SECONDS, LLM_GENERATIONS, LLM_RETRIES
+from log import SAMPLED
+from scheduler import LLMScheduler, Reservation, backoff_delay
 
-def generate(prompt: str, max_tokens: int = 512) -> Optional[str]:
-    """Generate response using TogetherAI API with working serverless models"""
-    
-    # Get TogetherAI API key
-    api_key = os.getenv("TOGETHER_API_KEY", "tgp_v1_5LFzL374MbMoNI6CNLhO5PF7qlosPj8bHazud7LbXJs")
-    
-    print(f"🔑 Using API key: {api_key[:15]}...")
-    
+logger = logging.getLogger(__name__)
+
+API_BASE = os.getenv("TOGETHER_API_BASE", "https://api.together.xyz/v1")
+
+# Updated models list with working serverless models
+# Based on your test results, these models should work
+MODELS = [
+    "mistralai/Mistral-7B-Instruct-v0.1",  # This one worked in your test!
+    "meta-llama/Llama-3.2-3B-Instruct-Turbo",  # Turbo models are usually serverless
+    "arcee-ai/coder-large",  # Good for code-related queries
+    "arcee-ai/arcee-blitz",  # Fast model
+    "WhereIsAI/UAE-Large-V1",  # From your available models list
+]
+
+# Seconds to wait on a model before also starting the next one (0 races all
+# healthy models at once, a negative value disables hedging entirely)
+HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2.0"))
+REQUEST_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+MODELS_CACHE_TTL = float(os.getenv("LLM_MODELS_CACHE_TTL", "300"))
+# Seconds a prompt that failed on every model is answered with the fallback
+# straight away instead of being retried upstream (0 disables)
+NEGATIVE_CACHE_TTL = float(os.getenv("LLM_NEGATIVE_CACHE_TTL", "30"))
+# Upstream calls in flight at once (per process); more wait in priority order
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# JSON {"model" or "*": {"rps": requests/s, "tpm": tokens/min}}; unset is unlimited
+RATE_LIMITS = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+# JSON {"model": {"input": USD per 1M tokens, "output": USD per 1M tokens}}
+PRICES = json.loads(os.getenv("LLM_PRICES", "{}"))
+# Retries of a 429 or 5xx on the same model, with jittered exponential backoff
+# up to RETRY_MAX_BACKOFF seconds (a longer Retry-After moves to the next model)
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRY_MAX_BACKOFF = float(os.getenv("LLM_RETRY_MAX_BACKOFF", "8"))
+# Seconds a call may wait for the scheduler before the fallback is used instead
+QUEUE_TIMEOUTS = {
+    "interactive": float(os.getenv("LLM_QUEUE_TIMEOUT", "15")),
+    "bulk": float(os.getenv("LLM_BULK_QUEUE_TIMEOUT", "300"))
+}
+
+def _build_session() -> requests.Session:
+    """Keep-alive session shared by every upstream call"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_session = _build_session()
+# Retry backoff; a hook so tests can skip the wait without patching time.sleep process-wide
+_sleep = time.sleep
+# Calls are submitted once the scheduler admits them, but a retrying call keeps
+# its thread through the backoff and the wait to be readmitted, without holding a
+# slot. Under many retries every worker can be busy and new calls queue here;
+# generate() then sees them as slow and may hedge to the next model.
+_executor = ThreadPoolExecutor(max_workers=max(16, MAX_CONCURRENCY), thread_name_prefix="llm")
+
+class CircuitBreaker:
+    """Per-model health tracking so known-bad models are skipped without a request.
+
+    Permanent failures (404, 422, model_not_available) open the circuit for
+    ``permanent_cooldown`` seconds straight away. Transient failures (timeouts,
+    5xx) open it for ``cooldown`` seconds after ``failure_threshold`` in a row.
+    Once a cooldown expires the model is tried again as a half-open probe.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0,
+                 permanent_cooldown: float = 600.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.permanent_cooldown = permanent_cooldown
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def is_available(self, model: str) -> bool:
+        with self._lock:
+            return time.monotonic() >= self._open_until.get(model, 0.0)
+
+    def record_success(self, model: str) -> None:
+        with self._lock:
+            self._failures.pop(model, None)
+            self._open_until.pop(model, None)
+
+    def record_failure(self, model: str, permanent: bool = False) -> None:
+        with self._lock:
+            failures = self._failures.get(model, 0) + 1
+            self._failures[model] = failures
+            if permanent:
+                self._open_until[model] = time.monotonic() + self.permanent_cooldown
+            elif failures >= self.failure_threshold:
+                self._open_until[model] = time.monotonic() + self.cooldown
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model: {
+                    "consecutive_failures": self._failures.get(model, 0),
+                    "circuit_open": now < self._open_until.get(model, 0.0)
+                }
+                for model in MODELS
+            }
+
+circuit_breaker = CircuitBreaker()
+
+class NegativeCache:
+    """Prompts that just failed on every model, remembered for ``ttl`` seconds.
+
+    A repeat within the TTL gets the smart fallback without another round of
+    upstream attempts. At most ``max_entries`` prompts are kept, oldest dropped first.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(prompt: str) -> str:
+        return hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest()
+
+    def add(self, prompt: str) -> None:
+        if self.ttl <= 0:
+            return
+        key = self._key(prompt)
+        with self._lock:
+            self._expires[key] = time.monotonic() + self.ttl
+            self._expires.move_to_end(key)
+            while len(self._expires) > self.max_entries:
+                self._expires.popitem(last=False)
+
+    def check(self, prompt: str) -> bool:
+        """True (and counted as a hit) if the prompt failed within the TTL"""
+        if self.ttl <= 0:
+            return False
+        key = self._key(prompt)
+        with self._lock:
+            expires = self._expires.get(key)
+            if expires is None:
+                return False
+            if time.monotonic() >= expires:
+                del self._expires[key]
+                return False
+            self.hits += 1
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"ttl_seconds": self.ttl, "entries": len(self._expires), "hits": self.hits}
+
+negative_cache = NegativeCache(NEGATIVE_CACHE_TTL)
+
+scheduler = LLMScheduler(MAX_CONCURRENCY, limits=RATE_LIMITS, prices=PRICES)
+
+@dataclass
+class Generation:
+    """Outcome of generate(); only an ``ok`` answer may be cached"""
+    text: str
+    # Model that answered; None for the smart fallback
+    model: Optional[str] = None
+    # ok: a model answered; fallback: every model failed or had an open circuit;
+    # negative_cached: the prompt failed moments ago, so no model was tried;
+    # overloaded: no upstream capacity freed up within the queue timeout
+    status: str = "ok"
+    # Seconds spent in generate()
+    latency: float = 0.0
+
+    @property
+    def is_fallback(self) -> bool:
+        return self.status != "ok"
+
+class ModelError(Exception):
+    """A single model attempt failed; ``permanent`` marks the model as unusable.
+
+    ``status`` is the HTTP status, if the upstream answered, and ``retry_after``
+    its Retry-After in seconds.
+    """
+
+    def __init__(self, message: str, permanent: bool = False, status: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.permanent = permanent
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.status == 429
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is not None and (self.status == 429 or self.status >= 500)
+
+def _get_api_key() -> str:
+    return os.getenv("TOGETHER_API_KEY", "tgp_v1_5LFzL374MbMoNI6CNLhO5PF7qlosPj8bHazud7LbXJs")
+
+def _headers() -> dict:
+    return {
+        "Authorization": f"Bearer {_get_api_key()}",
+        "Content-Type": "application/json"
+    }
+
+def _chat_payload(model: str, prompt: str, max_tokens: int, stream: bool) -> dict:
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "user", 
+                "content": prompt
+            }
+        ],
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "stream": stream
+    }
+
+def _check_status(model: str, response: requests.Response) -> None:
+    """Raise ModelError for a non-200 reply, classifying permanent failures"""
+    if response.status_code == 200:
+        return
+    if response.status_code in (404, 422):
+        raise ModelError(f"Model {model} unavailable (status {response.status_code})", permanent=True)
+    if response.status_code == 400 and "model_not_available" in response.text:
+        raise ModelError(f"Model {model} requires dedicated endpoint", permanent=True)
+    if response.status_code == 429:
+        raise ModelError(f"Rate limited by {model}", status=429, retry_after=_retry_after(response))
+    raise ModelError(f"API error {response.status_code}: {response.text[:200]}", status=response.status_code)
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Retry-After in seconds; the HTTP-date form is ignored"""
     try:
-        # TogetherAI API endpoint
-        url = "https://api.together.xyz/v1/chat/completions"
+        return max(0.0, float(response.headers.get("Retry-After", "")))
+    except ValueError:
+        return None
+
+def _retry_delay(model: str, error: ModelError, attempt: int) -> Optional[float]:
+    """Seconds to back off before retrying ``model``, or None to give up on it.
+
+    A 429 also pauses the model in the scheduler, so other callers go to the
+    next model instead of piling onto a rate-limited one.
+    """
+    if not error.retryable:
+        return None
+    delay = backoff_delay(attempt, cap=RETRY_MAX_BACKOFF, retry_after=error.retry_after)
+    if error.rate_limited:
+        scheduler.throttle(model, delay)
+    if attempt >= MAX_RETRIES or delay > RETRY_MAX_BACKOFF:
+        return None
+    LLM_RETRIES.inc(model=model, reason="rate_limited" if error.rate_limited else "server_error")
+    logger.info("🔁 %s, retrying in %.2fs", error, delay, extra=SAMPLED)
+    return delay
+
+def _estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """Upper-bound token estimate for admission; settled against the reported usage"""
+    return len(prompt) // 4 + max_tokens
+
+def _attempt_outcome(error: Optional[Exception]) -> str:
+    """Metric label for how one model attempt ended"""
+    if error is None:
+        return "success"
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, ModelError) and error.rate_limited:
+        return "rate_limited"
+    if isinstance(error, ModelError) and error.permanent:
+        return "unavailable"
+    return "error"
+
+def _attempt_model(model: str, prompt: str, max_tokens: int) -> Tuple[str, Optional[dict]]:
+    """One non-streaming request to one model; returns (text, reported token usage)"""
+    logger.debug("🚀 Trying model: %s", model)
+    start = time.perf_counter()
+    error = None
+    try:
+        response = _session.post(
+            f"{API_BASE}/chat/completions",
+            headers=_headers(),
+            json=_chat_payload(model, prompt, max_tokens, stream=False),
+            timeout=REQUEST_TIMEOUT
+        )
+        logger.debug("📊 %s response status: %s", model, response.status_code)
+        _check_status(model, response)
         
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        result = response.json()
+        choices = result.get("choices") or []
+        generated_text = choices[0]["message"]["content"].strip() if choices else ""
+        if not generated_text:
+            raise ModelError(f"Empty response content from {model}")
+        return generated_text, result.get("usage")
+    except ModelError as e:
+        error = e
+        raise
+    except requests.exceptions.RequestException as e:
+        error = e
+        raise ModelError(f"Request to {model} failed: {str(e)}")
+    finally:
+        LLM_ATTEMPT_SECONDS.observe(time.perf_counter() - start, model=model, outcome=_attempt_outcome(error))
+
+def _scheduled_call(reservation: Reservation, prompt: str, max_tokens: int) -> str:
+    """Call the reserved model, retrying 429s and 5xx; the outcome is recorded in the circuit breaker.
+
+    Each attempt holds its own reservation: the slot is released (with the
+    usage) before backing off, and a retry is admitted again through the
+    priority queue and the model's rate limits. Being rate limited says
+    nothing about the model's health, so a 429 never opens its circuit.
+    """
+    model = reservation.model
+    for attempt in itertools.count():
+        usage = None
+        try:
+            text, usage = _attempt_model(model, prompt, max_tokens)
+        except ModelError as e:
+            delay = _retry_delay(model, e, attempt)
+            if delay is None:
+                if not e.rate_limited:
+                    circuit_breaker.record_failure(model, permanent=e.permanent)
+                raise
+        else:
+            circuit_breaker.record_success(model)
+            return text
+        finally:
+            scheduler.release(reservation, usage)
+        _sleep(delay)
+        reservation = _reacquire(reservation)
+
+def _reacquire(reservation: Reservation) -> Reservation:
+    """A new reservation on the same model for a retry; ModelError if none frees up in time"""
+    retry = scheduler.acquire([reservation.model], reservation.priority, reservation.tokens,
+                              timeout=QUEUE_TIMEOUTS[reservation.priority])
+    if retry is None:
+        raise ModelError(f"No capacity to retry {reservation.model}")
+    return retry
+
+def generate(prompt: str, max_tokens: int = 512, models: Optional[List[str]] = None,
+             priority: str = "interactive") -> Generation:
+    """Generate response using TogetherAI API with working serverless models.
+
+    Models with an open circuit are skipped. The first healthy model with
+    rate-limit room is called once the scheduler admits it (``priority``
+    "interactive" goes ahead of "bulk") and, if it has not answered within
+    HEDGE_DELAY seconds (or as soon as it fails), the next one is started as
+    well if there is spare capacity; the first successful answer wins.
+    If every model fails, the smart fallback is returned with is_fallback set,
+    and the prompt goes straight to the fallback for NEGATIVE_CACHE_TTL seconds.
+    ``models`` overrides the order in which models are tried.
+    """
+    start = time.perf_counter()
+    if negative_cache.check(prompt):
+        logger.info("🚫 Prompt failed recently, using fallback response", extra=SAMPLED)
+        return _fallback(prompt, "negative_cached", start)
+    
+    candidates = [m for m in (models or MODELS) if circuit_breaker.is_available(m)]
+    if not candidates:
+        logger.warning("⚡ Every model circuit is open, skipping upstream")
+        return _fallback(prompt, "fallback", start)
+    
+    tokens = _estimate_tokens(prompt, max_tokens)
+    pending = {}
+    while candidates or pending:
+        if candidates and (not pending or HEDGE_DELAY == 0):
+            # The first attempt waits its turn; racing more models only takes spare capacity
+            reservation = scheduler.acquire(candidates, priority, tokens, timeout=QUEUE_TIMEOUTS[priority],
+                                            blocking=not pending)
+            if reservation is not None:
+                candidates.remove(reservation.model)
+                pending[_executor.submit(_scheduled_call, reservation, prompt, max_tokens)] = reservation.model
+                if HEDGE_DELAY == 0:
+                    continue
+            elif not pending:
+                logger.warning("⏳ Upstream saturated, using fallback response")
+                return _fallback(prompt, "overloaded", start)
         
-        # Updated models list with working serverless models
-        # Based on your test results, these models should work
-        models = [
-            "mistralai/Mistral-7B-Instruct-v0.1",  # This one worked in your test!
-            "meta-llama/Llama-3.2-3B-Instruct-Turbo",  # Turbo models are usually serverless
-            "arcee-ai/coder-large",  # Good for code-related queries
-            "arcee-ai/arcee-blitz",  # Fast model
-            "WhereIsAI/UAE-Large-V1",  # From your available models list
-        ]
+        timeout = HEDGE_DELAY if candidates and HEDGE_DELAY > 0 else None
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
         
-        for model in models:
-            payload = {
-                "model": model,
-                "messages": [
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": max_tokens,
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "stream": False
-            }
-            
-            print(f"🚀 Trying model: {model}")
-            
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            
-            print(f"📊 Response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ API call successful!")
-                
-                if "choices" in result and len(result["choices"]) > 0:
-                    generated_text = result["choices"][0]["message"]["content"].strip()
-                    if generated_text:
-                        print(f"🎉 Generated response with {model}")
-                        return generated_text
-                    else:
-                        print("⚠️ Empty response content")
-                else:
-                    print("⚠️ No choices in response")
-                    print(f"📄 Response structure: {json.dumps(result, indent=2)}")
-                    
-            elif response.status_code == 400:
-                error_response = response.json()
-                if "model_not_available" in str(error_response):
-                    print(f"❌ Model {model} requires dedicated endpoint, trying next...")
-                    continue
-                else:
-                    print(f"❌ Bad request: {response.text}")
-                    continue
-                    
-            elif response.status_code == 422:
-                print(f"❌ Model {model} validation error, trying next...")
-                continue
-                
-            else:
-                print(f"❌ API error {response.status_code}: {response.text}")
-                # Try next model for most errors
+        if not done:
+            # Hedge: the current model is slow, start the next one alongside it
+            reservation = scheduler.acquire(candidates, priority, tokens, blocking=False)
+            if reservation is None:
                 continue
-                
-    except requests.exceptions.Timeout:
-        print("⏰ Request timed out")
-    except requests.exceptions.ConnectionError:
-        print("🌐 Connection error")
-    except Exception as e:
-        print(f"❌ TogetherAI API exception: {str(e)}")
-    
-    # Test API connectivity if all models fail
-    print("🧪 Testing API connectivity...")
-    try:
-        test_url = "https://api.together.xyz/v1/models"
-        test_headers = {"Authorization": f"Bearer {api_key}"}
-        test_response = requests.get(test_url, headers=test_headers, timeout=10)
-        print(f"🔍 Models endpoint status: {test_response.status_code}")
+            candidates.remove(reservation.model)
+            logger.info("⏱️ No answer after %ss, hedging with %s", HEDGE_DELAY, reservation.model, extra=SAMPLED)
+            pending[_executor.submit(_scheduled_call, reservation, prompt, max_tokens)] = reservation.model
+            continue
         
-        if test_response.status_code == 200:
-            models_data = test_response.json()
-            available_models = []
-            for model in models_data.get('data', [])[:10]:
-                model_id = model.get('id', 'unknown')
-                available_models.append(model_id)
-            print(f"📋 Available models (first 10): {available_models}")
-            
-            # Try to find a working chat model from available ones
-            chat_models = [m for m in available_models if any(keyword in m.lower() for keyword in ['instruct', 'chat', 'turbo'])]
-            if chat_models:
-                print(f"🎯 Found potential chat models: {chat_models}")
-                
-        else:
-            print(f"❌ Models endpoint error: {test_response.text}")
-            
-    except Exception as e:
-        print(f"❌ API connectivity test failed: {str(e)}")
+        for future in done:
+            model = pending.pop(future)
+            try:
+                generated_text = future.result()
+                logger.info("🎉 Generated response with %s", model, extra=SAMPLED)
+                LLM_GENERATIONS.inc(status="ok")
+                return Generation(generated_text, model, "ok", time.perf_counter() - start)
+            except ModelError as e:
+                logger.warning("❌ %s, trying next...", e)
     
     # Fallback to smart responses
-    print("🔄 All models failed, using fallback responses...")
-    return get_smart_fallback(prompt)
+    logger.warning("🔄 All models failed, using fallback responses...")
+    negative_cache.add(prompt)
+    return _fallback(prompt, "fallback", start)
+
+def _fallback(prompt: str, status: str, start: float) -> Generation:
+    LLM_GENERATIONS.inc(status=status)
+    return Generation(get_smart_fallback(prompt), None, status, time.perf_counter() - start)
 
 def get_smart_fallback(prompt: str) -> str:
     """Enhanced fallback responses based on prompt content"""
+    return random.choice(_fallback_candidates(prompt))
+
+def is_fallback_text(prompt: str, text: str) -> bool:
+    """Whether ``text`` is one of get_smart_fallback(prompt)'s canned answers (e.g. in an old cache file)"""
+    return text in _fallback_candidates(prompt)
+
+def _fallback_candidates(prompt: str) -> List[str]:
     prompt_lower = prompt.lower()
     
     # Science and technical questions
@@ -165,27 +476,142 @@ def get_smart_fallback(prompt: str) -> str:
             f"I find '{prompt}' quite interesting! Although I'm experiencing some technical difficulties with my primary AI service, I'm still here to discuss this topic with you. Could you tell me more about what you're looking for?",
             f"Great question regarding '{prompt}'! I'm currently running on fallback responses, but I'd be happy to share what I know about this subject. What particular details are you most curious about?"
         ]
+
+    return responses
+
+def generate_stream(prompt: str, max_tokens: int = 512,
+                    priority: str = "interactive") -> Iterator[Tuple[Optional[str], str]]:
+    """Stream a response token by token as (model, text) pairs.
+
+    Models are tried in the same order as generate(), each once the scheduler
+    admits it, and 429s and 5xx are retried like there; a model is only
+    abandoned before its first token. A chunk with model None means the
+    answer must not be cached: either the smart fallback after every model
+    failed (or the prompt is in the negative cache, or the upstream stayed
+    saturated), or an empty marker when the upstream connection dropped mid-stream.
+    """
+    if negative_cache.check(prompt):
+        logger.info("🚫 Prompt failed recently, using fallback response", extra=SAMPLED)
+        LLM_GENERATIONS.inc(status="negative_cached")
+        yield None, get_smart_fallback(prompt)
+        return
+    
+    candidates = [m for m in MODELS if circuit_breaker.is_available(m)]
+    tokens = _estimate_tokens(prompt, max_tokens)
+    tried = False
+    while candidates:
+        reservation = scheduler.acquire(candidates, priority, tokens, timeout=QUEUE_TIMEOUTS[priority])
+        if reservation is None:
+            logger.warning("⏳ Upstream saturated, using fallback response")
+            LLM_GENERATIONS.inc(status="overloaded")
+            yield None, get_smart_fallback(prompt)
+            return
+        model = reservation.model
+        candidates.remove(model)
+        payload = _chat_payload(model, prompt, max_tokens, stream=True)
+        tried = True
+        
+        for attempt in itertools.count():
+            logger.debug("🚀 Streaming from model: %s", model)
+            emitted = False
+            start = time.perf_counter()
+            error = None
+            usage = None
+            delay = None
+            
+            try:
+                with _session.post(f"{API_BASE}/chat/completions", headers=_headers(), json=payload,
+                                   stream=True, timeout=(5, REQUEST_TIMEOUT)) as response:
+                    _check_status(model, response)
+                    
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        # Providers that report usage put it on the last chunk
+                        usage = chunk.get("usage") or usage
+                        choices = chunk.get("choices") or [{}]
+                        token = (choices[0].get("delta") or {}).get("content")
+                        if token:
+                            emitted = True
+                            yield model, token
+                    
+                    if emitted:
+                        circuit_breaker.record_success(model)
+                        LLM_GENERATIONS.inc(status="ok")
+                        return
+                    error = ModelError(f"Empty stream from {model}")
+                    circuit_breaker.record_failure(model)
+                    logger.warning("⚠️ Empty stream from %s, trying next...", model)
+                    
+            except ModelError as e:
+                error = e
+                delay = _retry_delay(model, e, attempt)
+                if delay is None:
+                    if not e.rate_limited:
+                        circuit_breaker.record_failure(model, permanent=e.permanent)
+                    logger.warning("❌ %s, trying next...", e)
+            except requests.exceptions.RequestException as e:
+                error = e
+                circuit_breaker.record_failure(model)
+                logger.warning("❌ Stream request to %s failed: %s", model, e)
+                if emitted:
+                    # Tokens already reached the client; mark the answer incomplete
+                    LLM_GENERATIONS.inc(status="incomplete")
+                    yield None, ""
+                    return
+            finally:
+                # Covers the whole stream, so a success measures time to the last token
+                LLM_ATTEMPT_SECONDS.observe(time.perf_counter() - start, model=model, outcome=_attempt_outcome(error))
+                # Released before any backoff; a retry queues for a new reservation
+                scheduler.release(reservation, usage)
+            if delay is None:
+                break
+            _sleep(delay)
+            try:
+                reservation = _reacquire(reservation)
+            except ModelError as e:
+                logger.warning("⏳ %s, trying next...", e)
+                break
     
-    return random.choice(responses)
+    logger.warning("🔄 All models failed, using fallback responses...")
+    if tried:
+        negative_cache.add(prompt)
+    LLM_GENERATIONS.inc(status="fallback")
+    yield None, get_smart_fallback(prompt)
 
-def test_api_connectivity():
-    """Test API connectivity and return available models"""
-    api_key = os.getenv("TOGETHER_API_KEY", "tgp_v1_5LFzL374MbMoNI6CNLhO5PF7qlosPj8bHazud7LbXJs")
+_models_cache: Tuple[float, List[str]] = (0.0, [])
+_models_cache_lock = threading.Lock()
+
+def test_api_connectivity(force_refresh: bool = False) -> List[str]:
+    """Return the available model catalogue, cached for LLM_MODELS_CACHE_TTL seconds"""
+    global _models_cache
+    
+    with _models_cache_lock:
+        fetched_at, models = _models_cache
+        if not force_refresh and models and time.monotonic() - fetched_at < MODELS_CACHE_TTL:
+            return models
     
     try:
-        url = "https://api.together.xyz/v1/models"
-        headers = {"Authorization": f"Bearer {api_key}"}
-        response = requests.get(url, headers=headers, timeout=10)
+        url = f"{API_BASE}/models"
+        headers = {"Authorization": f"Bearer {_get_api_key()}"}
+        response = _session.get(url, headers=headers, timeout=10)
         
         if response.status_code == 200:
             models_data = response.json()
-            return [model.get('id') for model in models_data.get('data', [])]
+            models = [model.get('id') for model in models_data.get('data', [])]
+            with _models_cache_lock:
+                _models_cache = (time.monotonic(), models)
+            return models
         else:
-            print(f"API connectivity test failed: {response.status_code}")
+            logger.warning("API connectivity test failed: %s", response.status_code)
             return []
             
     except Exception as e:
-        print(f"API connectivity test error: {e}")
+        logger.warning("API connectivity test error: %s", e)
         return []
 
 if __name__ == "__main__":
@@ -193,7 +619,7 @@ if __name__ == "__main__":
     test_prompt = "What is electricity?"
     print("🧪 Testing generate function...")
     result = generate(test_prompt)
-    print(f"📝 Result: {result}")
+    print(f"📝 Result ({result.status}, {result.model}): {result.text}")
     
     # Test API connectivity
     print("\n🔗 Testing API connectivity...")
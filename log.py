@@ -0,0 +1,67 @@
+import atexit
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Pass as ``extra=SAMPLED`` on per-request messages; only LOG_SAMPLE_RATE of
+# them are kept. Warnings and errors are never sampled away.
+SAMPLED = {"sampled": True}
+
+_listener: Optional[QueueListener] = None
+_config = None
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+def configure_logging(level: Optional[str] = None, sample_rate: Optional[float] = None) -> None:
+    """Route all logging through a background thread so request threads never block on I/O.
+
+    ``level`` defaults to LOG_LEVEL (INFO) and ``sample_rate`` to LOG_SAMPLE_RATE
+    (0.01, i.e. one in a hundred per-request messages).
+    """
+    global _listener, _config
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    sample_rate = sample_rate if sample_rate is not None else float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+    _config = (level, sample_rate)
+
+    if _listener is not None:
+        _listener.stop()
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    records = queue.SimpleQueue()
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+    handler = QueueHandler(records)
+    # Filter before enqueueing so dropped records cost nothing beyond the check
+    handler.addFilter(SamplingFilter(sample_rate))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    for noisy in ("urllib3", "werkzeug"):
+        logging.getLogger(noisy).setLevel(max(logging.WARNING, root.level))
+
+def _stop() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+def _after_fork() -> None:
+    """The listener thread does not survive fork (e.g. gunicorn preload); start a fresh one"""
+    global _listener
+    if _config is not None:
+        _listener = None
+        configure_logging(*_config)
+
+atexit.register(_stop)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
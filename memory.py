@@ -1,63 +1,908 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
-from typing import List, Tuple, Optional
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple, Optional
+import metrics
+from log import SAMPLED
+from rerank import Reranker
+from responses import ResponseStore
+from storage import EncoderMismatch, StorageBackend, StoreRewritten, open_store, read_store_meta
+from vector_index import VectorIndex
+from encoder import BatchingEncoder
+from eviction import EntryStats, get_policy
+from rwlock import ReadWriteLock
+from write_behind import PendingWrite, WriteBehind
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Sentence punctuation and quotes; symbols that change meaning ("c++", "c#", "5-3") are kept
+_PUNCTUATION = re.compile(r"[.,!?;:'\"()\[\]{}\u2018\u2019\u201c\u201d\u00ab\u00bb\u00bf\u00a1\u2026]")
+
+def normalize_query(query: str) -> str:
+    """Exact-match key: case, whitespace and sentence punctuation folded away"""
+    text = _PUNCTUATION.sub(" ", unicodedata.normalize("NFKC", query).casefold())
+    return " ".join(text.split())
+
+@dataclass
+class SearchResult:
+    """Outcome of one cache lookup; ``response`` is None on a miss"""
+
+    response: Optional[str] = None
+    # Cached query of the chosen candidate (the nearest one on a miss)
+    query: Optional[str] = None
+    # Cosine similarity of that candidate
+    score: float = 0.0
+    # Reranker score of that candidate, when re-ranking ran
+    rerank_score: Optional[float] = None
+    # Lead of the chosen candidate's final score over the best candidate with a
+    # different response; None when no such runner-up was retrieved
+    margin: Optional[float] = None
+    # Live candidates considered
+    candidates: int = 0
+    # Lookup tier that answered: "exact" (normalized text) or "semantic" (embedding search)
+    tier: Optional[str] = None
+
+    @property
+    def hit(self) -> bool:
+        return self.response is not None
 
 class SemanticMemory:
-    def __init__(self, similarity_threshold: float = 0.7):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+    def __init__(self, similarity_threshold: float = 0.7, persist_dir: Optional[str] = None,
+                 vector_dtype: str = "float32", index_type: str = "flat", migrate_at: int = 10000,
+                 nprobe: int = 16, ef_search: int = 64, encoder: Optional[BatchingEncoder] = None,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None, eviction_policy: str = "lru",
+                 compact_ratio: float = 0.25, sync_interval: float = 1.0, reembed_on_mismatch: bool = False,
+                 name: str = "default", top_k: int = 1, reranker: Optional[Reranker] = None,
+                 rerank_weight: float = 0.3, rerank_budget_ms: float = 20.0, min_margin: float = 0.0,
+                 response_compression: str = "none", compress_min_bytes: int = 1024,
+                 storage_backend: str = "disk", exact_match: bool = True, write_behind: bool = False,
+                 write_batch: int = 64, write_max_wait_ms: float = 50.0,
+                 snapshot_interval: Optional[float] = None):
+        # The encoder can be shared between memories and outlives clear(); it owns
+        # the embedding model and loads it lazily on first use
+        self.encoder = encoder or BatchingEncoder()
+        # Partition name, used as the metrics label (see namespaces.NamespacedMemory)
+        self.name = name
         self.similarity_threshold = similarity_threshold
-        self.embeddings = []
-        self.responses = []
+
+        # Top-k lookup: retrieve top_k candidates, optionally blend in a reranker
+        # score (weight rerank_weight, skipped past rerank_budget_ms), and refuse
+        # the hit unless it leads the best different answer by min_margin
+        self.top_k = max(1, top_k)
+        self.reranker = reranker
+        self.rerank_weight = rerank_weight
+        self.rerank_budget = rerank_budget_ms / 1000.0
+        self.min_margin = min_margin
+
+        # Row i's response is response_keys[i] in a content-addressed store, so
+        # repeated answers are held once (and large ones optionally compressed)
+        self.response_store = ResponseStore(response_compression, compress_min_bytes)
+        self.response_keys = []
         self.queries = []
-        
-        # Initialize FAISS index
-        self.dimension = 384  # all-MiniLM-L6-v2 embedding dimension
-        self.index = faiss.IndexFlatIP(self.dimension)  # Inner product for cosine similarity
-        
-    def _normalize_embedding(self, embedding: np.ndarray) -> np.ndarray:
-        """Normalize embedding for cosine similarity with FAISS"""
-        return embedding / np.linalg.norm(embedding)
-    
-    def search(self, query: str) -> Optional[str]:
-        """Search for cached response based on semantic similarity"""
-        if len(self.responses) == 0:
-            return None
-            
+
+        # Tier 0: normalized query text -> newest live row with it, answered
+        # without encoding or an index search
+        self.exact_match = exact_match
+        self._exact: Dict[str, int] = {}
+
+        # Capacity bounds; None means unbounded. Evicted rows become tombstones
+        # and are dropped in bulk once they exceed compact_ratio of the index.
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.eviction_policy = get_policy(eviction_policy)
+        self.compact_ratio = compact_ratio
+        self.entry_stats = EntryStats()
+        self.evictions = 0
+        self.hits = 0
+        self.misses = 0
+        self.tier_hits = {"exact": 0, "semantic": 0}
+        # Lookups run concurrently under the read lock but still bump hit
+        # counters and LRU/LFU columns; this leaf lock serializes just that
+        self._stats_lock = threading.Lock()
+        self._next_expiry_sweep = 0.0
+
+        # Searches share the read lock; store/evict/compact/sync take the write lock.
+        # With a shared persist_dir, other processes' rows are picked up every
+        # sync_interval seconds.
+        self._lock = ReadWriteLock()
+        self.sync_interval = sync_interval
+        self._next_sync = 0.0
+
+        self.dimension = self.encoder.dimension
+
+        # Optional persistent store: "disk" is this host's append-only files in
+        # persist_dir (vectors memory-mapped on reopen); "sqlite" is a database
+        # at persist_dir that several nodes share, this partition's rows keyed by
+        # name. A store written by another encoder is refused, or re-embedded on request.
+        self.storage_backend = storage_backend
+        self.disk: Optional[StorageBackend] = None
+        if persist_dir:
+            try:
+                self.disk = open_store(storage_backend, persist_dir, self.dimension, vector_dtype,
+                                       encoder=self.encoder.fingerprint, namespace=name)
+            except EncoderMismatch:
+                if not reembed_on_mismatch:
+                    raise
+                self.disk = self._reembed_store(persist_dir, vector_dtype)
+
+        # Inner product over normalized vectors == cosine similarity. Starts flat and
+        # migrates to an approximate index once migrate_at entries have accumulated.
+        self.index = VectorIndex(
+            self.dimension,
+            index_type=index_type,
+            migrate_at=migrate_at,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            vector_source=self.disk.vectors if self.disk is not None else None
+        )
+        if self.disk is not None:
+            self._load_from_disk()
+
+        # Write-behind: store_async() queues the pair and a worker embeds,
+        # deduplicates, persists and indexes queued pairs in batches. The same
+        # worker snapshots the index every snapshot_interval seconds (persisted
+        # memories only) so a restart does not have to rebuild it.
+        self.write_behind = write_behind
+        self.write_duplicates = 0
+        self._clear_epoch = 0
+        self._snapshot_key = None
+        if self.disk is None:
+            snapshot_interval = None
+        self.writer: Optional[WriteBehind] = None
+        if write_behind or snapshot_interval:
+            self.writer = WriteBehind(self._store_batch, max_batch=write_batch, max_wait_ms=write_max_wait_ms,
+                                      snapshot=self.snapshot, snapshot_interval=snapshot_interval, name=name)
+            if snapshot_interval:
+                self.writer.start()
+
+    def _load_from_disk(self) -> None:
+        """Rebuild the in-memory index from the persisted store without re-encoding"""
+        if not self.disk.exists():
+            # Created by the first write; another process's rows arrive through the sync
+            return
+        with self.disk.locked():
+            vectors, entries, deleted = self.disk.load()
+            snapshot = self._read_snapshot(entries)
+            if snapshot is None:
+                self._ingest(vectors, entries, deleted)
+            else:
+                # The snapshot's index already holds its rows; only the tail is added
+                rows = snapshot["rows"]
+                self.index.restore(snapshot["index"], snapshot["active_type"], snapshot["trained_size"])
+                self._ingest(vectors, entries, deleted, indexed=rows)
+                self.entry_stats.hits[:rows] = snapshot["hits"]
+                self.entry_stats.last_access[:rows] = snapshot["last_access"]
+                logger.info("Restored %s index over %d rows from snapshot", snapshot["active_type"], rows)
+            self._enforce_limits()
+        logger.info("Loaded %d cached responses from %s", self.entry_stats.live_count, self.disk.path)
+
+    def _reembed_store(self, persist_dir: str, vector_dtype: str, batch_size: int = 256) -> StorageBackend:
+        """Re-encode every live query in an incompatible store with our encoder"""
+        meta = read_store_meta(self.storage_backend, persist_dir, self.name)
+        disk = open_store(self.storage_backend, persist_dir, meta["dimension"], meta.get("dtype", vector_dtype),
+                          encoder=meta.get("encoder"), namespace=self.name)
+        with disk.locked():
+            _, entries, deleted = disk.load()
+            entries = [entry for i, entry in enumerate(entries) if i not in deleted]
+            logger.warning("Re-embedding %d cached queries from %s with %s",
+                           len(entries), meta.get("encoder"), self.encoder.fingerprint)
+            vectors = self._encode_all([entry["q"] for entry in entries], batch_size)
+            disk.rewrite(vectors, entries, dimension=self.dimension, encoder=self.encoder.fingerprint)
+        return disk
+
+    def _ingest(self, vectors: np.ndarray, entries: List[dict], deleted, indexed: int = 0) -> None:
+        """Add rows read from the persistent store (ours on load, other processes' or nodes' on sync).
+
+        The first ``indexed`` rows are already in the index (restored from a snapshot).
+        """
+        now = time.time()
+        for entry in entries:
+            key, new = self.response_store.add(entry["r"])
+            self._index_exact(entry["q"], len(self.queries))
+            self.queries.append(entry["q"])
+            self.response_keys.append(key)
+            self.entry_stats.append(entry.get("t", now), entry.get("e"), self._entry_bytes(entry["q"], key, new))
+        if len(vectors) > indexed:
+            self.index.add(vectors[indexed:])
+        if deleted:
+            self._release(self.entry_stats.kill(np.fromiter(deleted, dtype=np.int64)))
+
+    def _disk_locked(self):
+        """Inter-process writer lock for the shared store, if persisted"""
+        return self.disk.locked() if self.disk is not None else nullcontext()
+
+    def sync(self) -> None:
+        """Pick up entries and evictions other processes (or nodes) wrote to the shared store"""
+        if self.disk is None:
+            return
+        with self._lock.write(), self.disk.locked():
+            self._sync_locked()
+
+    def _sync_locked(self) -> None:
+        try:
+            vectors, entries, deleted = self.disk.changes()
+        except StoreRewritten:
+            # Another process compacted or cleared the store; start over from disk
+            self._reset_in_memory()
+            vectors, entries, deleted = self.disk.load()
+        self._ingest(vectors, entries, deleted)
+
+    def _maybe_sync(self) -> None:
+        if self.disk is None or time.monotonic() < self._next_sync:
+            return
+        self._next_sync = time.monotonic() + self.sync_interval
+        if self.disk.has_changes():
+            self.sync()
+
+    def _entry_bytes(self, query: str, key: str, new: bool) -> int:
+        """Approximate footprint of one entry: query text, its vector and response key.
+
+        A shared response's stored (possibly compressed) size is charged to the
+        entry that introduced it.
+        """
+        response_bytes = self.response_store.stored_size(key) if new else 0
+        return len(query.encode("utf-8")) + len(key) + response_bytes + self.dimension * 4
+
+    def _release(self, ids: np.ndarray) -> None:
+        """Drop dead rows' references to their responses and their exact-match keys"""
+        for i in ids:
+            self.response_store.release(self.response_keys[i])
+            if self.exact_match:
+                normalized = normalize_query(self.queries[i])
+                if self._exact.get(normalized) == i:
+                    del self._exact[normalized]
+
+    def _index_exact(self, query: str, idx: int) -> None:
+        if self.exact_match:
+            self._exact[normalize_query(query)] = idx
+
+    def encode(self, query: str) -> np.ndarray:
+        """Normalized query embedding, reusable across search() and store()"""
+        return self.encoder.encode(query)
+
+    def encode_many(self, queries: List[str]) -> np.ndarray:
+        """Normalized embeddings for a batch of queries in one forward pass"""
+        return self.encoder.encode_many(queries)
+
+    def _encode_all(self, queries: List[str], batch_size: int = 256) -> np.ndarray:
+        """encode_many() over any number of queries, ``batch_size`` per forward pass"""
+        vectors = np.empty((len(queries), self.dimension), dtype=np.float32)
+        for start in range(0, len(queries), batch_size):
+            vectors[start:start + batch_size] = self.encoder.encode_many(queries[start:start + batch_size])
+        return vectors
+
+    def search(self, query: str, embedding: Optional[np.ndarray] = None,
+               record_lookup: bool = True) -> Optional[str]:
+        """Search for cached response based on semantic similarity.
+
+        ``record_lookup=False`` keeps internal re-checks out of the hit/miss counters.
+        """
+        return self.search_detailed(query, embedding, record_lookup).response
+
+    def search_exact(self, query: str, record_lookup: bool = True) -> SearchResult:
+        """Tier 0 only: a live entry whose normalized query equals this one.
+
+        Needs no embedding, so callers try it before encoding. Only hits are
+        recorded; a miss here is not a cache miss until the semantic tier misses too.
+        """
+        if not self.exact_match:
+            return SearchResult()
+        self._maybe_sync()
+        normalized = normalize_query(query)
+        with self._lock.read():
+            idx = self._exact.get(normalized)
+            if idx is None or not self.entry_stats.alive[idx]:
+                return self._search_pending(normalized, record_lookup)
+            now = time.time()
+            if self.entry_stats.expires[idx] <= now:
+                # Left for the semantic tier, which evicts expired rows
+                return SearchResult()
+            result = SearchResult(
+                response=self.response_store.get(self.response_keys[idx]),
+                query=self.queries[idx],
+                score=1.0,
+                candidates=1,
+                tier="exact"
+            )
+            self._touch(idx, now)
+            if record_lookup:
+                self._record_lookup(True, "exact")
+        logger.info("Exact hit for query: '%s'", result.query, extra=SAMPLED)
+        return result
+
+    def _search_pending(self, normalized: str, record_lookup: bool) -> SearchResult:
+        """Read-your-writes for a store_async() the worker has not written yet"""
+        write = self.writer.pending(normalized) if self.write_behind else None
+        if write is None:
+            return SearchResult()
+        if record_lookup:
+            self._record_lookup(True, "exact")
+        logger.info("Exact hit on queued write for query: '%s'", write.query, extra=SAMPLED)
+        return SearchResult(response=write.response, query=write.query, score=1.0, candidates=1, tier="exact")
+
+    def search_detailed(self, query: str, embedding: Optional[np.ndarray] = None,
+                        record_lookup: bool = True, exact: Optional[SearchResult] = None) -> SearchResult:
+        """Like search(), but with the similarity score, runner-up margin and answering tier.
+
+        ``exact`` is the caller's search_exact() result for this query, if it
+        already tried tier 0 (e.g. before deciding to encode); it is not repeated.
+        """
+        if exact is None:
+            exact = self.search_exact(query, record_lookup)
+        if exact.hit:
+            return exact
+        self._maybe_sync()
+        if self.entry_stats.live_count == 0:
+            if record_lookup:
+                self._record_lookup(False)
+            return SearchResult()
+
         # Get query embedding
-        query_embedding = self.model.encode([query])[0]
-        query_embedding = self._normalize_embedding(query_embedding)
-        
-        # Search in FAISS index
-        scores, indices = self.index.search(query_embedding.reshape(1, -1), 1)
-        
-        if scores[0][0] >= self.similarity_threshold:
-            idx = indices[0][0]
-            print(f"Cache hit! Similarity: {scores[0][0]:.3f} for query: '{self.queries[idx]}'")
-            return self.responses[idx]
-        
-        return None
-    
-    def store(self, query: str, response: str) -> None:
+        query_embedding = embedding if embedding is not None else self.encode(query)
+        return self._lookup([query], np.reshape(query_embedding, (1, -1)), record_lookup)[0]
+
+    def search_many(self, queries: List[str], embeddings: Optional[np.ndarray] = None,
+                    record_lookup: bool = True) -> List[Optional[str]]:
+        """Look up a batch of queries with one index search; None marks a miss"""
+        return [result.response for result in self.search_many_detailed(queries, embeddings, record_lookup)]
+
+    def search_many_detailed(self, queries: List[str], embeddings: Optional[np.ndarray] = None,
+                             record_lookup: bool = True,
+                             exact: Optional[List[SearchResult]] = None) -> List[SearchResult]:
+        """Batch search_detailed(); only exact-tier misses are encoded (if ``embeddings`` is None) and searched"""
+        results = list(exact) if exact is not None else [self.search_exact(query, record_lookup) for query in queries]
+        pending = [i for i, result in enumerate(results) if not result.hit]
+        self._maybe_sync()
+        if self.entry_stats.live_count == 0 or not pending:
+            if record_lookup:
+                for _ in pending:
+                    self._record_lookup(False)
+            return results
+
+        pending_queries = [queries[i] for i in pending]
+        pending_embeddings = self.encode_many(pending_queries) if embeddings is None else embeddings[pending]
+        for i, result in zip(pending, self._lookup(pending_queries, pending_embeddings, record_lookup)):
+            results[i] = result
+        return results
+
+    def _lookup(self, queries: List[str], embeddings: np.ndarray, record_lookup: bool) -> List[SearchResult]:
+        candidates, expired = [], []
+        with self._lock.read():
+            # Over-fetch a little while tombstones are present so dead nearest
+            # neighbours do not hide live ones right behind them
+            k = self.top_k if self.entry_stats.tombstones == 0 else min(self.index.ntotal, self.top_k + 16)
+
+            # Search in FAISS index
+            with metrics.SEARCH_SECONDS.time():
+                scores, indices = self.index.search(embeddings, k)
+
+            now = time.time()
+            for row in range(len(queries)):
+                if indices[row][0] >= 0:
+                    metrics.SIMILARITY.observe(float(scores[row][0]), namespace=self.name)
+                # (row id, similarity, cached query, response) of up to top_k live entries
+                live = []
+                for score, idx in zip(scores[row], indices[row]):
+                    if idx < 0 or len(live) == self.top_k:
+                        break
+                    if not self.entry_stats.alive[idx]:
+                        continue
+                    if self.entry_stats.expires[idx] <= now:
+                        expired.append((idx, self.queries[idx]))
+                        continue
+                    live.append((int(idx), float(score), self.queries[idx], self.response_keys[idx]))
+                candidates.append(live)
+
+        # Re-ranking may run a model, so it happens outside the lock
+        results, chosen = self._choose(queries, candidates)
+
+        with self._lock.read():
+            now = time.time()
+            for result, (idx, key) in zip(results, chosen):
+                # An eviction since the search may have freed the response; that is a miss
+                if key is not None and key in self.response_store:
+                    result.response = self.response_store.get(key)
+                    result.tier = "semantic"
+                # Rows may have been renumbered by a compaction since the search
+                if result.hit and idx < len(self.queries) and self.queries[idx] == result.query:
+                    self._touch(idx, now)
+                if result.hit:
+                    logger.info("Cache hit! Similarity: %.3f for query: '%s'", result.score, result.query, extra=SAMPLED)
+                if record_lookup:
+                    self._record_lookup(result.hit, result.tier)
+
+        if expired:
+            # Evicting needs the write lock; rows may have been renumbered meanwhile
+            with self._lock.write(), self._disk_locked():
+                stale = [idx for idx, expired_query in expired
+                         if idx < len(self.queries) and self.queries[idx] == expired_query]
+                if stale:
+                    self._evict(np.unique(stale))
+
+        return results
+
+    def _choose(self, queries: List[str], candidates: List[list]) -> Tuple[List[SearchResult], List[int]]:
+        """Pick each row's answer from its candidates; returns (results, chosen (row id, response key)).
+
+        The key is None when the row misses; responses are only fetched for hits.
+        """
+        rerank_scores = self._rerank(queries, candidates)
+        results, chosen = [], []
+        for live, extra in zip(candidates, rerank_scores):
+            if not live:
+                results.append(SearchResult())
+                chosen.append((-1, None))
+                continue
+
+            similarity = np.array([c[1] for c in live], dtype=np.float32)
+            final = similarity if extra is None else (1.0 - self.rerank_weight) * similarity + self.rerank_weight * extra
+            eligible = np.flatnonzero(similarity >= self.similarity_threshold)
+            best = int(eligible[np.argmax(final[eligible])]) if len(eligible) else 0
+            # Near-duplicates of the same answer are not competition
+            rivals = [final[i] for i, c in enumerate(live) if c[3] != live[best][3]]
+            margin = float(final[best] - max(rivals)) if rivals else None
+
+            idx, score, cached_query, key = live[best]
+            result = SearchResult(
+                query=cached_query,
+                score=score,
+                rerank_score=float(extra[best]) if extra is not None else None,
+                margin=margin,
+                candidates=len(live)
+            )
+            if len(eligible) and margin is not None and margin < self.min_margin:
+                metrics.MARGIN_REJECTIONS.inc(namespace=self.name)
+                logger.info("Refused ambiguous hit (margin %.3f) for query: '%s'", margin, cached_query, extra=SAMPLED)
+                key = None
+            elif not len(eligible):
+                key = None
+            results.append(result)
+            chosen.append((idx, key))
+        return results, chosen
+
+    def _rerank(self, queries: List[str], candidates: List[list]) -> List[Optional[np.ndarray]]:
+        """Reranker scores per row, or None where it did not run (one candidate, no reranker, over budget).
+
+        Over budget, the reranker's cheaper fallback scores are used if it has any.
+        """
+        rows = [row for row, live in enumerate(candidates) if len(live) > 1]
+        if self.reranker is None or not rows:
+            return [None] * len(candidates)
+
+        pairs = [(queries[row], c[2]) for row in rows for c in candidates[row]]
+        try:
+            with metrics.RERANK_SECONDS.time():
+                scores = self.reranker.score_within(pairs, self.rerank_budget)
+        except TimeoutError as e:
+            metrics.RERANKS.inc(namespace=self.name, outcome="timeout")
+            scores = getattr(e, "fallback", None)
+            if scores is None:
+                return [None] * len(candidates)
+        except Exception as e:
+            logger.warning("Re-ranking failed, keeping vector order: %s", e)
+            metrics.RERANKS.inc(namespace=self.name, outcome="error")
+            return [None] * len(candidates)
+        else:
+            metrics.RERANKS.inc(namespace=self.name, outcome="applied")
+
+        per_row: List[Optional[np.ndarray]] = [None] * len(candidates)
+        offset = 0
+        for row in rows:
+            per_row[row] = np.asarray(scores[offset:offset + len(candidates[row])], dtype=np.float32)
+            offset += len(candidates[row])
+        return per_row
+
+    def _touch(self, idx: int, now: float) -> None:
+        with self._stats_lock:
+            self.entry_stats.touch(idx, now)
+
+    def _record_lookup(self, hit: bool, tier: Optional[str] = None) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+                self.tier_hits[tier] += 1
+            else:
+                self.misses += 1
+        if hit:
+            metrics.TIER_HITS.inc(namespace=self.name, tier=tier)
+        metrics.LOOKUPS.inc(namespace=self.name, result="hit" if hit else "miss")
+
+    def store(self, query: str, response: str, embedding: Optional[np.ndarray] = None,
+              ttl_seconds: Optional[float] = None) -> None:
         """Store query-response pair with embedding"""
-        # Get and normalize embedding
-        embedding = self.model.encode([query])[0]
-        embedding = self._normalize_embedding(embedding)
-        
-        # Store in memory
-        self.embeddings.append(embedding)
-        self.responses.append(response)
-        self.queries.append(query)
-        
+        # Reuse the embedding computed for search() when the caller has one
+        if embedding is None:
+            embedding = self.encode(query)
+
+        start = time.perf_counter()
+        with self._lock.write(), self._disk_locked():
+            if self.disk is not None:
+                # Other processes' rows come first so row ids stay aligned with the file
+                self._sync_locked()
+            self._append_locked([query], [response], np.reshape(embedding, (1, -1)), [self._expiry(ttl_seconds)])
+        metrics.STORE_SECONDS.observe(time.perf_counter() - start)
+        logger.info("Stored new entry. Total cached responses: %d", self.entry_stats.live_count, extra=SAMPLED)
+
+    def store_many(self, queries: List[str], responses: List[str], embeddings: Optional[np.ndarray] = None,
+                   ttl_seconds: Optional[float] = None, skip_existing: bool = False) -> int:
+        """Store many pairs with one encode pass, one store append and one index add.
+
+        ``skip_existing`` drops queries whose normalized text is already cached
+        (or repeated earlier in the call) before encoding, so re-running an
+        import does not duplicate it. Returns the number of entries stored.
+        """
+        if len(queries) != len(responses) or (embeddings is not None and len(embeddings) != len(queries)):
+            raise ValueError("queries, responses and embeddings must have the same length")
+        keep = list(range(len(queries)))
+        if skip_existing:
+            with self._lock.read():
+                keep, seen = [], set()
+                for i, query in enumerate(queries):
+                    normalized = normalize_query(query)
+                    idx = self._exact.get(normalized)
+                    if normalized in seen or (idx is not None and self.entry_stats.alive[idx]):
+                        continue
+                    seen.add(normalized)
+                    keep.append(i)
+        if not keep:
+            return 0
+
+        queries = [queries[i] for i in keep]
+        responses = [responses[i] for i in keep]
+        if embeddings is None:
+            embeddings = self._encode_all(queries)
+        else:
+            embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)[keep]
+
+        start = time.perf_counter()
+        with self._lock.write(), self._disk_locked():
+            if self.disk is not None:
+                self._sync_locked()
+            self._append_locked(queries, responses, embeddings, [self._expiry(ttl_seconds)] * len(queries))
+        metrics.STORE_SECONDS.observe(time.perf_counter() - start)
+        logger.info("Stored %d entries in one batch. Total cached responses: %d",
+                    len(queries), self.entry_stats.live_count)
+        return len(queries)
+
+    def export_entries(self, with_vectors: bool = False, chunk_size: int = 1000) -> Iterator[dict]:
+        """Live entries in row order as {"query", "response", "created"[, "expires"][, "embedding"]}.
+
+        Rows are listed under the read lock; responses are fetched ``chunk_size``
+        at a time, skipping entries evicted in between.
+        """
+        with self._lock.read():
+            stats = self.entry_stats
+            now = time.time()
+            live = np.flatnonzero(stats.alive[:stats.size] & (stats.expires[:stats.size] > now))
+            queries = [self.queries[i] for i in live]
+            keys = [self.response_keys[i] for i in live]
+            created = stats.created[live].copy()
+            expires = stats.expires[live].copy()
+            vectors = self.index.get_vectors()[live] if with_vectors else None
+
+        for start in range(0, len(live), chunk_size):
+            with self._lock.read():
+                responses = [
+                    self.response_store.get(key) if key in self.response_store else None
+                    for key in keys[start:start + chunk_size]
+                ]
+            for j, response in enumerate(responses, start):
+                if response is None:
+                    continue
+                entry = {"query": queries[j], "response": response, "created": float(created[j])}
+                if np.isfinite(expires[j]):
+                    entry["expires"] = float(expires[j])
+                if vectors is not None:
+                    entry["embedding"] = vectors[j].tolist()
+                yield entry
+
+    def store_async(self, query: str, response: str, embedding: Optional[np.ndarray] = None,
+                    ttl_seconds: Optional[float] = None) -> None:
+        """store() on the write-behind worker, or inline when write-behind is off.
+
+        Until the worker writes it, the pair is only visible to exact-tier lookups.
+        """
+        if not self.write_behind:
+            self.store(query, response, embedding=embedding, ttl_seconds=ttl_seconds)
+            return
+        self.writer.submit(PendingWrite(query, response, embedding, ttl_seconds, normalize_query(query),
+                                        self._clear_epoch))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait for queued store_async() writes; False if some are still queued after ``timeout``"""
+        return self.writer.flush(timeout) if self.writer is not None else True
+
+    def _expiry(self, ttl_seconds: Optional[float]) -> Optional[float]:
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        return time.time() + ttl if ttl is not None else None
+
+    def _store_batch(self, writes: List[PendingWrite]) -> None:
+        """Write-behind drain: embed, drop duplicate concurrent misses, store the rest at once"""
+        start = time.perf_counter()
+        missing = [i for i, write in enumerate(writes) if write.embedding is None]
+        if missing:
+            encoded = self.encode_many([writes[i].query for i in missing])
+            for i, embedding in zip(missing, encoded):
+                writes[i].embedding = embedding
+        embeddings = np.vstack([np.reshape(write.embedding, (1, -1)) for write in writes]).astype(np.float32)
+
+        # Within the batch the first of several near-identical misses wins
+        keep, seen = [], set()
+        for i, write in enumerate(writes):
+            if write.key in seen or (keep and float(np.max(embeddings[keep] @ embeddings[i])) >= self.similarity_threshold):
+                continue
+            keep.append(i)
+            seen.add(write.key)
+
+        with self._lock.write(), self._disk_locked():
+            # Submitted before a clear(), possibly already taken off the queue by then
+            current = [i for i, write in enumerate(writes) if write.epoch == self._clear_epoch]
+            if not current:
+                return
+            if self.disk is not None:
+                self._sync_locked()
+            # ...and so does an entry stored meanwhile (by a sync store or another node)
+            keep = [i for i in keep if writes[i].epoch == self._clear_epoch
+                    and not self._has_live_duplicate(writes[i].key, embeddings[i])]
+            self.write_duplicates += len(current) - len(keep)
+            if keep:
+                self._append_locked(
+                    [writes[i].query for i in keep],
+                    [writes[i].response for i in keep],
+                    embeddings[keep],
+                    [self._expiry(writes[i].ttl_seconds) for i in keep]
+                )
+        metrics.STORE_SECONDS.observe(time.perf_counter() - start)
+        logger.info("Stored %d of %d queued entries. Total cached responses: %d",
+                    len(keep), len(writes), self.entry_stats.live_count, extra=SAMPLED)
+
+    def _has_live_duplicate(self, normalized: str, embedding: np.ndarray) -> bool:
+        """A live entry with the same normalized query or at least threshold similarity; call under the lock"""
+        now = time.time()
+        idx = self._exact.get(normalized)
+        if idx is not None and self.entry_stats.alive[idx] and self.entry_stats.expires[idx] > now:
+            return True
+        if self.entry_stats.live_count == 0:
+            return False
+        k = 1 if self.entry_stats.tombstones == 0 else min(self.index.ntotal, 17)
+        scores, indices = self.index.search(np.reshape(embedding, (1, -1)), k)
+        for score, idx in zip(scores[0], indices[0]):
+            if idx < 0 or score < self.similarity_threshold:
+                break
+            if self.entry_stats.alive[idx] and self.entry_stats.expires[idx] > now:
+                return True
+        return False
+
+    def _append_locked(self, queries: List[str], responses: List[str], embeddings: np.ndarray,
+                       expires: List[Optional[float]]) -> None:
+        """Persist and index new rows; call under the write lock, after syncing a shared store"""
+        now = time.time()
+        # Persist first so a crash never leaves an indexed entry that is not on disk
+        if self.disk is not None:
+            entries = []
+            for query, response, expiry in zip(queries, responses, expires):
+                entry = {"q": query, "r": response, "t": now}
+                if expiry is not None:
+                    entry["e"] = expiry
+                entries.append(entry)
+            self.disk.append(embeddings, entries)
+
+        # Store in memory; the FAISS index is the only in-process copy of the vectors
+        for query, response, expiry in zip(queries, responses, expires):
+            key, new = self.response_store.add(response)
+            self.response_keys.append(key)
+            self._index_exact(query, len(self.queries))
+            self.queries.append(query)
+            self.entry_stats.append(now, expiry, self._entry_bytes(query, key, new))
+
         # Add to FAISS index
-        self.index.add(embedding.reshape(1, -1))
-        
-        print(f"Stored new entry. Total cached responses: {len(self.responses)}")
-    
+        self.index.add(embeddings)
+
+        self._enforce_limits()
+
+    def _enforce_limits(self) -> None:
+        """Drop expired entries and evict down to the configured budgets"""
+        stats = self.entry_stats
+        now = time.time()
+        if now >= self._next_expiry_sweep:
+            # Expired entries are also caught lazily by search(); sweep at most once a second
+            self._evict(stats.expired(now))
+            self._next_expiry_sweep = now + 1.0
+
+        over_entries = self.max_entries is not None and stats.live_count > self.max_entries
+        over_bytes = self.max_bytes is not None and stats.live_bytes > self.max_bytes
+        if not (over_entries or over_bytes):
+            return
+
+        # Evict down to ~95% of the budget so selection cost is amortized over many stores
+        count = 0
+        if over_entries:
+            count = stats.live_count - int(self.max_entries * 0.95)
+        if over_bytes:
+            mean_bytes = stats.live_bytes / stats.live_count
+            count = max(count, int((stats.live_bytes - self.max_bytes * 0.95) / mean_bytes) + 1)
+        self._evict(self.eviction_policy.select(stats, count))
+
+        # The mean-size estimate can undershoot; finish off one at a time if still over
+        while self.max_bytes is not None and stats.live_bytes > self.max_bytes and stats.live_count:
+            self._evict(self.eviction_policy.select(stats, 1))
+
+    def _evict(self, ids: np.ndarray) -> None:
+        """Tombstone entries and compact once enough of the index is dead"""
+        ids = self.entry_stats.kill(ids)
+        if len(ids) == 0:
+            return
+        self._release(ids)
+        self.evictions += len(ids)
+        if self.disk is not None:
+            self.disk.delete(ids)
+        if self.entry_stats.tombstones > self.compact_ratio * self.entry_stats.size:
+            self._compact()
+
+    def compact(self) -> None:
+        """Physically drop tombstoned entries from the index, lists and disk store"""
+        with self._lock.write(), self._disk_locked():
+            if self.disk is not None:
+                self._sync_locked()
+            self._compact()
+
+    def _compact(self) -> None:
+        vectors = self.index.get_vectors()
+        keep = self.entry_stats.compact()
+        live_vectors = np.ascontiguousarray(vectors[keep], dtype=np.float32)
+        self.queries = [self.queries[i] for i in keep]
+        self.response_keys = [self.response_keys[i] for i in keep]
+        self._exact.clear()
+        for i, query in enumerate(self.queries):
+            self._index_exact(query, i)
+
+        if self.disk is not None:
+            stats = self.entry_stats
+            entries = []
+            for i, (query, key) in enumerate(zip(self.queries, self.response_keys)):
+                entry = {"q": query, "r": self.response_store.get(key), "t": float(stats.created[i])}
+                if np.isfinite(stats.expires[i]):
+                    entry["e"] = float(stats.expires[i])
+                entries.append(entry)
+            self.disk.rewrite(live_vectors, entries)
+
+        self.index.replace(live_vectors)
+        logger.info("Compacted memory to %d entries", len(keep))
+
+    def clear(self) -> None:
+        """Remove all cached entries, including the persisted store"""
+        with self._lock.write(), self._disk_locked():
+            self._clear_epoch += 1
+            if self.writer is not None:
+                self.writer.discard()
+            self._reset_in_memory()
+            if self.disk is not None:
+                self.disk.clear()
+                self._remove_snapshot()
+
+    def _reset_in_memory(self) -> None:
+        self.index.reset()
+        self.response_store.clear()
+        self.response_keys = []
+        self.queries = []
+        self._exact.clear()
+        self.entry_stats.clear()
+
+    def snapshot(self) -> bool:
+        """Atomically write the index and per-row access stats next to the store.
+
+        The snapshot names the store generation and row count it covers, so a
+        later load restores it and only indexes rows appended after it; one
+        that does not match the store (compacted, cleared, torn) is ignored.
+        Returns False when there is nothing new to write.
+        """
+        if self.disk is None:
+            return False
+        with self._lock.read():
+            rows = self.index.ntotal
+            key = (self.disk.generation, rows, self.entry_stats.tombstones, int(self.entry_stats.hits[:rows].sum()))
+            if key == self._snapshot_key or rows == 0:
+                return False
+            meta = {
+                "version": SNAPSHOT_VERSION,
+                "generation": self.disk.generation,
+                "rows": rows,
+                "last_query": self.queries[rows - 1],
+                "dimension": self.dimension,
+                "encoder": self.encoder.fingerprint,
+                "index_type": self.index.index_type,
+                "active_type": self.index.active_type,
+                "trained_size": self.index.trained_size
+            }
+            arrays = {
+                "index": self.index.serialize(),
+                "hits": self.entry_stats.hits[:rows].copy(),
+                "last_access": self.entry_stats.last_access[:rows].copy()
+            }
+        path = self.disk.snapshot_path
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._snapshot_key = key
+        logger.info("Snapshotted %s index over %d rows to %s", meta["active_type"], rows, path, extra=SAMPLED)
+        return True
+
+    def _read_snapshot(self, entries: List[dict]) -> Optional[dict]:
+        """The snapshot on disk if it matches the rows just loaded, else None"""
+        path = self.disk.snapshot_path
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                snapshot = json.loads(data["meta"].tobytes().decode("utf-8"))
+                snapshot.update(index=data["index"], hits=data["hits"], last_access=data["last_access"])
+        except Exception as e:
+            logger.warning("Ignoring unreadable snapshot %s: %s", path, e)
+            return None
+        rows = snapshot.get("rows", 0)
+        if (snapshot.get("version") != SNAPSHOT_VERSION
+                or snapshot.get("generation") != self.disk.generation
+                or not 0 < rows <= len(entries)
+                or entries[rows - 1]["q"] != snapshot.get("last_query")
+                or snapshot.get("dimension") != self.dimension
+                or snapshot.get("encoder") != self.encoder.fingerprint
+                or snapshot.get("index_type") != self.index.index_type):
+            logger.info("Snapshot %s does not match the store, rebuilding the index", path)
+            return None
+        return snapshot
+
+    def _remove_snapshot(self) -> None:
+        self._snapshot_key = None
+        try:
+            os.remove(self.disk.snapshot_path)
+        except FileNotFoundError:
+            pass
+
     def get_stats(self) -> dict:
         """Get memory statistics"""
+        with self._lock.read():
+            return self._stats_locked()
+
+    def _stats_locked(self) -> dict:
         return {
-            "total_entries": len(self.responses),
+            "namespace": self.name,
+            "total_entries": self.entry_stats.live_count,
             "embedding_dimension": self.dimension,
-            "similarity_threshold": self.similarity_threshold
-        }
\ No newline at end of file
+            "similarity_threshold": self.similarity_threshold,
+            "top_k": self.top_k,
+            "reranker": self.reranker.name if self.reranker is not None else None,
+            "min_margin": self.min_margin,
+            "persisted": self.disk is not None,
+            "storage_backend": self.storage_backend if self.disk is not None else None,
+            "memory_bytes": self.entry_stats.live_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "eviction_policy": self.eviction_policy.name,
+            "evictions": self.evictions,
+            "tombstones": self.entry_stats.tombstones,
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "hit_rate": round(self.hits / (self.hits + self.misses), 4) if self.hits + self.misses else 0.0,
+            "hits_by_tier": dict(self.tier_hits),
+            "exact_keys": len(self._exact),
+            "write_behind": self.write_behind,
+            "write_duplicates": self.write_duplicates,
+            **(self.writer.get_stats() if self.writer is not None else {}),
+            **self.response_store.get_stats(),
+            **self.index.get_stats(),
+            **self.encoder.get_stats()
+        }
@@ -0,0 +1,287 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Seconds; spans an encoder cache hit (~50us) up to a timed-out LLM call
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIMILARITY_BUCKETS = tuple(round(0.05 * i, 2) for i in range(-4, 21))
+
+class _Metric:
+    """Base for process-local metrics; values are keyed by a tuple of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def items(self) -> List[Tuple[Tuple[str, ...], float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {_number(v)}" for key, v in self.items()]
+
+class Gauge(_Metric):
+    """Point-in-time value; ``set_function`` computes it at scrape time instead of on the hot path"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, fn: Callable) -> None:
+        """``fn`` returns a number, or a {label-values tuple: number} dict for labelled gauges"""
+        self._function = fn
+
+    def items(self) -> List[Tuple[Tuple[str, ...], float]]:
+        if self._function is not None:
+            value = self._function()
+            return list(value.items()) if isinstance(value, dict) else [((), value)]
+        with self._lock:
+            return list(self._values.items())
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {_number(v)}" for key, v in self.items()]
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; cheap enough to observe on every request"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        # First bucket whose upper bound holds the value; the last slot is +Inf
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels) -> Tuple[List[int], float]:
+        """(per-bucket counts, sum) for one label set"""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return (list(series[0]), series[1]) if series else ([0] * (len(self.buckets) + 1), 0.0)
+
+    def percentile(self, q: float, **labels) -> Optional[float]:
+        """Estimate the q-th percentile by interpolating inside the bucket that holds it"""
+        counts, _ = self.snapshot(**labels)
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank, seen = q / 100.0 * total, 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else min(0.0, self.buckets[0])
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self, scale: float = 1.0, **labels) -> dict:
+        counts, total = self.snapshot(**labels)
+        n = sum(counts)
+        p50, p95 = self.percentile(50, **labels), self.percentile(95, **labels)
+        return {
+            "count": n,
+            "mean": round(total / n * scale, 3) if n else None,
+            "p50": round(p50 * scale, 3) if p50 is not None else None,
+            "p95": round(p95 * scale, 3) if p95 is not None else None
+        }
+
+    def label_sets(self) -> List[Tuple[str, ...]]:
+        with self._lock:
+            return list(self._series)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            series = [(key, list(s[0]), s[1]) for key, s in self._series.items()]
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == math.inf else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+def gauge(name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labels))
+
+def histogram(name: str, help: str, labels: Tuple[str, ...] = (),
+              buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+# Hot-path instruments shared by memory.py, encoder.py, llm.py and app.py.
+# Each gunicorn worker keeps its own values; scrape every worker or sum them.
+ENCODE_SECONDS = histogram("semantic_cache_encode_seconds", "Query embedding latency, including encoder cache hits")
+SEARCH_SECONDS = histogram("semantic_cache_index_search_seconds", "Vector index search latency")
+STORE_SECONDS = histogram("semantic_cache_store_seconds", "SemanticMemory.store latency including the disk append")
+LOOKUPS = counter("semantic_cache_lookups_total", "Cache lookups by namespace and result", ("namespace", "result"))
+TIER_HITS = counter("semantic_cache_tier_hits_total", "Cache hits by namespace and answering tier (exact, semantic)",
+                    ("namespace", "tier"))
+SIMILARITY = histogram(
+    "semantic_cache_similarity", "Best similarity score per lookup", ("namespace",), buckets=SIMILARITY_BUCKETS
+)
+RERANK_SECONDS = histogram("semantic_cache_rerank_seconds", "Re-ranking latency per lookup batch")
+RERANKS = counter("semantic_cache_reranks_total", "Re-rank attempts by outcome (applied, timeout, error)",
+                  ("namespace", "outcome"))
+MARGIN_REJECTIONS = counter(
+    "semantic_cache_margin_rejections_total", "Hits refused because the runner-up was too close", ("namespace",)
+)
+FEEDBACK = counter("semantic_cache_feedback_total", "Hit feedback signals (thumbs_up, thumbs_down, reask)",
+                   ("namespace", "signal"))
+LLM_ATTEMPT_SECONDS = histogram(
+    "llm_attempt_seconds", "Latency of each upstream model attempt by outcome", ("model", "outcome")
+)
+LLM_GENERATIONS = counter(
+    "llm_generations_total", "Generations by status (ok, fallback, negative_cached, incomplete)", ("status",)
+)
+LLM_QUEUE_SECONDS = histogram(
+    "llm_queue_seconds", "Time upstream calls waited for the scheduler by priority", ("priority",)
+)
+LLM_RETRIES = counter("llm_retries_total", "Upstream retries by model and reason (rate_limited, server_error)",
+                      ("model", "reason"))
+LLM_TOKENS = counter("llm_tokens_total", "Tokens reported by the upstream by model, kind (prompt, completion) and priority",
+                     ("model", "kind", "priority"))
+LLM_COST = counter("llm_cost_usd_total", "Estimated upstream spend in USD by model", ("model",))
+CHUNK_LOOKUPS = counter(
+    "semantic_cache_chunk_lookups_total", "Chunks of long agent inputs by namespace and result (hit, miss)",
+    ("namespace", "result")
+)
+REQUEST_SECONDS = histogram("http_request_seconds", "Request latency by endpoint and result", ("endpoint", "result"))
+MEMORY_ENTRIES = gauge("semantic_cache_entries", "Live cached entries", ("namespace",))
+MEMORY_BYTES = gauge("semantic_cache_bytes", "Approximate bytes held by live entries", ("namespace",))
+INDEX_VECTORS = gauge("semantic_cache_index_vectors", "Vectors in the search index, including tombstones", ("namespace",))
+TOMBSTONES = gauge("semantic_cache_tombstones", "Evicted entries awaiting compaction", ("namespace",))
+
+def summary() -> dict:
+    """Digest of the hot-path metrics for /stats (latencies in ms)"""
+    lookups = {}
+    for (namespace, result), count in LOOKUPS.items():
+        lookups.setdefault(namespace, {"hit": 0, "miss": 0})[result] = int(count)
+    hits = sum(counts["hit"] for counts in lookups.values())
+    misses = sum(counts["miss"] for counts in lookups.values())
+    hits_by_tier = {}
+    for (_, tier), count in TIER_HITS.items():
+        hits_by_tier[tier] = hits_by_tier.get(tier, 0) + int(count)
+    models = {}
+    for model, outcome in LLM_ATTEMPT_SECONDS.label_sets():
+        models.setdefault(model, {})[outcome] = LLM_ATTEMPT_SECONDS.summary(scale=1000.0, model=model, outcome=outcome)
+    return {
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "lookups": lookups,
+        "latency_ms": {
+            "encode": ENCODE_SECONDS.summary(scale=1000.0),
+            "index_search": SEARCH_SECONDS.summary(scale=1000.0),
+            "store": STORE_SECONDS.summary(scale=1000.0),
+            "rerank": RERANK_SECONDS.summary(scale=1000.0),
+            "llm_queue": {priority: LLM_QUEUE_SECONDS.summary(scale=1000.0, priority=priority)
+                          for (priority,) in LLM_QUEUE_SECONDS.label_sets()}
+        },
+        "hits_by_tier": hits_by_tier,
+        "margin_rejections": {namespace: int(count) for (namespace,), count in MARGIN_REJECTIONS.items()},
+        "similarity": {namespace: SIMILARITY.summary(namespace=namespace) for (namespace,) in SIMILARITY.label_sets()},
+        "llm_attempts": models,
+        "llm_generations": {status: int(count) for (status,), count in LLM_GENERATIONS.items()},
+        "llm_retries": {f"{model}:{reason}": int(count) for (model, reason), count in LLM_RETRIES.items()},
+        "chunk_lookups": {f"{namespace}:{result}": int(count) for (namespace, result), count in CHUNK_LOOKUPS.items()}
+    }
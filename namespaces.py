@@ -0,0 +1,123 @@
+import logging
+import os
+import re
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+from encoder import BatchingEncoder
+from memory import SemanticMemory
+from sqlite_store import DATABASE_FILE, SQLiteStore
+
+DEFAULT_NAMESPACE = "default"
+NAMESPACE_DIR = "namespaces"
+_VALID_NAME = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+logger = logging.getLogger(__name__)
+
+class NamespacedMemory:
+    """One SemanticMemory partition per namespace (e.g. per agent), sharing one encoder.
+
+    Every partition has its own index, similarity threshold and eviction budget,
+    so lookups only scan their own entries and never hit another namespace's
+    answers. ``defaults`` are SemanticMemory keyword arguments for every
+    partition; ``overrides`` maps a namespace to the arguments it changes.
+
+    When persisted, the default namespace lives directly in ``persist_dir`` (so
+    existing stores keep working) and the others in ``persist_dir/namespaces/<name>``.
+    With ``storage_backend="sqlite"`` every namespace shares ``persist_dir/cache.sqlite3``.
+    """
+
+    def __init__(self, encoder: Optional[BatchingEncoder] = None, persist_dir: Optional[str] = None,
+                 defaults: Optional[dict] = None, overrides: Optional[Dict[str, dict]] = None):
+        self.encoder = encoder or BatchingEncoder()
+        self.persist_dir = persist_dir
+        self.defaults = dict(defaults or {})
+        self.overrides = {name: dict(config) for name, config in (overrides or {}).items()}
+        self._partitions: Dict[str, SemanticMemory] = {}
+        self._lock = threading.Lock()
+
+        # Open configured and previously persisted namespaces up front so their
+        # entries are searchable (and their stats visible) before first use
+        for name in [DEFAULT_NAMESPACE, *self.overrides, *self._persisted_namespaces()]:
+            self.partition(name)
+
+    @property
+    def namespaces(self) -> List[str]:
+        return list(self._partitions)
+
+    def partition(self, namespace: str) -> SemanticMemory:
+        """The memory for ``namespace``, created on first use"""
+        memory = self._partitions.get(namespace)
+        if memory is not None:
+            return memory
+        if not _VALID_NAME.match(namespace):
+            raise ValueError(f"Invalid namespace '{namespace}': use letters, digits, '_', '.' or '-'")
+        with self._lock:
+            if namespace not in self._partitions:
+                config = {**self.defaults, **self.overrides.get(namespace, {})}
+                self._partitions[namespace] = SemanticMemory(
+                    encoder=self.encoder,
+                    persist_dir=self._persist_path(namespace, config.get("storage_backend", "disk")),
+                    name=namespace,
+                    **config
+                )
+                logger.info("Opened cache namespace '%s' (threshold %.2f)",
+                            namespace, self._partitions[namespace].similarity_threshold)
+            return self._partitions[namespace]
+
+    def __contains__(self, namespace: str) -> bool:
+        return namespace in self._partitions
+
+    def encode(self, query: str) -> np.ndarray:
+        """Embed the bare query; the namespace is a key, not part of the text"""
+        return self.encoder.encode(query)
+
+    def search(self, namespace: str, query: str, embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        return self.partition(namespace).search(query, embedding=embedding)
+
+    def store(self, namespace: str, query: str, response: str, embedding: Optional[np.ndarray] = None,
+              ttl_seconds: Optional[float] = None) -> None:
+        self.partition(namespace).store(query, response, embedding=embedding, ttl_seconds=ttl_seconds)
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Clear one namespace, or all of them"""
+        targets = [self.partition(namespace)] if namespace else list(self._partitions.values())
+        for memory in targets:
+            memory.clear()
+
+    def get_stats(self) -> dict:
+        partitions = {name: memory.get_stats() for name, memory in list(self._partitions.items())}
+        return {
+            "total_entries": sum(stats["total_entries"] for stats in partitions.values()),
+            "namespaces": partitions
+        }
+
+    def _persist_path(self, namespace: str, backend: str = "disk") -> Optional[str]:
+        if self.persist_dir is None:
+            return None
+        return persist_path(self.persist_dir, namespace, backend)
+
+    def _persisted_namespaces(self) -> List[str]:
+        if self.persist_dir is None:
+            return []
+        return persisted_namespaces(self.persist_dir, self.defaults.get("storage_backend", "disk"))
+
+def persist_path(persist_dir: str, namespace: str, backend: str = "disk") -> str:
+    """Store location of ``namespace`` under ``persist_dir`` (see NamespacedMemory)"""
+    if backend == "sqlite":
+        return os.path.join(persist_dir, DATABASE_FILE)
+    if namespace == DEFAULT_NAMESPACE:
+        return persist_dir
+    return os.path.join(persist_dir, NAMESPACE_DIR, namespace)
+
+def persisted_namespaces(persist_dir: str, backend: str = "disk") -> List[str]:
+    """Namespaces stored under ``persist_dir``; the disk backend's default namespace (``persist_dir`` itself) is not listed"""
+    if backend == "sqlite":
+        return SQLiteStore.namespaces(persist_path(persist_dir, DEFAULT_NAMESPACE, "sqlite"))
+    root = os.path.join(persist_dir, NAMESPACE_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if _VALID_NAME.match(name) and os.path.exists(os.path.join(root, name, "meta.json"))
+    )
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Replay the request log against a cache to pre-warm it before a node takes traffic.
+
+    python replay.py --log logs --memory-dir memory_store --limit 5000
+    python replay.py --log logs/requests.jsonl.1.gz --dry-run
+
+Logged queries are deduplicated and the most frequent go first; ones that
+only ever ended in an error or a fallback answer are left out. Each namespace
+(or agent) is answered in batches: one encode pass and one index search per
+batch, with the misses sent to the LLM up to ``--concurrency`` at a time and
+stored. ``--dry-run`` only reports how many would already hit. The cache is
+opened with the app's EMBEDDING_* and MEMORY_* settings (see config.py).
+
+app.py runs the same warm-up at start when WARM_FROM_LOG=1, and /ready stays
+503 until it finishes.
+"""
+
+import argparse
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from agent import AGENT_CLASSES, AgentManager, DirectAgent
+from config import encoder_from_env, memories_from_env
+from log import configure_logging
+from namespaces import NamespacedMemory
+from request_log import read_log
+
+logger = logging.getLogger(__name__)
+
+# Logged outcomes whose answer was never cached; replaying them re-sends known failures
+FAILED_RESULTS = ("error", "fallback")
+
+def select_queries(records: Iterable[dict], limit: Optional[int] = None) -> List[Tuple[str, str, int]]:
+    """Distinct (target, query, count) by descending frequency; target is the agent or namespace"""
+    counts = Counter()
+    for record in records:
+        if record.get("result") in FAILED_RESULTS:
+            continue
+        query = (record.get("query") or "").strip()
+        if query:
+            counts[(record.get("agent") or record.get("namespace") or "default", query)] += 1
+    return [(target, query, count) for (target, query), count in counts.most_common(limit)]
+
+def warm(memories: NamespacedMemory, selected: List[Tuple[str, str, int]], agents: Optional[AgentManager] = None,
+         batch_size: int = 64, concurrency: int = 4, dry_run: bool = False) -> Dict[str, int]:
+    """Answer the selected queries through the cache; returns counts by outcome"""
+    agents = agents or AgentManager(memory=memories, max_concurrency=concurrency)
+    by_target: Dict[str, List[str]] = {}
+    for target, query, _ in selected:
+        by_target.setdefault(target, []).append(query)
+
+    outcome = Counter()
+    for target, queries in by_target.items():
+        if target in AGENT_CLASSES:
+            agent = agents.agents[target]
+        else:
+            try:
+                # Warm-up is bulk work, queued behind live traffic like the agents' calls
+                agent = DirectAgent(memories.partition(target), generate_fn=agents._generate)
+            except ValueError as e:
+                logger.warning("Skipping %d queries: %s", len(queries), e)
+                outcome["skipped"] += len(queries)
+                continue
+
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            if dry_run:
+                hits = agent.memory.search_many(batch, record_lookup=False)
+                outcome["hit"] += sum(1 for hit in hits if hit is not None)
+                outcome["miss"] += sum(1 for hit in hits if hit is None)
+                continue
+            for result in agent.process_batch(batch, concurrency):
+                if result.get("error"):
+                    outcome["error"] += 1
+                elif result["is_cache_hit"]:
+                    outcome["hit"] += 1
+                elif result.get("is_fallback"):
+                    outcome["fallback"] += 1
+                else:
+                    outcome["stored"] += 1
+        # Warming is done once the queued writes are searchable
+        agent.memory.flush()
+        logger.info("🔥 Warmed '%s' with %d queries", target, len(queries))
+    return dict(outcome)
+
+def warm_from_log(memories: NamespacedMemory, log_path: str, agents: Optional[AgentManager] = None,
+                  limit: Optional[int] = None, **kwargs) -> Dict[str, int]:
+    selected = select_queries(read_log(log_path), limit)
+    start = time.perf_counter()
+    outcome = warm(memories, selected, agents, **kwargs)
+    logger.info("🔥 Replayed %d distinct queries from %s in %.1fs: %s",
+                len(selected), log_path, time.perf_counter() - start, outcome)
+    return outcome
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Pre-warm the semantic cache from the request log")
+    parser.add_argument("--log", default=os.getenv("REQUEST_LOG_DIR", "logs"), help="log directory or file")
+    parser.add_argument("--memory-dir", default=os.getenv("MEMORY_DIR", "memory_store"),
+                        help="cache to warm; an empty directory starts fresh")
+    parser.add_argument("--limit", type=int, help="replay only the N most frequent queries")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")),
+                        help="concurrent LLM calls")
+    parser.add_argument("--dry-run", action="store_true", help="only count hits, never call the LLM")
+    args = parser.parse_args()
+
+    configure_logging()
+    memories = memories_from_env(encoder_from_env(), persist_dir=args.memory_dir)
+    outcome = warm_from_log(memories, args.log, limit=args.limit, batch_size=args.batch_size,
+                            concurrency=args.concurrency, dry_run=args.dry_run)
+    print(f"✅ {outcome}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import atexit
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import shutil
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Iterator, List, Optional
+import numpy as np
+
+LOG_NAME = "requests"
+
+class _CompressingHandler(RotatingFileHandler):
+    """Size-rotated JSONL whose rotated segments are gzipped; prunes the directory to ``max_files`` segments"""
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, max_files: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.max_files = max_files
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotate
+
+    def doRollover(self):
+        super().doRollover()
+        # Segments of exited workers are never rotated away by their own handler
+        segments = sorted(glob.glob(os.path.join(os.path.dirname(self.baseFilename), f"{LOG_NAME}*.jsonl.*.gz")),
+                          key=os.path.getmtime)
+        for stale in segments[:max(0, len(segments) - self.max_files)]:
+            os.remove(stale)
+
+def _gzip_rotate(source: str, dest: str) -> None:
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+class RequestLog:
+    """Append-only log of served requests for replay (see replay.py).
+
+    One JSON object per line in ``<directory>/requests.jsonl``, rotated at
+    ``max_bytes`` into gzipped segments. Writes go through a background thread,
+    like the application log. A forked worker (gunicorn) writes its own
+    ``requests.<pid>.jsonl`` so processes never rotate each other's files.
+    """
+
+    def __init__(self, directory: Optional[str], max_bytes: int = 64 * 1024 * 1024,
+                 backup_count: int = 10, max_files: int = 50):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_files = max_files
+        self._listener: Optional[QueueListener] = None
+        self._logger = logging.getLogger(f"{__name__}.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._open(f"{LOG_NAME}.jsonl")
+            atexit.register(self.close)
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def enabled(self) -> bool:
+        return self._listener is not None
+
+    def _open(self, filename: str) -> None:
+        output = _CompressingHandler(os.path.join(self.directory, filename), self.max_bytes,
+                                     self.backup_count, self.max_files)
+        output.setFormatter(logging.Formatter("%(message)s"))
+        records = queue.SimpleQueue()
+        self._listener = QueueListener(records, output)
+        self._listener.start()
+        self._logger.handlers = [QueueHandler(records)]
+
+    def _after_fork(self) -> None:
+        # The listener thread did not survive the fork; start one on a per-process file
+        if self._listener is not None:
+            self._open(f"{LOG_NAME}.{os.getpid()}.jsonl")
+
+    def record(self, endpoint: str, namespace: str, query: str, result: str,
+               embedding: Optional[np.ndarray] = None, model: Optional[str] = None,
+               latency_ms: Optional[dict] = None, **extra) -> None:
+        """Log one served query; ``result`` is hit, miss, coalesced, fallback or error"""
+        if self._listener is None:
+            return
+        entry = {
+            "ts": round(time.time(), 3),
+            "endpoint": endpoint,
+            "namespace": namespace,
+            "query": query,
+            "embedding_hash": embedding_hash(embedding) if embedding is not None else None,
+            "result": result,
+            "model": model,
+            "latency_ms": {name: round(ms, 2) for name, ms in (latency_ms or {}).items()},
+            **extra
+        }
+        self._logger.info(json.dumps(entry, ensure_ascii=False))
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
+def embedding_hash(embedding: np.ndarray) -> str:
+    """Short stable id of a vector, to group identical embeddings without storing them"""
+    return hashlib.blake2b(np.ascontiguousarray(embedding, dtype=np.float32).tobytes(), digest_size=8).hexdigest()
+
+def log_files(directory: str) -> List[str]:
+    """Current and rotated log files, oldest first"""
+    paths = glob.glob(os.path.join(directory, f"{LOG_NAME}*.jsonl*"))
+    return sorted(paths, key=os.path.getmtime)
+
+def read_log(path: str) -> Iterator[dict]:
+    """Records from a log directory or a single (optionally gzipped) file, oldest first"""
+    paths = log_files(path) if os.path.isdir(path) else [path]
+    for file_path in paths:
+        opener = gzip.open if file_path.endswith(".gz") else open
+        with opener(file_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line of a live file may be half written
+                    continue
@@ -0,0 +1,116 @@
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+_TOKEN = re.compile(r"\w+")
+
+class RerankTimeout(TimeoutError):
+    """The reranker overran its budget or had no free worker; ``fallback`` holds cheaper scores, if any"""
+
+    def __init__(self, message: str, fallback: Optional[np.ndarray] = None):
+        super().__init__(message)
+        self.fallback = fallback
+
+class Reranker:
+    """Scores (user query, cached query) pairs in [0, 1] to reorder top-k cache candidates"""
+
+    name = "base"
+
+    def score(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        raise NotImplementedError
+
+    def score_within(self, pairs: List[Tuple[str, str]], budget: float) -> np.ndarray:
+        """Scores for ``pairs``, or TimeoutError if they take longer than ``budget`` seconds"""
+        return self.score(pairs)
+
+class LexicalReranker(Reranker):
+    """Word-set Jaccard overlap; microseconds per pair, so it always runs inline.
+
+    Embeddings blur content words ("trip to Paris" vs "trip to Rome"), which
+    exact word overlap catches.
+    """
+
+    name = "lexical"
+
+    def score(self, pairs):
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        for i, (query, candidate) in enumerate(pairs):
+            a, b = _tokens(query), _tokens(candidate)
+            if a or b:
+                scores[i] = len(a & b) / len(a | b)
+        return scores
+
+class CrossEncoderReranker(Reranker):
+    """sentence-transformers CrossEncoder, loaded lazily and run off the request thread.
+
+    At most one batch per worker is scored at a time. A batch that overruns
+    its budget is abandoned (it finishes in the background, holding its
+    worker), and while every worker is busy new batches are not queued at
+    all: both raise RerankTimeout with lexical scores to use instead.
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, max_workers: int = 2):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank")
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self.fallback = LexicalReranker()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                logger.info("Loading cross-encoder %s", self.model_name)
+                self._model = CrossEncoder(self.model_name)
+            return self._model
+
+    def score(self, pairs):
+        logits = np.asarray(self._load().predict(list(pairs)), dtype=np.float32).reshape(len(pairs))
+        if logits.min() < 0.0 or logits.max() > 1.0:
+            # Relevance logits; squash so scores blend with cosine similarity
+            logits = 1.0 / (1.0 + np.exp(-logits))
+        return logits
+
+    def score_within(self, pairs, budget):
+        # Abandoned batches must not pile up in the pool's queue behind each other
+        if not self._slots.acquire(blocking=False):
+            raise RerankTimeout(f"cross-encoder busy, {len(pairs)} pairs ranked lexically", self.fallback.score(pairs))
+        future = self._pool.submit(self._score_in_slot, pairs)
+        try:
+            return future.result(timeout=budget)
+        except FutureTimeout:
+            if future.cancel():
+                self._slots.release()
+            # Only the builtin TimeoutError on 3.11+; normalize for callers
+            raise RerankTimeout(f"cross-encoder exceeded {budget * 1000:.0f}ms for {len(pairs)} pairs",
+                                self.fallback.score(pairs))
+
+    def _score_in_slot(self, pairs):
+        try:
+            return self.score(pairs)
+        finally:
+            self._slots.release()
+
+RERANKERS = {reranker.name: reranker for reranker in (LexicalReranker, CrossEncoderReranker)}
+
+def get_reranker(name: Optional[str], model_name: Optional[str] = None) -> Optional[Reranker]:
+    """Reranker by name; "none" (or empty) disables re-ranking"""
+    if not name or name == "none":
+        return None
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown reranker '{name}', expected one of {['none', *sorted(RERANKERS)]}")
+    if name == CrossEncoderReranker.name and model_name:
+        return CrossEncoderReranker(model_name)
+    return RERANKERS[name]()
+
+def _tokens(text: str) -> set:
+    return set(_TOKEN.findall(text.lower()))
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+import zlib
+from typing import Dict, Optional, Tuple, Union
+
+COMPRESSIONS = ("none", "zlib", "zstd")
+
+def response_key(text: str) -> str:
+    """Content address of a response: the same text always maps to the same key"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+class ResponseStore:
+    """Content-addressed, reference-counted response texts for SemanticMemory.
+
+    Each distinct response is held once however many cache entries refer to it.
+    Responses of at least ``min_bytes`` are compressed with zlib or zstd (the
+    latter needs the ``zstandard`` package) when that saves space, and are only
+    decompressed when served.
+    """
+
+    def __init__(self, compression: str = "none", min_bytes: int = 1024, level: Optional[int] = None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown response compression '{compression}', expected one of {COMPRESSIONS}")
+        self.compression = compression
+        self.min_bytes = min_bytes
+        self._compress, self._decompress = _codec(compression, level)
+        # key -> [text or compressed bytes, reference count, raw size in bytes]
+        self._blobs: Dict[str, list] = {}
+        self.stored_bytes = 0
+        self.raw_bytes = 0
+        self.references = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._blobs
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    def add(self, text: str) -> Tuple[str, bool]:
+        """Take a reference to ``text``; returns (key, whether it was new)"""
+        key = response_key(text)
+        with self._lock:
+            blob = self._blobs.get(key)
+            if blob is not None:
+                blob[1] += 1
+                self.references += 1
+                return key, False
+            raw = text.encode("utf-8")
+            value: Union[str, bytes] = text
+            if self._compress is not None and len(raw) >= self.min_bytes:
+                packed = self._compress(raw)
+                if len(packed) < len(raw):
+                    value = packed
+            self._blobs[key] = [value, 1, len(raw)]
+            self.stored_bytes += _size(value)
+            self.raw_bytes += len(raw)
+            self.references += 1
+            return key, True
+
+    def add_ref(self, key: str) -> None:
+        """Take another reference to an already stored response"""
+        with self._lock:
+            self._blobs[key][1] += 1
+            self.references += 1
+
+    def release(self, key: str) -> None:
+        """Drop a reference; the response is freed with its last one"""
+        with self._lock:
+            blob = self._blobs.get(key)
+            if blob is None:
+                return
+            blob[1] -= 1
+            self.references -= 1
+            if blob[1] <= 0:
+                del self._blobs[key]
+                self.stored_bytes -= _size(blob[0])
+                self.raw_bytes -= blob[2]
+
+    def get(self, key: str) -> str:
+        value = self._blobs[key][0]
+        if isinstance(value, bytes):
+            return self._decompress(value).decode("utf-8")
+        return value
+
+    def stored_size(self, key: str) -> int:
+        return _size(self._blobs[key][0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blobs.clear()
+            self.stored_bytes = self.raw_bytes = self.references = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "response_compression": self.compression,
+            "unique_responses": len(self._blobs),
+            "response_references": self.references,
+            "response_raw_bytes": self.raw_bytes,
+            "response_stored_bytes": self.stored_bytes
+        }
+
+def _size(value: Union[str, bytes]) -> int:
+    return len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+
+def _codec(compression: str, level: Optional[int]):
+    if compression == "zlib":
+        level = 6 if level is None else level
+        return (lambda raw: zlib.compress(raw, level)), zlib.decompress
+    if compression == "zstd":
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        # Decompressors are not thread-safe; one per call is cheap enough for hits
+        return compressor.compress, lambda packed: zstandard.ZstdDecompressor().decompress(packed)
+    return None, None
@@ -0,0 +1,213 @@
+import bisect
+import itertools
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: interactive /chat traffic ahead of bulk agent and replay jobs
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+class TokenBucket:
+    """``rate`` tokens per second up to ``capacity``; None means unlimited.
+
+    Debits may overdraw the bucket (a request that used more tokens than
+    estimated), which then delays later takers until it refills.
+    """
+
+    def __init__(self, rate: Optional[float], capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate or 0.0)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` tokens can be taken (0 if now)"""
+        if self.rate is None:
+            return 0.0
+        self._refill(now)
+        # Requests larger than the whole bucket go through once it is full
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float) -> None:
+        if self.rate is not None:
+            self._refill(now)
+            self.tokens -= amount
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+@dataclass
+class Reservation:
+    """A concurrency slot and rate-limit tokens held for one upstream call"""
+    model: str
+    priority: str
+    # Estimated prompt + completion tokens taken from the model's token bucket
+    tokens: int
+
+class LLMScheduler:
+    """Admission control in front of the upstream API.
+
+    At most ``max_concurrency`` calls run at once. Callers wait in priority
+    order (then arrival order) for a slot, and are only admitted to a model
+    whose request bucket (``rps``) and token bucket (``tpm``, estimated up
+    front and corrected from the reported usage) have room and that is not
+    backing off after a 429. ``limits`` maps a model, or "*" for every other
+    model, to ``{"rps": ..., "tpm": ...}``; missing values are unlimited.
+    ``prices`` maps a model to USD per million ``input`` and ``output`` tokens.
+    """
+
+    def __init__(self, max_concurrency: int = 8, limits: Optional[Dict[str, dict]] = None,
+                 prices: Optional[Dict[str, dict]] = None):
+        self.max_concurrency = max_concurrency
+        self.limits = dict(limits or {})
+        self.prices = dict(prices or {})
+        self._requests: Dict[str, TokenBucket] = {}
+        self._tokens: Dict[str, TokenBucket] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._usage: Dict[str, Dict[str, float]] = {}
+        # Sorted (priority, arrival, models, tokens) of blocked callers
+        self._waiting: List[Tuple[int, int, Tuple[str, ...], int]] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, models: List[str], priority: str = "interactive", tokens: int = 0,
+                timeout: Optional[float] = None, blocking: bool = True) -> Optional[Reservation]:
+        """Reserve a slot on the first of ``models`` with rate-limit room.
+
+        Returns None if ``blocking`` is False and nothing is free right now, or
+        once ``timeout`` seconds pass.
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        ticket = (PRIORITIES[priority], next(self._seq), tuple(models), tokens)
+        with self._cond:
+            bisect.insort(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    model, wait = self._ready(ticket, now)
+                    if model is not None:
+                        self._take(model, tokens, now)
+                        metrics.LLM_QUEUE_SECONDS.observe(now - start, priority=priority)
+                        return Reservation(model, priority, tokens)
+                    if not blocking:
+                        return None
+                    if deadline is not None:
+                        if now >= deadline:
+                            self.timeouts += 1
+                            logger.warning("⏳ No LLM capacity for a %s call after %.1fs", priority, now - start)
+                            return None
+                        wait = min(wait, deadline - now) if wait is not None else deadline - now
+                    self._cond.wait(wait)
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+
+    def release(self, reservation: Reservation, usage: Optional[dict] = None) -> None:
+        """Free the slot; ``usage`` is the response's token usage, if it reported one"""
+        with self._cond:
+            self._in_flight -= 1
+            if usage:
+                self._record_usage(reservation, usage)
+            self._cond.notify_all()
+
+    def throttle(self, model: str, seconds: float) -> None:
+        """Stop admitting calls to ``model`` for ``seconds`` (after a 429)"""
+        with self._cond:
+            until = time.monotonic() + seconds
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), until)
+            self.throttled += 1
+
+    def _ready(self, ticket: tuple, now: float) -> Tuple[Optional[str], Optional[float]]:
+        """(model to run on, None) when the ticket may go now, else (None, seconds worth re-checking after)"""
+        if self._in_flight >= self.max_concurrency:
+            return None, None
+        soonest = None
+        for waiter in self._waiting:
+            model, delay = self._first_ready(waiter[2], waiter[3], now)
+            if waiter is ticket:
+                return model, delay
+            if model is not None:
+                # Someone ahead of us can go; they take the free slot
+                return None, None
+            soonest = delay if soonest is None else min(soonest, delay)
+        return None, soonest
+
+    def _first_ready(self, models: Tuple[str, ...], tokens: int, now: float) -> Tuple[Optional[str], float]:
+        soonest = float("inf")
+        for model in models:
+            delay = max(
+                self._paused_until.get(model, 0.0) - now,
+                self._bucket(self._requests, model, "rps", 1.0).delay(1.0, now),
+                self._bucket(self._tokens, model, "tpm", 60.0).delay(tokens, now)
+            )
+            if delay <= 0:
+                return model, 0.0
+            soonest = min(soonest, delay)
+        return None, soonest
+
+    def _take(self, model: str, tokens: int, now: float) -> None:
+        self._in_flight += 1
+        self._requests[model].take(1.0, now)
+        self._tokens[model].take(tokens, now)
+
+    def _bucket(self, buckets: Dict[str, TokenBucket], model: str, key: str, per_seconds: float) -> TokenBucket:
+        bucket = buckets.get(model)
+        if bucket is None:
+            limit = self.limits.get(model, self.limits.get("*", {})).get(key)
+            # tpm is a per-minute budget: refill per second, hold a minute's worth
+            bucket = TokenBucket(limit / per_seconds, limit) if limit else TokenBucket(None)
+            buckets[model] = bucket
+        return bucket
+
+    def _record_usage(self, reservation: Reservation, usage: dict) -> None:
+        model = reservation.model
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        # Settle the estimate taken on admission against what was actually used
+        self._tokens[model].take(prompt_tokens + completion_tokens - reservation.tokens, time.monotonic())
+
+        price = self.prices.get(model, {})
+        cost = (prompt_tokens * price.get("input", 0.0) + completion_tokens * price.get("output", 0.0)) / 1e6
+        totals = self._usage.setdefault(model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+        totals["cost_usd"] += cost
+        metrics.LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt", priority=reservation.priority)
+        metrics.LLM_TOKENS.inc(completion_tokens, model=model, kind="completion", priority=reservation.priority)
+        metrics.LLM_COST.inc(cost, model=model)
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            names = {rank: name for name, rank in PRIORITIES.items()}
+            waiting = {name: 0 for name in PRIORITIES}
+            for ticket in self._waiting:
+                waiting[names[ticket[0]]] += 1
+            return {
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "waiting": waiting,
+                "throttled": self.throttled,
+                "queue_timeouts": self.timeouts,
+                "backing_off": sorted(model for model, until in self._paused_until.items() if until > now),
+                "usage": {model: {**totals, "cost_usd": round(totals["cost_usd"], 6)}
+                          for model, totals in self._usage.items()}
+            }
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based), never shorter than Retry-After"""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after) if retry_after is not None else delay
@@ -0,0 +1,288 @@
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+from contextlib import closing, contextmanager
+from typing import List, Optional, Set, Tuple
+from storage import STORE_VERSION, EncoderMismatch, StorageBackend, StoreRewritten
+
+DATABASE_FILE = "cache.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    dimension INTEGER NOT NULL,
+    dtype TEXT NOT NULL,
+    encoder TEXT,
+    generation INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (namespace, row)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tombstones (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    row INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tombstones_by_namespace ON tombstones (namespace, seq);
+"""
+
+
+class SQLiteStore(StorageBackend):
+    """Shared store for several app instances: one SQLite database, every namespace in it.
+
+    Point each node's MEMORY_DIR at the same database (e.g. on shared disk).
+    Rows are numbered per namespace in insertion order like DiskStore, so a
+    node applies other nodes' new rows and tombstones to its own FAISS index
+    with ``changes()``; only a compaction or clear (a generation bump) makes
+    it reload. ``locked()`` holds an IMMEDIATE transaction, which is the
+    cross-node writer lock; it commits (or rolls back) as one unit.
+    """
+
+    def __init__(self, path: str, dimension: int, dtype: str = "float32", encoder: Optional[str] = None,
+                 namespace: str = "default", timeout: float = 30.0):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.path = path
+        self.namespace = namespace
+        self.dimension = dimension
+        self.encoder = encoder
+        self.dtype = np.dtype(dtype)
+        self.timeout = timeout
+        self.count = 0
+        self.generation = 0
+        self._tombstone_seq = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._init_meta()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # A connection must not cross a fork (gunicorn preloads the app)
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                       check_same_thread=False)
+            self._db.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._db
+
+    @property
+    def snapshot_path(self) -> str:
+        # Beside the database rather than in it; every node indexes the same rows
+        return f"{self.path}.{self.namespace}.snapshot.npz"
+
+    @staticmethod
+    def read_meta(path: str, namespace: str = "default") -> Optional[dict]:
+        """Layout of ``namespace`` in the database at ``path``, or None if it has no rows yet"""
+        if not os.path.exists(path):
+            return None
+        with closing(sqlite3.connect(path)) as conn:
+            try:
+                row = conn.execute("SELECT version, dimension, dtype, encoder FROM meta WHERE namespace = ?",
+                                   (namespace,)).fetchone()
+            except sqlite3.OperationalError:
+                return None
+        if row is None:
+            return None
+        return {"version": row[0], "dimension": row[1], "dtype": row[2], "encoder": row[3]}
+
+    @staticmethod
+    def namespaces(path: str) -> List[str]:
+        """Namespaces stored in the database at ``path``"""
+        if not os.path.exists(path):
+            return []
+        with closing(sqlite3.connect(path)) as conn:
+            try:
+                return [row[0] for row in conn.execute("SELECT namespace FROM meta ORDER BY namespace")]
+            except sqlite3.OperationalError:
+                return []
+
+    def _init_meta(self) -> None:
+        """Register the namespace or check its existing rows match our layout"""
+        with self.locked():
+            row = self._conn.execute("SELECT dimension, dtype, encoder FROM meta WHERE namespace = ?",
+                                     (self.namespace,)).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO meta (namespace, version, dimension, dtype, encoder) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, STORE_VERSION, self.dimension, self.dtype.name, self.encoder)
+                )
+                return
+            dimension, dtype, encoder = row
+            if dimension != self.dimension:
+                raise EncoderMismatch(
+                    f"Namespace '{self.namespace}' in {self.path} has dimension {dimension}, expected {self.dimension}"
+                )
+            if self.encoder and encoder and encoder != self.encoder:
+                raise EncoderMismatch(
+                    f"Namespace '{self.namespace}' in {self.path} was built with encoder {encoder}, not {self.encoder}"
+                )
+            # The stored dtype wins so existing rows are never reinterpreted
+            self.dtype = np.dtype(dtype)
+            if self.encoder and not encoder:
+                self._conn.execute("UPDATE meta SET encoder = ? WHERE namespace = ?", (self.encoder, self.namespace))
+
+    @contextmanager
+    def locked(self):
+        """Exclusive write transaction across every node; re-entrant within one process"""
+        with self._lock:
+            if self._lock_depth == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._lock_depth += 1
+            try:
+                yield
+            except BaseException:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._conn.execute("ROLLBACK")
+                    # Our view of the rows may be ahead of the database now; force a reload
+                    self.generation = -1
+                raise
+            else:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._conn.execute("COMMIT")
+
+    def load(self) -> Tuple[np.ndarray, List[dict], Set[int]]:
+        with self.locked():
+            self.generation = self._read_generation()
+            self.count = 0
+            self._tombstone_seq = 0
+            vectors, entries, deleted = self._read_tail()
+            return vectors, entries, set(deleted)
+
+    def changes(self) -> Tuple[np.ndarray, List[dict], List[int]]:
+        """Rows and deletions other nodes wrote since our last load/changes.
+
+        Raises StoreRewritten if the namespace was compacted or cleared meanwhile.
+        """
+        with self._lock:
+            if self._read_generation() != self.generation:
+                raise StoreRewritten(f"{self.path}:{self.namespace}")
+            return self._read_tail()
+
+    def has_changes(self) -> bool:
+        """True once this namespace has rows, tombstones or a rewrite we have not read"""
+        # A writer in this process holds the lock and syncs anyway; never block a search on it
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self.generation < 0:
+                return True
+            # Index seeks on this namespace only; writes to other namespaces do not count
+            generation, last_row, last_seq = self._conn.execute(
+                "SELECT (SELECT generation FROM meta WHERE namespace = ?),"
+                " (SELECT MAX(row) FROM entries WHERE namespace = ?),"
+                " (SELECT MAX(seq) FROM tombstones WHERE namespace = ?)",
+                (self.namespace, self.namespace, self.namespace)
+            ).fetchone()
+            if (generation or 0) != self.generation:
+                return True
+            return (last_row is not None and last_row >= self.count) or (last_seq or 0) > self._tombstone_seq
+        finally:
+            self._lock.release()
+
+    def vectors(self) -> np.ndarray:
+        with self._lock:
+            blobs = self._conn.execute(
+                "SELECT vector FROM entries WHERE namespace = ? AND row < ? ORDER BY row",
+                (self.namespace, self.count)
+            ).fetchall()
+        return self._decode_vectors(blob for blob, in blobs)
+
+    def append(self, vectors: np.ndarray, entries: List[dict]) -> None:
+        """Insert rows after the last one we know of; call under ``locked()`` after ``changes()``"""
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dimension)
+        with self.locked():
+            self._conn.executemany(
+                "INSERT INTO entries (namespace, row, vector, entry) VALUES (?, ?, ?, ?)",
+                [
+                    (self.namespace, self.count + i, vectors[i].tobytes(),
+                     json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+                    for i, entry in enumerate(entries)
+                ]
+            )
+            self.count += len(entries)
+
+    def delete(self, ids: np.ndarray) -> None:
+        """Record deleted rows; they are physically removed by rewrite()"""
+        # Our own tombstones come back through changes(); killing a dead row is a no-op
+        with self.locked():
+            self._conn.executemany("INSERT INTO tombstones (namespace, row) VALUES (?, ?)",
+                                   [(self.namespace, int(i)) for i in ids])
+
+    def rewrite(self, vectors: np.ndarray, entries: List[dict], dimension: Optional[int] = None,
+                encoder: Optional[str] = None) -> None:
+        """Replace the namespace's rows in one transaction, e.g. to compact away deleted rows"""
+        with self.locked():
+            if dimension is not None or encoder is not None:
+                self.dimension = dimension or self.dimension
+                self.encoder = encoder or self.encoder
+                self._conn.execute("UPDATE meta SET dimension = ?, encoder = ? WHERE namespace = ?",
+                                   (self.dimension, self.encoder, self.namespace))
+            self._delete_rows()
+            self.count = 0
+            self.append(vectors, entries)
+            self._bump_generation()
+
+    def clear(self) -> None:
+        with self.locked():
+            self._delete_rows()
+            self.count = 0
+            self._bump_generation()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None and self._lock_depth == 0:
+                self._db.close()
+                self._db = None
+
+    def _delete_rows(self) -> None:
+        self._conn.execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+        self._conn.execute("DELETE FROM tombstones WHERE namespace = ?", (self.namespace,))
+        # Tombstone seqs only grow, so every later one is past this
+        self._tombstone_seq = 0
+
+    def _read_tail(self) -> Tuple[np.ndarray, List[dict], List[int]]:
+        """Rows and tombstones past what we have seen, advancing our position"""
+        rows = self._conn.execute(
+            "SELECT row, vector, entry FROM entries WHERE namespace = ? AND row >= ? ORDER BY row",
+            (self.namespace, self.count)
+        ).fetchall()
+        # Row ids are dense; stop at a gap rather than misalign the index
+        rows = [r for i, r in enumerate(rows) if r[0] == self.count + i]
+        vectors = self._decode_vectors(r[1] for r in rows)
+        entries = [json.loads(r[2]) for r in rows]
+        self.count += len(rows)
+
+        tombstones = self._conn.execute(
+            "SELECT seq, row FROM tombstones WHERE namespace = ? AND seq > ? ORDER BY seq",
+            (self.namespace, self._tombstone_seq)
+        ).fetchall()
+        if tombstones:
+            self._tombstone_seq = tombstones[-1][0]
+        deleted = [row for _, row in tombstones if row < self.count]
+        return vectors, entries, deleted
+
+    def _decode_vectors(self, blobs) -> np.ndarray:
+        data = b"".join(blobs)
+        return np.frombuffer(data, dtype=self.dtype).reshape(-1, self.dimension)
+
+    def _read_generation(self) -> int:
+        row = self._conn.execute("SELECT generation FROM meta WHERE namespace = ?", (self.namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump_generation(self) -> None:
+        self.generation = self._read_generation() + 1
+        self._conn.execute("UPDATE meta SET generation = ? WHERE namespace = ?", (self.generation, self.namespace))
+
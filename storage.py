@@ -0,0 +1,450 @@
+import json
+import os
+import numpy as np
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+STORE_VERSION = 1
+VECTOR_FILE = "vectors.bin"
+ENTRIES_FILE = "entries.jsonl"
+META_FILE = "meta.json"
+TOMBSTONE_FILE = "tombstones.bin"
+GENERATION_FILE = "generation"
+LOCK_FILE = "store.lock"
+REWRITE_MARKER = "rewrite.pending"
+SNAPSHOT_FILE = "index.snapshot.npz"
+BACKENDS = ("disk", "sqlite")
+
+
+class StoreRewritten(Exception):
+    """Another process compacted or cleared the store; the caller must reload it"""
+
+
+class EncoderMismatch(ValueError):
+    """The store holds vectors from a different encoder or dimension"""
+
+
+class StorageBackend(ABC):
+    """Persistence under SemanticMemory, shareable by every process or node that opens it.
+
+    Rows are numbered in insertion order and only renumbered by ``rewrite()`` or
+    ``clear()``, which bump a generation so other users reload instead of
+    applying ``changes()``. Writers append only under ``locked()``, after
+    applying ``changes()``, so row ids agree everywhere.
+    """
+
+    path: str
+    generation: int
+
+    @property
+    @abstractmethod
+    def snapshot_path(self) -> str:
+        """Where SemanticMemory.snapshot() keeps this store's index snapshot"""
+
+    def exists(self) -> bool:
+        """False while nothing has been written, so there is nothing to load"""
+        return True
+
+    @abstractmethod
+    def locked(self):
+        """Exclusive lock across every user of the store; re-entrant within one process"""
+
+    @abstractmethod
+    def load(self) -> Tuple[np.ndarray, List[dict], Set[int]]:
+        """All rows as (vectors, entries, deleted row ids)"""
+
+    @abstractmethod
+    def changes(self) -> Tuple[np.ndarray, List[dict], List[int]]:
+        """Rows and deletions written by others since load()/changes(); raises StoreRewritten"""
+
+    @abstractmethod
+    def has_changes(self) -> bool:
+        """Cheap check whether changes() could return anything"""
+
+    @abstractmethod
+    def vectors(self) -> np.ndarray:
+        """All rows' vectors as an (n, dimension) array"""
+
+    @abstractmethod
+    def append(self, vectors: np.ndarray, entries: List[dict]) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, ids: np.ndarray) -> None:
+        pass
+
+    @abstractmethod
+    def rewrite(self, vectors: np.ndarray, entries: List[dict], dimension: Optional[int] = None,
+                encoder: Optional[str] = None) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def open_store(backend: str, location: str, dimension: int, dtype: str = "float32",
+               encoder: Optional[str] = None, namespace: str = "default") -> StorageBackend:
+    """Open (or create) one namespace's store.
+
+    ``disk`` is a directory per namespace; ``sqlite`` is one database file that
+    holds every namespace.
+    """
+    if backend == "disk":
+        return DiskStore(location, dimension, dtype, encoder=encoder)
+    if backend == "sqlite":
+        # sqlite_store builds on this module
+        from sqlite_store import SQLiteStore
+        return SQLiteStore(location, dimension, dtype, encoder=encoder, namespace=namespace)
+    raise ValueError(f"Unknown storage backend '{backend}', expected one of {BACKENDS}")
+
+
+def read_store_meta(backend: str, location: str, namespace: str = "default") -> Optional[dict]:
+    """Dimension, dtype and encoder of an existing store, or None if there is none yet"""
+    if backend == "sqlite":
+        from sqlite_store import SQLiteStore
+        return SQLiteStore.read_meta(location, namespace)
+    return DiskStore.read_meta(location)
+
+
+class DiskStore(StorageBackend):
+    """Append-only on-disk store for SemanticMemory.
+
+    Layout inside ``path``:
+      meta.json      - format version, dimension, vector dtype and encoder fingerprint
+      vectors.bin    - raw row-major vectors (float32 or float16), memory-mappable
+      entries.jsonl  - one compact {"q": ..., "r": ..., "t": ...} line per vector row
+      tombstones.bin - int64 row ids deleted since the last compaction
+      generation     - bumped on every rewrite/clear so other processes reload
+
+    Several processes on one host may share one store: writers hold an
+    exclusive file lock (see ``locked()``) and readers pick up each other's rows
+    with ``changes()``. Nothing is created on disk until the first ``locked()``,
+    so opening a store that is never written leaves no directory behind.
+    """
+
+    def __init__(self, path: str, dimension: int, dtype: str = "float32", encoder: Optional[str] = None):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.path = path
+        self.dimension = dimension
+        self.encoder = encoder
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = self.dimension * self.dtype.itemsize
+        self.count = 0
+        self.generation = 0
+        self._entries_offset = 0
+        self._tombstone_offset = 0
+        self._vector_fh = None
+        self._entries_fh = None
+        self._lock_fh = None
+        self._lock_depth = 0
+        self._created = False
+
+        self._init_meta()
+
+    @property
+    def vector_path(self) -> str:
+        return os.path.join(self.path, VECTOR_FILE)
+
+    @property
+    def entries_path(self) -> str:
+        return os.path.join(self.path, ENTRIES_FILE)
+
+    @property
+    def tombstone_path(self) -> str:
+        return os.path.join(self.path, TOMBSTONE_FILE)
+
+    @property
+    def generation_path(self) -> str:
+        return os.path.join(self.path, GENERATION_FILE)
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.path, META_FILE)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.path, SNAPSHOT_FILE)
+
+    @staticmethod
+    def read_meta(path: str) -> Optional[dict]:
+        """meta.json of the store at ``path``, or None if there is no store yet"""
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.meta_path)
+
+    def _init_meta(self, create: bool = False) -> None:
+        """Check an existing store matches our layout, or with ``create`` make a new one"""
+        meta = self.read_meta(self.path)
+        if meta is not None:
+            if meta.get("dimension") != self.dimension:
+                raise EncoderMismatch(
+                    f"Store at {self.path} has dimension {meta.get('dimension')}, expected {self.dimension}"
+                )
+            if self.encoder and meta.get("encoder") and meta["encoder"] != self.encoder:
+                raise EncoderMismatch(
+                    f"Store at {self.path} was built with encoder {meta['encoder']}, not {self.encoder}"
+                )
+            # The on-disk dtype wins so an existing store is never reinterpreted
+            self.dtype = np.dtype(meta.get("dtype", "float32"))
+            self.row_bytes = self.dimension * self.dtype.itemsize
+            if self.encoder and not meta.get("encoder"):
+                # Stores from before fingerprints were recorded: adopt the current encoder
+                self._write_meta(self.meta_path)
+            self._created = True
+            return
+
+        if create:
+            os.makedirs(self.path, exist_ok=True)
+            self._write_meta(self.meta_path)
+            self._created = True
+
+    def _create(self) -> None:
+        if not self._created:
+            self._init_meta(create=True)
+
+    def _write_meta(self, path: str) -> None:
+        meta = {"version": STORE_VERSION, "dimension": self.dimension, "dtype": self.dtype.name}
+        if self.encoder:
+            meta["encoder"] = self.encoder
+        with open(path, "w") as f:
+            json.dump(meta, f)
+
+    @contextmanager
+    def locked(self):
+        """Exclusive inter-process lock for writers; re-entrant within one process"""
+        self._create()
+        if fcntl is None:
+            yield
+            return
+        if self._lock_fh is None:
+            self._lock_fh = open(os.path.join(self.path, LOCK_FILE), "a+b")
+        if self._lock_depth == 0:
+            fcntl.flock(self._lock_fh, fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_fh, fcntl.LOCK_UN)
+
+    def load(self) -> Tuple[np.ndarray, List[dict], Set[int]]:
+        """Open the store and return (vectors, entries, deleted row ids).
+
+        Vectors come back as a read-only memory map, so reopening a large store
+        does not copy or parse any embedding data. A torn tail left by a crash
+        mid-append is trimmed so both files describe the same rows.
+        """
+        with self.locked():
+            self.close()
+            self._finish_rewrite()
+            self.generation = self._read_generation()
+            self.count = 0
+            self._entries_offset = 0
+            self._tombstone_offset = 0
+
+            vectors, entries, deleted = self._read_tail()
+            self._truncate(self.vector_path, self.count * self.row_bytes)
+            self._truncate(self.entries_path, self._entries_offset)
+            return vectors, entries, set(deleted)
+
+    def changes(self) -> Tuple[np.ndarray, List[dict], List[int]]:
+        """Rows and deletions other processes appended since our last load/changes.
+
+        Raises StoreRewritten if the store was compacted or cleared meanwhile.
+        """
+        if self._read_generation() != self.generation:
+            raise StoreRewritten(self.path)
+        return self._read_tail()
+
+    def has_changes(self) -> bool:
+        """Cheap stat-only check for foreign appends, deletions or rewrites"""
+        return (
+            self._size(self.entries_path) != self._entries_offset
+            or self._size(self.tombstone_path) != self._tombstone_offset
+            or self._read_generation() != self.generation
+        )
+
+    def vectors(self) -> np.ndarray:
+        """Memory-map all stored rows as an (n, dimension) array"""
+        if self.count == 0:
+            return np.empty((0, self.dimension), dtype=self.dtype)
+        self._flush()
+        return np.memmap(self.vector_path, dtype=self.dtype, mode="r", shape=(self.count, self.dimension))
+
+    def append(self, vectors: np.ndarray, entries: List[dict]) -> None:
+        """Append rows to both files; vectors are written first so the sidecar never leads.
+
+        Shared stores must call this under ``locked()`` after applying ``changes()``
+        so row ids stay aligned across processes.
+        """
+        self._create()
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dimension)
+        if self._vector_fh is None:
+            self._vector_fh = open(self.vector_path, "ab")
+            self._entries_fh = open(self.entries_path, "ab")
+
+        self._vector_fh.write(vectors.tobytes())
+        self._vector_fh.flush()
+        data = "".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n" for entry in entries
+        ).encode("utf-8")
+        self._entries_fh.write(data)
+        self._entries_fh.flush()
+        self.count += len(entries)
+        self._entries_offset += len(data)
+
+    def delete(self, ids: np.ndarray) -> None:
+        """Record deleted rows; they are physically removed by rewrite()"""
+        self._create()
+        data = np.asarray(ids, dtype=np.int64).tobytes()
+        with open(self.tombstone_path, "ab") as f:
+            f.write(data)
+        self._tombstone_offset += len(data)
+
+    def rewrite(self, vectors: np.ndarray, entries: List[dict], dimension: Optional[int] = None,
+                encoder: Optional[str] = None) -> None:
+        """Atomically replace the whole store, e.g. to compact away deleted rows.
+
+        Passing ``dimension``/``encoder`` re-labels the store in the same atomic
+        step, which is how a store is re-embedded for a new encoder.
+        """
+        self._create()
+        self.close()
+        if dimension is not None or encoder is not None:
+            self.dimension = dimension or self.dimension
+            self.encoder = encoder or self.encoder
+            self.row_bytes = self.dimension * self.dtype.itemsize
+            self._write_meta(self.meta_path + ".tmp")
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dimension)
+        with open(self.vector_path + ".tmp", "wb") as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        entries_size = 0
+        with open(self.entries_path + ".tmp", "wb") as f:
+            for entry in entries:
+                line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+                f.write(line)
+                entries_size += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Once the marker exists the new files are complete; load() finishes the swap
+        open(os.path.join(self.path, REWRITE_MARKER), "wb").close()
+        self._finish_rewrite()
+        self.count = len(entries)
+        self._entries_offset = entries_size
+        self._tombstone_offset = 0
+
+    def clear(self) -> None:
+        """Drop all rows but keep the store directory and metadata"""
+        self._create()
+        self.close()
+        for path in (self.vector_path, self.entries_path, self.tombstone_path):
+            open(path, "wb").close()
+        self._bump_generation()
+        self.count = 0
+        self._entries_offset = 0
+        self._tombstone_offset = 0
+
+    def close(self) -> None:
+        for fh in (self._vector_fh, self._entries_fh):
+            if fh is not None:
+                fh.close()
+        self._vector_fh = None
+        self._entries_fh = None
+
+    def _read_tail(self) -> Tuple[np.ndarray, List[dict], List[int]]:
+        """Read complete rows and tombstones past our offsets and advance them"""
+        entries, line_sizes = [], []
+        if os.path.exists(self.entries_path):
+            with open(self.entries_path, "rb") as f:
+                f.seek(self._entries_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    entries.append(json.loads(line))
+                    line_sizes.append(len(line))
+
+        # A row only counts once both its vector and its sidecar line are complete
+        vector_rows = self._size(self.vector_path) // self.row_bytes - self.count
+        rows = max(0, min(vector_rows, len(entries)))
+        del entries[rows:]
+
+        start = self.count
+        self.count += rows
+        self._entries_offset += sum(line_sizes[:rows])
+        vectors = self.vectors()[start:] if rows else np.empty((0, self.dimension), dtype=self.dtype)
+
+        deleted = []
+        usable = (self._size(self.tombstone_path) - self._tombstone_offset) // 8 * 8
+        if usable > 0:
+            with open(self.tombstone_path, "rb") as f:
+                f.seek(self._tombstone_offset)
+                ids = np.frombuffer(f.read(usable), dtype=np.int64)
+            self._tombstone_offset += usable
+            deleted = [int(i) for i in ids if i < self.count]
+        return vectors, entries, deleted
+
+    def _finish_rewrite(self) -> None:
+        """Move completed temp files into place (also recovers an interrupted rewrite)"""
+        marker = os.path.join(self.path, REWRITE_MARKER)
+        if not os.path.exists(marker):
+            for path in (self.vector_path, self.entries_path, self.meta_path):
+                if os.path.exists(path + ".tmp"):
+                    os.remove(path + ".tmp")
+            return
+        for path in (self.entries_path, self.vector_path, self.meta_path):
+            if os.path.exists(path + ".tmp"):
+                os.replace(path + ".tmp", path)
+        # Tombstones refer to pre-rewrite row ids
+        if os.path.exists(self.tombstone_path):
+            os.remove(self.tombstone_path)
+        self._bump_generation()
+        os.remove(marker)
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self.generation_path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _bump_generation(self) -> None:
+        self.generation = self._read_generation() + 1
+        tmp = self.generation_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(self.generation))
+        os.replace(tmp, self.generation_path)
+
+    def _flush(self) -> None:
+        for fh in (self._vector_fh, self._entries_fh):
+            if fh is not None:
+                fh.flush()
+
+    @staticmethod
+    def _size(path: str) -> int:
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    @staticmethod
+    def _truncate(path: str, size: int) -> None:
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
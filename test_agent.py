@@ -0,0 +1,67 @@
+import threading
+import time
+from agent import AgentManager, DirectAgent, SummarizationAgent
+from llm import Generation
+from memory import SemanticMemory
+from namespaces import NamespacedMemory
+
+class RecordingLLM:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, **kwargs):
+        with self._lock:
+            self.prompts.append(prompt)
+        time.sleep(self.delay)
+        return Generation(f"answer to {prompt}", "model-a")
+
+def test_batch_keeps_input_order_and_generates_equivalent_misses_once(encoder):
+    memory = SemanticMemory(encoder=encoder)
+    memory.store("what is a heat pump", "it moves heat")
+    llm = RecordingLLM(delay=0.05)
+    agent = DirectAgent(memory, generate_fn=llm)
+
+    queries = ["how do tides work", "What is a heat pump?", "why is the sky blue", "HOW do tides work",
+               "how do tides work", "why do cats purr"]
+    results = agent.process_batch(queries, max_concurrency=4)
+
+    assert [r["response"] for r in results] == [
+        "answer to how do tides work", "it moves heat", "answer to why is the sky blue",
+        "answer to how do tides work", "answer to how do tides work", "answer to why do cats purr"
+    ]
+    assert results[1]["is_cache_hit"] and results[1]["tier"] == "exact"
+    assert sorted(llm.prompts) == ["how do tides work", "why do cats purr", "why is the sky blue"]
+    assert memory.entry_stats.live_count == 4
+
+def test_manager_batch_uses_the_agent_prefix_and_partition(encoder, monkeypatch):
+    memories = NamespacedMemory(encoder)
+    manager = AgentManager(memory=memories)
+    llm = RecordingLLM()
+    monkeypatch.setattr(manager.agents["planning"], "generate_fn", llm)
+
+    results = manager.process_batch("planning", ["ship the release", "hire a designer"])
+    assert [r["response"] for r in results] == ["answer to Plan the following task: ship the release",
+                                                 "answer to Plan the following task: hire a designer"]
+    # Cached under the bare query, in the planning partition only
+    assert memories.partition("planning").search_exact("ship the release").hit
+    assert not memories.partition("default").search_exact("ship the release").hit
+    assert manager.process_batch("unknown", ["a", "b"])[1]["error"] is True
+
+def test_long_inputs_return_one_answer_per_chunk(encoder):
+    memory = SemanticMemory(encoder=encoder, similarity_threshold=0.95)
+    llm = RecordingLLM()
+    agent = SummarizationAgent(memory, generate_fn=llm, chunk_chars=200)
+    document = "\n\n".join(f"Paragraph {i} is about {topic} and nothing else at all."
+                           for i, topic in enumerate(["tides", "heat pumps", "cats", "the sky", "magnets", "sand"]))
+
+    result = agent.process_query(document)
+    assert result["chunks"] == len(result["parts"]) > 1
+    assert result["response"] == "\n\n".join(result["parts"])
+    assert all(part.startswith("answer to Summarize this: Paragraph") for part in result["parts"])
+    assert len(llm.prompts) == result["chunks"]
+
+    # Unchanged chunks come from the cache
+    again = agent.process_query(document)
+    assert again["chunks_cached"] == again["chunks"] and len(llm.prompts) == result["chunks"]
@@ -0,0 +1,99 @@
+import json
+import time
+import pytest
+import agent
+import config
+import metrics
+from conftest import HashingModel
+from encoder import BatchingEncoder
+from llm import Generation
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    """app.py imported once, against a temporary store and the hashing test model"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("MEMORY_DIR", str(tmp_path_factory.mktemp("app") / "memory"))
+        patch.setenv("EMBED_WARMUP", "lazy")
+        patch.delenv("MEMORY_NAMESPACES", raising=False)
+        patch.setattr(config, "encoder_from_env",
+                      lambda: BatchingEncoder(model=HashingModel(), model_name="all-MiniLM-L6-v2"))
+        import app
+    return app
+
+@pytest.fixture
+def client(app_module):
+    yield app_module.app.test_client()
+    app_module.memories.clear()
+
+def test_failed_chat_records_its_real_latency(app_module, client, monkeypatch):
+    def observe_query(*args):
+        time.sleep(0.05)
+        raise RuntimeError("feedback store unavailable")
+    monkeypatch.setattr(app_module.feedback, "observe_query", observe_query)
+    counts, total = metrics.REQUEST_SECONDS.snapshot(endpoint="chat", result="error")
+
+    response = client.post("/chat", json={"query": "what is a heat pump"})
+
+    assert response.status_code == 500
+    after_counts, after_total = metrics.REQUEST_SECONDS.snapshot(endpoint="chat", result="error")
+    assert sum(after_counts) == sum(counts) + 1
+    assert after_total - total >= 0.05
+
+def sse_events(response) -> list:
+    body = response.get_data(as_text=True)
+    assert body.endswith("\n\n")
+    events = body[:-2].split("\n\n")
+    assert all(event.startswith("data: ") for event in events)
+    return [json.loads(event[len("data: "):]) for event in events]
+
+def test_stream_sends_tokens_then_done_and_caches_the_answer(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "generate_stream", lambda query: iter([("model-a", "Heat pumps "),
+                                                                           ("model-a", "move heat.")]))
+    response = client.post("/chat/stream", json={"query": "what is a heat pump"})
+
+    assert response.mimetype == "text/event-stream"
+    *tokens, done = sse_events(response)
+    assert tokens == [{"token": "Heat pumps "}, {"token": "move heat."}]
+    assert done["done"] is True and done["cached"] is False and done["api_success"] is True
+
+    *tokens, done = sse_events(client.post("/chat/stream", json={"query": "What is a heat pump?"}))
+    assert tokens == [{"token": "Heat pumps move heat."}]
+    assert (done["cached"], done["tier"]) == (True, "exact")
+
+def test_fallback_or_failed_streams_are_not_cached(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "generate_stream", lambda query: iter([(None, "Backup answer.")]))
+    *tokens, done = sse_events(client.post("/chat/stream", json={"query": "what is a heat pump"}))
+    assert tokens == [{"token": "Backup answer."}]
+    assert done["api_success"] is False and done["cached"] is False
+
+    def broken(query):
+        yield "model-a", "Heat pumps "
+        raise RuntimeError("connection reset")
+    monkeypatch.setattr(app_module, "generate_stream", broken)
+    events = sse_events(client.post("/chat/stream", json={"query": "what is a heat pump"}))
+    assert events[0] == {"token": "Heat pumps "}
+    assert "connection reset" in events[-1]["error"]
+
+    assert not app_module.memory.search_exact("what is a heat pump").hit
+
+def test_batch_endpoint_answers_in_order(app_module, client, monkeypatch):
+    prompts = []
+    def generate(prompt, models=None, priority="interactive"):
+        prompts.append((prompt, priority))
+        return Generation(f"answer to {prompt}", "model-a")
+    monkeypatch.setattr(agent, "generate", generate)
+    app_module.agents.agents["retrieval"].memory.store("what is a heat pump", "it moves heat")
+
+    response = client.post("/batch", json={"agent": "retrieval",
+                                           "queries": ["how do tides work ", "what is a heat pump", "How do tides work"]})
+
+    body = response.get_json()
+    assert [r["response"] for r in body["results"]] == [
+        "answer to Extract key info from this: how do tides work", "it moves heat",
+        "answer to Extract key info from this: how do tides work"
+    ]
+    assert body["results"][1]["is_cache_hit"] and body["errors"] == 0
+    assert prompts == [("Extract key info from this: how do tides work", "bulk")]
+
+    assert client.post("/batch", json={"agent": "retrieval", "queries": []}).status_code == 400
+    assert client.post("/batch", json={"agent": "nobody", "queries": ["hi"]}).status_code == 400
@@ -0,0 +1,52 @@
+import json
+import logging
+import urllib.error
+import urllib.request
+import pytest
+from bench.common import quiet
+from bench.stub_llm import start_stub
+
+@pytest.fixture
+def stub():
+    scenario = {
+        "default": {"latency_ms": 0, "outcomes": {"200": 1.0}, "response_tokens": 3},
+        "models": {"busy/model": {"outcomes": {"429": 1.0}, "retry_after": 7},
+                   "gone/model": {"outcomes": {"400": 1.0}}}
+    }
+    server = start_stub(port=0, scenario=scenario)
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+
+def post(url, payload):
+    request = urllib.request.Request(f"{url}/chat/completions", data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+def test_quiet_mutes_info_logging_and_restores_it(caplog):
+    logger = logging.getLogger("bench-test")
+    with caplog.at_level(logging.INFO):
+        with quiet():
+            logger.info("muted")
+            logger.warning("kept")
+        logger.info("after")
+    assert [record.getMessage() for record in caplog.records] == ["kept", "after"]
+    assert logging.root.manager.disable == logging.NOTSET
+
+def test_stub_answers_deterministically(stub):
+    payload = {"model": "stub/default", "messages": [{"role": "user", "content": "why is the sky blue"}]}
+    first, second = post(stub, payload), post(stub, payload)
+    assert first == second
+    assert first["choices"][0]["message"]["content"] == "Stub answer from default to: why is the sky blue word0 word1"
+    assert first["usage"] == {"prompt_tokens": 5, "completion_tokens": 3}
+
+def test_stub_replays_per_model_failures(stub):
+    with pytest.raises(urllib.error.HTTPError) as busy:
+        post(stub, {"model": "busy/model", "messages": [{"role": "user", "content": "hi"}]})
+    assert busy.value.code == 429
+    assert busy.value.headers["Retry-After"] == "7"
+
+    with pytest.raises(urllib.error.HTTPError) as gone:
+        post(stub, {"model": "gone/model", "messages": [{"role": "user", "content": "hi"}]})
+    assert gone.value.code == 400
+    assert json.loads(gone.value.read())["error"]["code"] == "model_not_available"
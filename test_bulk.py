@@ -0,0 +1,53 @@
+import json
+from bulk import export_records, import_records, read_records
+from namespaces import NamespacedMemory
+
+def test_legacy_import_drops_errors_and_strips_agent_prefixes(tmp_path, encoder):
+    legacy = tmp_path / "memory_cache.json"
+    legacy.write_text(json.dumps({
+        "queries": [
+            "Summarize this: The system is production-ready with error handling",
+            "Plan the following task: lets plan a trip to goa",
+            "Plan the following task: write a release checklist",
+            "What is voltage?",
+            "Tell me about hiking"
+        ],
+        "responses": [
+            "Model unavailable (Status: 404). Please try again later.",
+            "Error: upstream timed out",
+            "1. Freeze the branch 2. Tag 3. Publish",
+            "Voltage is electric potential difference.",
+            # A canned get_smart_fallback() answer for that prompt
+            "I find 'Tell me about hiking' quite interesting! Although I'm experiencing some technical "
+            "difficulties with my primary AI service, I'm still here to discuss this topic with you. "
+            "Could you tell me more about what you're looking for?"
+        ]
+    }))
+    memories = NamespacedMemory(encoder, persist_dir=str(tmp_path / "store"), defaults={"write_behind": False})
+
+    outcome = import_records(memories, read_records(str(legacy)))
+
+    assert outcome["stored"] == 2 and not outcome.get("invalid")
+    planning = memories.partition("planning")
+    assert planning.search_exact("write a release checklist").response == "1. Freeze the branch 2. Tag 3. Publish"
+    assert not planning.search_exact("lets plan a trip to goa").hit
+    default = memories.partition("default")
+    assert default.search_exact("What is voltage?").hit
+    assert not default.search_exact("Tell me about hiking").hit
+    assert not memories.partition("summarization").search_exact("The system is production-ready with error handling").hit
+
+def test_jsonl_round_trip_with_vectors(tmp_path, encoder):
+    source = tmp_path / "faq.jsonl"
+    source.write_text("".join(
+        json.dumps({"query": f"question {i} about topic {i % 7}", "response": f"answer {i}"}) + "\n"
+        for i in range(50)
+    ) + "not json\n")
+    memories = NamespacedMemory(encoder, persist_dir=str(tmp_path / "a"), defaults={"write_behind": False})
+    assert import_records(memories, read_records(str(source), chunk_size=20))["stored"] == 50
+    assert import_records(memories, read_records(str(source)), skip_existing=True) == {"stored": 0, "skipped": 50}
+
+    exported = tmp_path / "out.jsonl.gz"
+    assert export_records(memories, str(exported), with_vectors=True) == 50
+    copy = NamespacedMemory(encoder, persist_dir=str(tmp_path / "b"), defaults={"write_behind": False})
+    assert import_records(copy, read_records(str(exported)))["stored"] == 50
+    assert copy.partition("default").search_exact("question 7 about topic 0").response == "answer 7"
@@ -0,0 +1,39 @@
+import random
+from chunking import split_document
+
+def paragraphs(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    words = "tide moon ocean heat pump energy cat purr sky blue light scatter wave sand shell".split()
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(10, 35))).capitalize() + "." for _ in range(n)]
+
+def test_short_paragraphs_are_packed_into_few_chunks():
+    document = "\n\n".join(paragraphs(60))
+    chunks = split_document(document, max_chars=1000)
+
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert all(len(chunk) >= 400 for chunk in chunks[:-1])
+    assert len(chunks) <= len(document) // 500 + 1
+    # Nothing lost or reordered
+    assert "\n\n".join(chunks) == document
+
+def test_editing_one_paragraph_only_changes_nearby_chunks():
+    original = paragraphs(60)
+    edited = list(original)
+    edited[20] = "Heat pumps move heat from outside to inside, even in winter."
+    before = split_document("\n\n".join(original), max_chars=1000)
+    after = split_document("\n\n".join(edited), max_chars=1000)
+
+    changed = [chunk for chunk in after if chunk not in before]
+    assert 1 <= len(changed) <= 2
+    assert any(edited[20] in chunk for chunk in changed)
+    # Chunks before and after the edit are identical, in order
+    kept = [chunk for chunk in after if chunk in before]
+    assert kept == [chunk for chunk in before if chunk in after]
+    assert len(kept) >= len(before) - 3
+
+def test_long_paragraphs_split_on_sentences_then_words():
+    sentence = "The moon pulls the ocean toward it as the earth turns. "
+    document = "Short opening paragraph.\n\n" + sentence * 40 + "\n\n" + "x" * 30 + " " + "word " * 300
+    chunks = split_document(document, max_chars=400)
+    assert all(len(chunk) <= 400 for chunk in chunks)
+    assert " ".join(" ".join(chunks).split()) == " ".join(document.split())
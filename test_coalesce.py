@@ -0,0 +1,84 @@
+import threading
+import time
+import numpy as np
+from coalesce import SingleFlight
+
+def unit(*values: float) -> np.ndarray:
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def test_equivalent_misses_share_one_generation():
+    flight = SingleFlight(similarity_threshold=0.9)
+    release = threading.Event()
+    calls = []
+    def generate(answer):
+        def fn():
+            calls.append(answer)
+            release.wait(5.0)
+            return answer
+        return fn
+
+    results = {}
+    def ask(name, key, embedding):
+        results[name] = flight.do(key, embedding, generate(f"answer to {name}"))
+
+    leader = threading.Thread(target=ask, args=("leader", "how do tides work", unit(1, 0, 0)))
+    leader.start()
+    wait_for(lambda: calls)
+    threads = [
+        threading.Thread(target=ask, args=("same key", "how do tides work", None)),
+        threading.Thread(target=ask, args=("paraphrase", "explain how tides work", unit(1, 0.1, 0))),
+        threading.Thread(target=ask, args=("unrelated", "why is the sky blue", unit(0, 1, 0)))
+    ]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flight.get_stats()["coalesced_requests"] == 2 and len(calls) == 2)
+    release.set()
+    for thread in [leader, *threads]:
+        thread.join()
+
+    assert sorted(calls) == ["answer to leader", "answer to unrelated"]
+    assert results["leader"] == ("answer to leader", False)
+    assert results["same key"] == results["paraphrase"] == ("answer to leader", True)
+    assert results["unrelated"] == ("answer to unrelated", False)
+    assert flight.get_stats()["inflight_generations"] == 0
+
+def test_followers_get_the_leaders_error_and_a_live_threshold():
+    threshold = [0.99]
+    flight = SingleFlight(similarity_threshold=lambda: threshold[0])
+    started, release = threading.Event(), threading.Event()
+    def fail():
+        started.set()
+        release.wait(5.0)
+        raise RuntimeError("upstream down")
+
+    errors = []
+    def ask(key, embedding, fn):
+        try:
+            flight.do(key, embedding, fn)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=ask, args=("how do tides work", unit(1, 0, 0), fail))
+    leader.start()
+    assert started.wait(5.0)
+    # Below the current threshold: generated separately
+    assert flight.do("explain how tides work", unit(1, 0.2, 0), lambda: "own answer") == ("own answer", False)
+
+    threshold[0] = 0.9
+    follower = threading.Thread(target=ask, args=("explain how tides work", unit(1, 0.2, 0), lambda: "unused"))
+    follower.start()
+    wait_for(lambda: flight.get_stats()["coalesced_requests"] == 1)
+    release.set()
+    leader.join()
+    follower.join()
+    assert errors == ["upstream down", "upstream down"]
+
+    # Nothing in flight is left behind, so the next call runs fresh
+    assert flight.do("how do tides work", unit(1, 0, 0), lambda: "retry") == ("retry", False)
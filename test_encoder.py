@@ -0,0 +1,48 @@
+import pytest
+from config import encoder_from_env
+from encoder import BatchingEncoder
+from conftest import HashingModel
+from memory import SemanticMemory
+
+class CountingModel(HashingModel):
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        self.texts.extend(texts)
+        return super().encode(texts, batch_size, **kwargs)
+
+def test_case_variants_share_one_encode():
+    model = CountingModel()
+    encoder = BatchingEncoder(model=model, model_name="all-MiniLM-L6-v2")
+
+    first = encoder.encode("What is  X ")
+    assert (encoder.encode("what is x") == first).all()
+    batch = encoder.encode_many(["WHAT IS X", "How about y", "how about Y"])
+    assert (batch[0] == first).all() and (batch[1] == batch[2]).all()
+    # Whitespace-normalised, first casing seen
+    assert model.texts == ["What is X", "How about y"]
+
+def test_empty_batch_keeps_dimension(encoder):
+    assert encoder.encode_many([]).shape == (0, 384)
+
+def test_declared_dimension_builds_a_memory_without_loading_the_model():
+    loads = []
+    encoder = BatchingEncoder(model_name="acme/custom-embedder", dimension=384,
+                              model_loader=lambda: loads.append(1) or HashingModel())
+    memory = SemanticMemory(encoder=encoder)
+    assert (memory.dimension, loads) == (384, [])
+
+    memory.store("what is a heat pump", "it moves heat")
+    assert loads == [1]
+    assert memory.search_exact("what is a heat pump").hit
+
+def test_unknown_models_need_a_declared_dimension(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MODEL", "acme/custom-embedder")
+    monkeypatch.delenv("EMBEDDING_DIM", raising=False)
+    with pytest.raises(ValueError, match="EMBEDDING_DIM"):
+        encoder_from_env()
+
+    monkeypatch.setenv("EMBEDDING_DIM", "512")
+    assert encoder_from_env().dimension == 512
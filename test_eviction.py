@@ -0,0 +1,89 @@
+import time
+import numpy as np
+from memory import SearchResult, SemanticMemory
+
+TOPICS = ["volcanoes", "glaciers", "comets", "coral", "tornadoes", "geysers", "auroras", "monsoons", "tsunamis",
+          "meteors", "deltas"]
+
+def cached(memory):
+    return {query for i, query in enumerate(memory.queries) if memory.entry_stats.alive[i]}
+
+def test_lru_evicts_the_least_recently_used(encoder):
+    memory = SemanticMemory(encoder=encoder, eviction_policy="lru", max_entries=4)
+    for topic in TOPICS[:4]:
+        memory.store(topic, f"about {topic}")
+    assert memory.search_exact("volcanoes").hit
+
+    # Five live entries: evicts down to 95% of the budget, i.e. the two least recently used
+    memory.store(TOPICS[4], f"about {TOPICS[4]}")
+    assert cached(memory) == {"volcanoes", "coral", "tornadoes"}
+    assert memory.evictions == 2
+
+def test_lfu_evicts_the_least_frequently_used(encoder):
+    memory = SemanticMemory(encoder=encoder, eviction_policy="lfu", max_entries=4)
+    for topic in TOPICS[:4]:
+        memory.store(topic, f"about {topic}")
+    for topic, hits in (("glaciers", 1), ("coral", 1), ("volcanoes", 3), ("comets", 2)):
+        for _ in range(hits):
+            assert memory.search_exact(topic).hit
+
+    # The new entry has no hits yet; glaciers and coral tie on one, glaciers was hit first
+    memory.store(TOPICS[4], f"about {TOPICS[4]}")
+    assert cached(memory) == {"volcanoes", "comets", "coral"}
+
+def test_ttl_evicts_the_soonest_to_expire(encoder):
+    memory = SemanticMemory(encoder=encoder, eviction_policy="ttl", max_entries=4)
+    for topic, ttl in zip(TOPICS[:4], (300, None, 60, 600)):
+        memory.store(topic, f"about {topic}", ttl_seconds=ttl)
+    assert memory.search_exact("comets").hit
+
+    # Hits do not matter; entries without a TTL go last
+    memory.store(TOPICS[4], f"about {TOPICS[4]}", ttl_seconds=900)
+    assert cached(memory) == {"glaciers", "coral", "tornadoes"}
+
+def test_expired_entries_are_swept_on_store(encoder):
+    memory = SemanticMemory(encoder=encoder, ttl_seconds=0.05)
+    memory.store("volcanoes", "about volcanoes")
+    memory.store("glaciers", "about glaciers", ttl_seconds=60)
+    time.sleep(0.1)
+    assert not memory.search_exact("volcanoes").hit
+
+    # The sweep runs at most once a second; the next store after that drops the expired row
+    memory._next_expiry_sweep = 0.0
+    memory.store("comets", "about comets")
+    assert cached(memory) == {"glaciers", "comets"}
+    assert memory.evictions == 1
+
+def test_compaction_starts_past_a_quarter_tombstones(encoder):
+    memory = SemanticMemory(encoder=encoder, max_entries=8)
+    for topic in TOPICS[:9]:
+        memory.store(topic, f"about {topic}")
+    # Two of nine rows dead (22%): left in place
+    assert (memory.entry_stats.size, memory.entry_stats.tombstones) == (9, 2)
+    assert memory.index.ntotal == 9
+
+    for topic in TOPICS[9:]:
+        memory.store(topic, f"about {topic}")
+    # Four of eleven (36%): the second eviction compacts
+    assert (memory.entry_stats.size, memory.entry_stats.tombstones) == (7, 0)
+    assert memory.index.ntotal == len(memory.queries) == len(memory.response_keys) == 7
+
+def test_store_and_index_agree_after_compaction(tmp_path, encoder):
+    memory = SemanticMemory(encoder=encoder, persist_dir=str(tmp_path), max_entries=8)
+    for topic in TOPICS:
+        memory.store(f"tell me about {topic}", f"about {topic}")
+    assert memory.entry_stats.tombstones == 0
+    survivors = list(memory.queries)
+    assert len(survivors) == 7
+
+    reopened = SemanticMemory(encoder=encoder, persist_dir=str(tmp_path), max_entries=8)
+    assert reopened.queries == survivors
+    assert reopened.index.ntotal == len(survivors)
+    for loaded in (memory, reopened):
+        for i, query in enumerate(survivors):
+            # Row i of the index is still the vector of query i, in memory and on disk
+            vector = loaded.index.get_vectors()[i]
+            assert np.allclose(vector, loaded.encode(query), atol=1e-3)
+            # Skip tier 0 so the answer comes from the index
+            result = loaded.search_detailed(query, loaded.encode(query), exact=SearchResult())
+            assert (result.query, result.response) == (query, "about " + query.rsplit(" ", 1)[1])
@@ -0,0 +1,41 @@
+import numpy as np
+from coalesce import SingleFlight, _Call
+from feedback import AdaptiveThreshold
+from memory import SemanticMemory
+
+def controller(encoder, **config) -> AdaptiveThreshold:
+    memory = SemanticMemory(similarity_threshold=0.8, encoder=encoder)
+    return AdaptiveThreshold(memory, min_samples=10, update_every=10, **config)
+
+def test_threshold_holds_without_positive_evidence(encoder):
+    adaptive = controller(encoder)
+    for _ in range(500):
+        adaptive.record_hit(0.9)
+        adaptive.record_query()
+    assert adaptive.threshold == 0.8
+
+def test_threshold_creeps_down_on_confirmed_hits_near_it(encoder):
+    adaptive = controller(encoder, min_confirmed=3)
+    for _ in range(20):
+        adaptive.record_hit(0.82)
+    for _ in range(3):
+        adaptive.record_good(0.82)
+    # Far above the threshold says nothing about looser matches
+    adaptive.record_good(0.99)
+    for _ in range(10):
+        adaptive.record_query()
+    assert adaptive.threshold == 0.795
+    # The evidence is used up by the move
+    for _ in range(10):
+        adaptive.record_query()
+    assert adaptive.threshold == 0.795
+
+def test_single_flight_follows_a_moving_threshold(encoder):
+    memory = SemanticMemory(similarity_threshold=0.99, encoder=encoder)
+    flight = SingleFlight(similarity_threshold=lambda: memory.similarity_threshold)
+    a = np.array([1.0, 0.0], dtype=np.float32)
+    b = np.array([0.9, np.sqrt(1 - 0.81)], dtype=np.float32)
+    flight._pending.append(_Call("a", a))
+    assert flight._find("b", b) is None
+    memory.similarity_threshold = 0.85
+    assert flight._find("b", b) is not None
@@ -0,0 +1,135 @@
+import threading
+import time
+import pytest
+import llm
+from llm import CircuitBreaker, ModelError, NegativeCache
+from scheduler import LLMScheduler
+
+def test_retry_releases_slot_and_is_readmitted(monkeypatch):
+    scheduler = LLMScheduler(max_concurrency=1, limits={"*": {"rps": 100}})
+    monkeypatch.setattr(llm, "scheduler", scheduler)
+    monkeypatch.setattr(llm, "MAX_RETRIES", 2)
+    monkeypatch.setattr(llm, "RETRY_MAX_BACKOFF", 0.05)
+
+    failures = [ModelError("busy", status=503), ModelError("slow down", status=429, retry_after=0.0)]
+    def attempt(model, prompt, max_tokens):
+        if failures:
+            raise failures.pop(0)
+        return "answer", {"prompt_tokens": 3, "completion_tokens": 5}
+    monkeypatch.setattr(llm, "_attempt_model", attempt)
+
+    in_flight_during_backoff = []
+    monkeypatch.setattr(llm, "_sleep", lambda seconds: in_flight_during_backoff.append(
+        scheduler.get_stats()["in_flight"]))
+    acquired = []
+    acquire = scheduler.acquire
+    monkeypatch.setattr(scheduler, "acquire", lambda *args, **kwargs: acquired.append(args[0]) or acquire(*args, **kwargs))
+
+    reservation = scheduler.acquire(["model-a"], "bulk", 10)
+    assert llm._scheduled_call(reservation, "prompt", 8) == "answer"
+
+    assert in_flight_during_backoff == [0, 0]
+    # The first reservation plus one per retry, each through the token buckets
+    assert acquired == [["model-a"]] * 3
+    assert scheduler.get_stats()["in_flight"] == 0
+    assert scheduler.get_stats()["usage"]["model-a"]["calls"] == 1
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fresh breaker, negative cache and scheduler; ``attempt`` stands in for the HTTP call"""
+    monkeypatch.setattr(llm, "circuit_breaker", CircuitBreaker(failure_threshold=2, cooldown=0.5))
+    monkeypatch.setattr(llm, "negative_cache", NegativeCache(ttl=30.0))
+    monkeypatch.setattr(llm, "scheduler", LLMScheduler(max_concurrency=4))
+    monkeypatch.setattr(llm, "MAX_RETRIES", 0)
+    calls = []
+    answers = {}
+    def attempt(model, prompt, max_tokens):
+        calls.append(model)
+        answer = answers[model]
+        if callable(answer):
+            answer = answer()
+        if isinstance(answer, Exception):
+            raise answer
+        return answer, None
+    monkeypatch.setattr(llm, "_attempt_model", attempt)
+    return calls, answers
+
+def test_circuit_opens_after_repeated_failures_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.2, permanent_cooldown=60.0)
+    breaker.record_failure("model-a")
+    assert breaker.is_available("model-a")
+    breaker.record_failure("model-a")
+    assert not breaker.is_available("model-a")
+
+    time.sleep(0.3)
+    # Half-open: one probe is let through, and a failed probe reopens at once
+    assert breaker.is_available("model-a")
+    breaker.record_failure("model-a")
+    assert not breaker.is_available("model-a")
+    time.sleep(0.3)
+    breaker.record_success("model-a")
+    breaker.record_failure("model-a")
+    assert breaker.is_available("model-a")
+
+    breaker.record_failure("model-b", permanent=True)
+    time.sleep(0.3)
+    assert not breaker.is_available("model-b")
+
+def test_generate_skips_models_with_an_open_circuit(upstream):
+    calls, answers = upstream
+    answers.update({"model-a": ModelError("down", status=503), "model-b": "answer from b",
+                    "model-c": ModelError("rate limited", status=429)})
+
+    for _ in range(2):
+        assert llm.generate("prompt", models=["model-a", "model-b"]).model == "model-b"
+    assert calls == ["model-a", "model-b"] * 2
+    calls.clear()
+    assert llm.generate("prompt", models=["model-a", "model-b"]).model == "model-b"
+    assert calls == ["model-b"]
+
+    # Rate limiting says nothing about health
+    for _ in range(3):
+        llm.generate("another prompt", models=["model-c", "model-b"])
+    assert llm.circuit_breaker.is_available("model-c")
+
+def test_slow_model_is_hedged_and_total_failure_falls_back(upstream, monkeypatch):
+    calls, answers = upstream
+    monkeypatch.setattr(llm, "HEDGE_DELAY", 0.05)
+    release = threading.Event()
+    answers.update({"model-a": lambda: release.wait(5.0) and "late answer from a", "model-b": "answer from b"})
+
+    result = llm.generate("prompt", models=["model-a", "model-b"])
+    release.set()
+    assert (result.text, result.model, result.status) == ("answer from b", "model-b", "ok")
+    assert calls == ["model-a", "model-b"]
+
+    calls.clear()
+    answers.update({"model-a": ModelError("down", status=500), "model-b": ModelError("down", status=500)})
+    result = llm.generate("doomed prompt", models=["model-a", "model-b"])
+    assert result.status == "fallback" and result.model is None
+    assert llm.is_fallback_text("doomed prompt", result.text)
+    calls.clear()
+    # A repeat is answered from the negative cache without another round upstream
+    assert llm.generate("doomed prompt", models=["model-a", "model-b"]).status == "negative_cached"
+    assert calls == []
+
+def test_negative_cache_entries_expire_after_the_ttl():
+    cache = NegativeCache(ttl=0.2, max_entries=2)
+    cache.add("doomed prompt")
+    assert cache.check("doomed prompt") and not cache.check("other prompt")
+    time.sleep(0.3)
+    assert not cache.check("doomed prompt")
+    assert cache.get_stats() == {"ttl_seconds": 0.2, "entries": 0, "hits": 1}
+
+    # Oldest dropped first past max_entries; a zero TTL disables the cache
+    for prompt in ["a", "b", "c"]:
+        cache.add(prompt)
+    assert [cache.check(prompt) for prompt in ["a", "b", "c"]] == [False, True, True]
+    disabled = NegativeCache(ttl=0)
+    disabled.add("doomed prompt")
+    assert not disabled.check("doomed prompt")
+
+def test_fallback_text_is_recognised():
+    for prompt in ["how does electricity work", "tell me about hiking"]:
+        assert llm.is_fallback_text(prompt, llm.get_smart_fallback(prompt))
+    assert not llm.is_fallback_text("how does electricity work", "Electrons flow through copper.")
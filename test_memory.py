@@ -0,0 +1,64 @@
+import sys
+import threading
+import pytest
+from agent import DirectAgent
+from llm import Generation
+from memory import SemanticMemory
+
+@pytest.fixture
+def racy():
+    # Switch threads as often as possible so unguarded read-modify-writes collide
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+def test_concurrent_lookups_count_every_hit(encoder, racy):
+    memory = SemanticMemory(encoder=encoder, eviction_policy="lfu", max_entries=4)
+    topics = ["solar panels", "tidal power", "wind turbines", "geothermal wells"]
+    for topic in topics:
+        memory.store(f"how do {topic} work", f"about {topic}")
+    embeddings = {topic: memory.encode(f"explain how {topic} work") for topic in topics}
+
+    # Entry i is hit 50 * (i + 1) times per thread, alternating the exact and semantic tiers
+    def worker():
+        for i, topic in enumerate(topics):
+            for n in range(50 * (i + 1)):
+                if n % 2:
+                    assert memory.search_exact(f"how do {topic} work").hit
+                else:
+                    assert memory.search_detailed(f"explain how {topic} work", embeddings[topic]).hit
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    per_thread = [50 * (i + 1) for i in range(len(topics))]
+    assert memory.hits == 8 * sum(per_thread)
+    assert memory.tier_hits == {"exact": 8 * sum(per_thread) // 2, "semantic": 8 * sum(per_thread) // 2}
+    assert list(memory.entry_stats.hits[:4]) == [8 * n for n in per_thread]
+
+    # LFU evicts the least-hit entry first
+    memory.store("how do heat pumps work", "about heat pumps")
+    assert memory.search_exact("how do solar panels work").hit is False
+    assert all(memory.search_exact(f"how do {topic} work").hit for topic in topics[1:])
+
+def test_exact_tier_runs_once_per_lookup(encoder, monkeypatch):
+    memory = SemanticMemory(encoder=encoder)
+    memory.store("what is a heat pump", "it moves heat")
+    calls = []
+    search_exact = memory.search_exact
+    monkeypatch.setattr(memory, "search_exact", lambda query, *args: calls.append(query) or search_exact(query, *args))
+    agent = DirectAgent(memory, generate_fn=lambda prompt: Generation("generated", "model-a"))
+
+    assert agent.process_query("explain quantum tunnelling")["response"] == "generated"
+    # Once up front; the re-check just before generating only searches the index
+    assert calls == ["explain quantum tunnelling"]
+    assert (memory.hits, memory.misses) == (0, 1)
+
+    calls.clear()
+    agent.process_batch(["what is a heat pump?", "how do magnets work"])
+    assert sorted(calls) == ["how do magnets work", "what is a heat pump?"]
+    assert (memory.hits, memory.misses) == (1, 2)
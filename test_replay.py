@@ -0,0 +1,53 @@
+import sys
+import agent
+import replay
+from conftest import HashingModel
+from encoder import BatchingEncoder
+from llm import Generation
+from namespaces import NamespacedMemory
+from replay import select_queries, warm
+
+def test_warm_calls_the_llm_at_bulk_priority(tmp_path, encoder, monkeypatch):
+    priorities = []
+    def generate(prompt, models=None, priority="interactive"):
+        priorities.append(priority)
+        return Generation(f"answer to {prompt}", "model-a")
+    monkeypatch.setattr(agent, "generate", generate)
+    memories = NamespacedMemory(encoder, persist_dir=str(tmp_path))
+
+    outcome = warm(memories, [("support", "how do I reset my password", 3), ("planning", "ship the release", 1)])
+
+    assert outcome == {"stored": 2}
+    assert priorities == ["bulk", "bulk"]
+    assert memories.partition("support").search_exact("how do I reset my password").hit
+
+def test_failed_records_are_not_replayed():
+    records = [
+        {"namespace": "default", "query": "what is a heat pump", "result": "miss"},
+        {"namespace": "default", "query": "what is a heat pump", "result": "hit"},
+        {"namespace": "default", "query": "why is the sky blue", "result": "error"},
+        {"namespace": "default", "query": "why is the sky blue", "result": "fallback"},
+        {"namespace": "default", "query": "how do tides work", "result": "fallback"},
+        {"namespace": "default", "query": "how do tides work", "result": "miss"}
+    ]
+    assert select_queries(records) == [("default", "what is a heat pump", 2), ("default", "how do tides work", 1)]
+
+def test_main_opens_the_cache_with_the_app_settings(tmp_path, monkeypatch):
+    monkeypatch.setenv("MEMORY_SIMILARITY_THRESHOLD", "0.9")
+    monkeypatch.setenv("MEMORY_INDEX_TYPE", "hnsw")
+    monkeypatch.setenv("MEMORY_NAMESPACES", '{"support": {"similarity_threshold": 0.8}}')
+    opened = {}
+    def warm_from_log(memories, log_path, **kwargs):
+        opened.update(memories=memories, log_path=log_path)
+        return {}
+    monkeypatch.setattr(replay, "warm_from_log", warm_from_log)
+    monkeypatch.setattr(replay, "encoder_from_env", lambda: BatchingEncoder(model=HashingModel(),
+                                                                           model_name="all-MiniLM-L6-v2"))
+    monkeypatch.setattr(sys, "argv", ["replay.py", "--memory-dir", str(tmp_path), "--log", str(tmp_path / "logs")])
+
+    replay.main()
+    memories = opened["memories"]
+    assert memories.persist_dir == str(tmp_path)
+    assert memories.partition("default").similarity_threshold == 0.9
+    assert memories.partition("default").index.index_type == "hnsw"
+    assert memories.partition("support").similarity_threshold == 0.8
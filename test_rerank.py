@@ -0,0 +1,44 @@
+import threading
+import time
+import pytest
+from rerank import CrossEncoderReranker, RerankTimeout
+
+class SlowModel:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.calls = 0
+        self.release = threading.Event()
+
+    def predict(self, pairs):
+        self.calls += 1
+        self.release.wait(self.seconds)
+        return [0.5] * len(pairs)
+
+def test_overrun_batches_do_not_queue_up():
+    reranker = CrossEncoderReranker(max_workers=1)
+    reranker._model = model = SlowModel(seconds=5.0)
+    pairs = [("trip to paris", "trip to rome"), ("trip to paris", "a trip to paris")]
+
+    with pytest.raises(RerankTimeout) as timed_out:
+        reranker.score_within(pairs, budget=0.01)
+    # Lexical order instead: the second candidate shares more words
+    assert timed_out.value.fallback[1] > timed_out.value.fallback[0]
+
+    start = time.perf_counter()
+    for _ in range(20):
+        with pytest.raises(RerankTimeout) as busy:
+            reranker.score_within(pairs, budget=0.01)
+        assert busy.value.fallback is not None
+    # Skipped while the worker is busy, without waiting out the budget or queueing
+    assert time.perf_counter() - start < 0.1
+    assert reranker._pool._work_queue.qsize() == 0
+
+    model.release.set()
+    model.seconds = 0.0
+    for _ in range(100):
+        try:
+            assert list(reranker.score_within(pairs, budget=1.0)) == [0.5, 0.5]
+            break
+        except RerankTimeout:
+            time.sleep(0.01)
+    assert model.calls == 2
@@ -0,0 +1,51 @@
+import pytest
+from memory import SemanticMemory
+from responses import ResponseStore, response_key
+
+def test_shared_responses_are_freed_with_their_last_reference():
+    store = ResponseStore()
+    key, new = store.add("it moves heat")
+    assert new and key == response_key("it moves heat")
+    assert store.add("it moves heat") == (key, False)
+    store.add_ref(key)
+    assert store.get_stats()["unique_responses"] == 1 and store.references == 3
+
+    store.release(key)
+    store.release(key)
+    assert key in store and store.get(key) == "it moves heat"
+    store.release(key)
+    assert key not in store
+    assert (store.references, store.stored_bytes, store.raw_bytes) == (0, 0, 0)
+    # Releasing an unknown key is a no-op
+    store.release(key)
+
+@pytest.mark.parametrize("compression", ["zlib", "zstd"])
+def test_compression_round_trips(compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    store = ResponseStore(compression, min_bytes=64)
+    long_text = "Heat pumps move heat from outside to inside — even in winter. " * 40
+    short_text = "it moves heat"
+    # Every character once: too short and varied for compression to save anything
+    incompressible = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_"
+
+    keys = [store.add(text)[0] for text in (long_text, short_text, incompressible)]
+    assert [store.get(key) for key in keys] == [long_text, short_text, incompressible]
+    assert store.stored_size(keys[0]) < len(long_text.encode("utf-8"))
+    # Under min_bytes, or not made smaller by compressing: kept as text
+    assert store.stored_size(keys[1]) == len(short_text)
+    assert store.stored_size(keys[2]) == len(incompressible)
+    assert store.raw_bytes == sum(len(text.encode("utf-8")) for text in (long_text, short_text, incompressible))
+
+def test_memory_releases_responses_of_evicted_entries(encoder):
+    memory = SemanticMemory(encoder=encoder, max_entries=2, response_compression="zlib", compress_min_bytes=16)
+    answer = "Tides are caused by the moon's gravity pulling on the oceans. " * 5
+    memory.store("how do tides work", answer)
+    memory.store("what causes ocean tides", answer)
+    assert memory.response_store.get_stats()["unique_responses"] == 1
+    assert memory.search_exact("what causes ocean tides").response == answer
+
+    memory.store("why is the sky blue", "scattering")
+    memory.store("why do cats purr", "contentment")
+    assert memory.response_store.get_stats()["unique_responses"] == 2
+    assert response_key(answer) not in memory.response_store
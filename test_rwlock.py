@@ -0,0 +1,70 @@
+import threading
+import time
+from rwlock import ReadWriteLock
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    both_inside = threading.Barrier(2, timeout=5.0)
+    def reader():
+        with lock.read():
+            both_inside.wait()
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not both_inside.broken
+
+def test_writer_excludes_readers_and_goes_ahead_of_new_ones():
+    lock = ReadWriteLock()
+    order = []
+    first_reader_in, release_reader = threading.Event(), threading.Event()
+    def first_reader():
+        with lock.read():
+            first_reader_in.set()
+            release_reader.wait(5.0)
+            order.append("first reader")
+    def writer():
+        with lock.write():
+            order.append("writer")
+    def late_reader():
+        with lock.read():
+            order.append("late reader")
+
+    threads = [threading.Thread(target=first_reader)]
+    threads[0].start()
+    assert first_reader_in.wait(5.0)
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    # The writer waits for the reader inside; a reader arriving now queues behind the writer
+    while not lock._writers_waiting:
+        time.sleep(0.001)
+    threads.append(threading.Thread(target=late_reader))
+    threads[2].start()
+    threads[2].join(0.1)
+    assert order == []
+
+    release_reader.set()
+    for thread in threads:
+        thread.join(5.0)
+    assert order == ["first reader", "writer", "late reader"]
+
+def test_writers_are_exclusive():
+    lock = ReadWriteLock()
+    inside = []
+    overlaps = []
+    def writer():
+        for _ in range(200):
+            with lock.write():
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(len(inside))
+                inside.pop()
+
+    threads = [threading.Thread(target=writer) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
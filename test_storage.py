@@ -0,0 +1,131 @@
+import os
+import numpy as np
+import pytest
+from memory import SemanticMemory
+from storage import ENTRIES_FILE, VECTOR_FILE, DiskStore, StoreRewritten, open_store
+
+DIMENSION = 8
+
+def rows(start: int, n: int):
+    vectors = np.arange(start * DIMENSION, (start + n) * DIMENSION, dtype=np.float32).reshape(n, DIMENSION)
+    return vectors, [{"q": f"query {i}", "r": f"response {i}", "t": 0.0} for i in range(start, start + n)]
+
+@pytest.fixture(params=["disk", "sqlite"])
+def stores(request, tmp_path):
+    """Two handles on one store, standing in for two processes or nodes"""
+    location = str(tmp_path / "store")
+    if request.param == "sqlite":
+        location += ".sqlite3"
+    first, second = (open_store(request.param, location, DIMENSION, encoder="test-encoder") for _ in range(2))
+    yield first, second
+    first.close()
+    second.close()
+
+def test_changes_carry_foreign_rows_and_deletions(stores):
+    writer, reader = stores
+    writer.load()
+    reader.load()
+    assert not reader.has_changes()
+
+    with writer.locked():
+        writer.changes()
+        writer.append(*rows(0, 3))
+    assert reader.has_changes()
+    vectors, entries, deleted = reader.changes()
+    np.testing.assert_array_equal(vectors, rows(0, 3)[0])
+    assert [e["q"] for e in entries] == ["query 0", "query 1", "query 2"]
+    assert deleted == []
+    assert not reader.has_changes()
+
+    with writer.locked():
+        writer.changes()
+        writer.delete(np.array([1]))
+        writer.append(*rows(3, 1))
+    vectors, entries, deleted = reader.changes()
+    assert [e["q"] for e in entries] == ["query 3"]
+    assert deleted == [1]
+    assert reader.count == writer.count == 4
+
+def test_rewrite_and_clear_raise_store_rewritten(stores):
+    writer, reader = stores
+    writer.load()
+    with writer.locked():
+        writer.append(*rows(0, 4))
+    reader.load()
+
+    # Compaction renumbers rows, so readers must reload rather than apply a tail
+    with writer.locked():
+        writer.rewrite(*rows(10, 2))
+    assert reader.has_changes()
+    with pytest.raises(StoreRewritten):
+        reader.changes()
+    vectors, entries, deleted = reader.load()
+    np.testing.assert_array_equal(np.asarray(vectors), rows(10, 2)[0])
+    assert [e["q"] for e in entries] == ["query 10", "query 11"]
+    assert deleted == set()
+
+    with writer.locked():
+        writer.clear()
+    with pytest.raises(StoreRewritten):
+        reader.changes()
+    assert len(reader.load()[1]) == 0
+
+def test_sqlite_changes_are_per_namespace(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    support, planning, other_node = (open_store("sqlite", path, DIMENSION, namespace=name)
+                                     for name in ("support", "planning", "support"))
+    for store in (support, planning, other_node):
+        store.load()
+
+    with planning.locked():
+        planning.append(*rows(0, 2))
+        planning.delete(np.array([0]))
+    assert not support.has_changes()
+
+    with other_node.locked():
+        other_node.append(*rows(0, 1))
+    assert support.has_changes()
+    support.changes()
+    assert not support.has_changes()
+    for store in (support, planning, other_node):
+        store.close()
+
+def test_load_trims_torn_tail(tmp_path):
+    path = str(tmp_path / "store")
+    store = DiskStore(path, DIMENSION)
+    store.load()
+    store.append(*rows(0, 2))
+    store.close()
+
+    # A crash mid-append: a third vector half written and its sidecar line cut short
+    with open(os.path.join(path, VECTOR_FILE), "ab") as f:
+        f.write(rows(2, 1)[0].tobytes()[:DIMENSION * 2])
+    with open(os.path.join(path, ENTRIES_FILE), "ab") as f:
+        f.write(b'{"q":"query 2","r":')
+
+    reopened = DiskStore(path, DIMENSION)
+    vectors, entries, _ = reopened.load()
+    assert [e["q"] for e in entries] == ["query 0", "query 1"]
+    np.testing.assert_array_equal(np.asarray(vectors), rows(0, 2)[0])
+    assert os.path.getsize(os.path.join(path, VECTOR_FILE)) == 2 * DIMENSION * 4
+
+    # A vector whose sidecar line never made it is dropped too, and appends line up after it
+    with open(os.path.join(path, VECTOR_FILE), "ab") as f:
+        f.write(rows(2, 1)[0].tobytes())
+    vectors, entries, _ = reopened.load()
+    assert len(entries) == 2 and len(vectors) == 2
+    reopened.append(*rows(5, 1))
+    vectors, entries, _ = DiskStore(path, DIMENSION).load()
+    assert [e["q"] for e in entries] == ["query 0", "query 1", "query 5"]
+    np.testing.assert_array_equal(np.asarray(vectors)[2], rows(5, 1)[0][0])
+    reopened.close()
+
+def test_disk_store_is_created_by_the_first_write(encoder, tmp_path):
+    path = str(tmp_path / "store")
+    memory = SemanticMemory(encoder=encoder, persist_dir=path)
+    assert memory.search("what is a heat pump") is None
+    assert not os.path.exists(path)
+
+    memory.store("what is a heat pump", "it moves heat")
+    assert DiskStore.read_meta(path)["encoder"] == encoder.fingerprint
+    assert SemanticMemory(encoder=encoder, persist_dir=path).search_exact("what is a heat pump").hit
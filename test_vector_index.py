@@ -0,0 +1,40 @@
+import numpy as np
+from vector_index import VectorIndex
+
+def clustered(n: int, dimension: int = 384, clusters: int = 20, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dimension))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def near_duplicates(vectors: np.ndarray, seed: int = 1) -> np.ndarray:
+    noisy = vectors + 0.02 * np.random.default_rng(seed).normal(size=vectors.shape)
+    return (noisy / np.linalg.norm(noisy, axis=1, keepdims=True)).astype(np.float32)
+
+def test_ivfpq_scores_are_exact_cosine_for_near_duplicates():
+    vectors = clustered(5000)
+    index = VectorIndex(vectors.shape[1], index_type="ivfpq", migrate_at=1000)
+    index.add(vectors)
+    assert index.active_type == "ivfpq"
+
+    targets = np.arange(0, 5000, 25)
+    queries = near_duplicates(vectors[targets])
+    scores, ids = index.search(queries, 1)
+
+    exact = np.einsum("ij,ij->i", queries, vectors[targets])
+    assert (ids[:, 0] == targets).mean() >= 0.99
+    hit = ids[:, 0] == targets
+    np.testing.assert_allclose(scores[hit, 0], exact[hit], atol=1e-4)
+    # The same near-duplicates a flat index answers at a 0.9 threshold
+    assert (scores[:, 0] >= 0.9).all()
+
+def test_ivfpq_snapshot_keeps_refinement():
+    vectors = clustered(2000)
+    index = VectorIndex(vectors.shape[1], index_type="ivfpq", migrate_at=1000)
+    index.add(vectors)
+    restored = VectorIndex(vectors.shape[1], index_type="ivfpq", migrate_at=1000)
+    restored.restore(index.serialize(), index.active_type, index.trained_size)
+
+    queries = near_duplicates(vectors[:50])
+    np.testing.assert_array_equal(restored.search(queries, 1)[1], index.search(queries, 1)[1])
+    np.testing.assert_allclose(restored.get_vectors()[:50], vectors[:50], atol=1e-6)
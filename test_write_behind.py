@@ -0,0 +1,126 @@
+import os
+import threading
+import numpy as np
+import pytest
+from memory import SemanticMemory
+from storage import DiskStore
+from vector_index import VectorIndex
+
+class Gate:
+    """Holds the worker inside write_batch until released"""
+
+    def __init__(self, write_batch):
+        self.write_batch = write_batch
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, writes):
+        self.entered.set()
+        assert self.release.wait(5.0)
+        self.write_batch(writes)
+
+def gated(memory: SemanticMemory) -> Gate:
+    memory.writer.write_batch = gate = Gate(memory.writer.write_batch)
+    return gate
+
+def test_queued_write_is_read_back_by_exact_repeats(encoder):
+    memory = SemanticMemory(encoder=encoder, write_behind=True)
+    gate = gated(memory)
+
+    memory.store_async("how do tides work", "the moon pulls the sea")
+    assert gate.entered.wait(5.0)
+    result = memory.search_exact("How do tides  work?")
+    assert (result.response, result.tier) == ("the moon pulls the sea", "exact")
+    # Not embedded or indexed yet, so paraphrases still miss
+    assert memory.search("explain how tides work") is None
+
+    gate.release.set()
+    assert memory.flush(5.0)
+    assert memory.writer.pending("how do tides work") is None
+    assert memory.search("explain how tides work") == "the moon pulls the sea"
+
+def test_concurrent_misses_are_stored_once(encoder):
+    memory = SemanticMemory(encoder=encoder, similarity_threshold=0.85, write_behind=True)
+    memory.store("what is a heat pump", "it moves heat")
+    for query in ["how do magnets work", "How do magnets work?", "how do fridge magnets work",
+                  "What is a heat pump?", "why is the sky blue"]:
+        memory.store_async(query, f"answer to {query}")
+    assert memory.flush(5.0)
+
+    assert memory.entry_stats.live_count == 3
+    assert memory.write_duplicates == 3
+    assert memory.search_exact("how do magnets work").response == "answer to how do magnets work"
+    assert memory.search_exact("what is a heat pump").response == "it moves heat"
+
+def test_clear_discards_queued_writes(encoder):
+    memory = SemanticMemory(encoder=encoder, write_behind=True, write_batch=1)
+    gate = gated(memory)
+    memory.store_async("how do tides work", "the moon")
+    assert gate.entered.wait(5.0)
+    for topic in ["magnets", "rainbows", "volcanoes"]:
+        memory.store_async(f"how do {topic} work", topic)
+
+    memory.clear()
+    assert memory.writer.get_stats()["write_queue"] == 1
+    assert memory.search_exact("how do magnets work").hit is False
+    # The batch taken before clear() sees the new epoch and writes nothing
+    gate.release.set()
+    assert memory.flush(5.0)
+    assert memory.entry_stats.live_count == 0
+    assert memory.writer.get_stats()["write_queue"] == 0
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_starts_with_an_empty_writer(encoder):
+    memory = SemanticMemory(encoder=encoder, write_behind=True)
+    gate = gated(memory)
+    memory.store_async("how do tides work", "the moon")
+    assert gate.entered.wait(5.0)
+
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            gate.release.set()
+            writer = memory.writer
+            ok = (writer.pending("how do tides work") is None and writer.get_stats()["write_queue"] == 0
+                  and writer._worker is None)
+            # A fresh worker serves the child's own writes
+            memory.store_async("how do magnets work", "magnetism")
+            ok = ok and memory.flush(5.0) and memory.search_exact("how do magnets work").hit
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+    # The parent keeps and still writes its queued entry
+    assert memory.writer.pending("how do tides work") is not None
+    gate.release.set()
+    assert memory.flush(5.0)
+    assert memory.search("explain how tides work") == "the moon"
+
+def test_snapshot_from_another_generation_is_ignored(encoder, tmp_path, monkeypatch):
+    path = str(tmp_path / "store")
+    memory = SemanticMemory(encoder=encoder, persist_dir=path)
+    for topic in ["solar power", "tidal power", "wind power"]:
+        memory.store(f"what is {topic}", f"about {topic}")
+    assert memory.snapshot()
+    memory.disk.close()
+
+    restores = []
+    restore = VectorIndex.restore
+    monkeypatch.setattr(VectorIndex, "restore", lambda self, *args: restores.append(args) or restore(self, *args))
+    assert SemanticMemory(encoder=encoder, persist_dir=path).search("so what is tidal power") == "about tidal power"
+    assert len(restores) == 1
+
+    # Same row count and last query, but rows 0 and 1 swapped by a rewrite
+    store = DiskStore(path, encoder.dimension, encoder=encoder.fingerprint)
+    vectors, entries, _ = store.load()
+    vectors = np.array(vectors)
+    store.rewrite(vectors[[1, 0, 2]], [entries[1], entries[0], entries[2]])
+    store.close()
+
+    restores.clear()
+    reopened = SemanticMemory(encoder=encoder, persist_dir=path)
+    assert restores == []
+    assert reopened.search("so what is tidal power") == "about tidal power"
+    assert reopened.search("so what is solar power") == "about solar power"
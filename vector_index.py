@@ -0,0 +1,162 @@
+import logging
+import math
+import numpy as np
+import faiss
+from typing import Callable, Optional, Tuple
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+TRAINED_TYPES = ("ivf", "ivfpq")
+
+logger = logging.getLogger(__name__)
+
+
+class VectorIndex:
+    """Inner-product FAISS index with optional approximate backends.
+
+    Every index starts as an exact ``IndexFlatIP``. When ``index_type`` is one of
+    the approximate backends the index migrates to it once ``migrate_at`` vectors
+    have accumulated, and the IVF variants are retrained whenever the collection
+    grows by ``retrain_growth`` since the last training. Row ids always match
+    insertion order, so callers can keep parallel lists of payloads.
+
+    IVF-PQ scores are only approximations of the inner product, so its top
+    ``refine_factor * k`` candidates are re-scored against the exact vectors:
+    scores stay comparable to the cosine similarity threshold.
+    """
+
+    def __init__(self, dimension: int, index_type: str = "flat", migrate_at: int = 10000,
+                 nprobe: int = 16, ef_search: int = 64, hnsw_m: int = 32, pq_m: int = 16,
+                 retrain_growth: float = 4.0, refine_factor: int = 32,
+                 vector_source: Optional[Callable[[], np.ndarray]] = None):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        self.dimension = dimension
+        self.index_type = index_type
+        # PQ codebooks need at least 256 training points per sub-quantizer
+        self.migrate_at = max(migrate_at, 256) if index_type == "ivfpq" else migrate_at
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.hnsw_m = hnsw_m
+        self.pq_m = pq_m
+        self.retrain_growth = retrain_growth
+        self.refine_factor = refine_factor
+        self.vector_source = vector_source
+
+        self.active_type = "flat"
+        self.trained_size = 0
+        self.index = faiss.IndexFlatIP(dimension)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def add(self, vectors: np.ndarray) -> None:
+        """Add normalized vectors, migrating or retraining when thresholds are crossed"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        self.index.add(vectors)
+
+        if self.index_type == "flat":
+            return
+        if self.active_type == "flat" and self.ntotal >= self.migrate_at:
+            self.rebuild()
+        elif self.active_type in TRAINED_TYPES and self.ntotal >= self.trained_size * self.retrain_growth:
+            self.rebuild()
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, row ids) for the k nearest neighbours of each query"""
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dimension)
+        if self.active_type in TRAINED_TYPES:
+            faiss.extract_index_ivf(self.index).nprobe = self.nprobe
+        elif self.active_type == "hnsw":
+            self.index.hnsw.efSearch = max(self.ef_search, k)
+        return self.index.search(queries, k)
+
+    def set_recall(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+        """Trade latency for recall: more IVF lists probed / a wider HNSW beam"""
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+
+    def rebuild(self, index_type: Optional[str] = None, vectors: Optional[np.ndarray] = None) -> None:
+        """Build a fresh index of the target type from every stored vector"""
+        if vectors is None:
+            vectors = self._all_vectors()
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        kind = index_type or self.index_type
+        index = self._build(kind, len(vectors))
+        if kind in TRAINED_TYPES:
+            index.train(vectors)
+            self.trained_size = len(vectors)
+        if len(vectors) > 0:
+            index.add(vectors)
+        self.index = index
+        self.active_type = kind
+        logger.info("Rebuilt %s index over %d vectors", kind, len(vectors))
+
+    def replace(self, vectors: np.ndarray) -> None:
+        """Swap in exactly ``vectors`` (row ids restart at 0), e.g. after compaction"""
+        migrated = self.index_type != "flat" and len(vectors) >= self.migrate_at
+        self.rebuild("flat" if not migrated else None, vectors=vectors)
+
+    def get_vectors(self) -> np.ndarray:
+        """Every indexed vector in row order"""
+        return self._all_vectors()
+
+    def serialize(self) -> np.ndarray:
+        """The active index as a uint8 array, for snapshots"""
+        return faiss.serialize_index(self.index)
+
+    def restore(self, data: np.ndarray, active_type: str, trained_size: int) -> None:
+        """Swap in an index written by serialize(); rows added later go on top"""
+        index = faiss.deserialize_index(np.ascontiguousarray(data, dtype=np.uint8))
+        if index.d != self.dimension:
+            raise ValueError(f"Snapshot index has dimension {index.d}, expected {self.dimension}")
+        self.index = index
+        self.active_type = active_type
+        self.trained_size = trained_size
+
+    def reset(self) -> None:
+        """Drop every vector and fall back to an empty flat index"""
+        self.index = faiss.IndexFlatIP(self.dimension)
+        self.active_type = "flat"
+        self.trained_size = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "index_type": self.index_type,
+            "active_index": self.active_type,
+            "indexed_vectors": self.ntotal,
+            "nprobe": self.nprobe,
+            "ef_search": self.ef_search
+        }
+
+    def _all_vectors(self) -> np.ndarray:
+        if self.vector_source is not None:
+            vectors = self.vector_source()
+        elif self.ntotal > 0:
+            vectors = self.index.reconstruct_n(0, self.ntotal)
+        else:
+            vectors = np.empty((0, self.dimension))
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def _build(self, kind: str, n: int):
+        if kind == "flat":
+            return faiss.IndexFlatIP(self.dimension)
+        if kind == "hnsw":
+            return faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+
+        # ~4*sqrt(n) lists, keeping the recommended 39+ training points per list
+        nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+        quantizer = faiss.IndexFlatIP(self.dimension)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            # Allow reconstruct() so the index can be retrained without a vector store
+            index.make_direct_map()
+            return index
+        m = max(d for d in range(1, self.pq_m + 1) if self.dimension % d == 0)
+        pq = faiss.IndexIVFPQ(quantizer, self.dimension, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+        # Keeps the exact vectors next to the codes: re-scoring, and lossless reconstruct()
+        index = faiss.IndexRefineFlat(pq)
+        index.k_factor = self.refine_factor
+        return index
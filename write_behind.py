@@ -0,0 +1,185 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import numpy as np
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PendingWrite:
+    """One store() waiting for the write-behind worker"""
+    query: str
+    response: str
+    # Embedding computed for the lookup, if the caller had one
+    embedding: Optional[np.ndarray]
+    ttl_seconds: Optional[float]
+    # normalize_query(query), for read-your-writes on exact repeats
+    key: str
+    # The memory's clear() count at submit; a clear since then drops the write
+    epoch: int = 0
+
+class WriteBehind:
+    """Background writer for one SemanticMemory partition.
+
+    ``submit()`` returns at once; a worker thread collects writes for up to
+    ``max_wait_ms`` (or ``max_batch`` of them) and hands each batch to
+    ``write_batch``, which encodes, deduplicates, persists and indexes it in
+    one pass. Until then a write can be read back by its normalized query
+    with ``pending()``. With a full queue ``submit()`` blocks, so a stuck
+    disk slows requests down instead of growing memory without bound.
+
+    The same thread calls ``snapshot`` every ``snapshot_interval`` seconds,
+    if given.
+    """
+
+    def __init__(self, write_batch: Callable[[List[PendingWrite]], None], max_batch: int = 64,
+                 max_wait_ms: float = 50.0, max_queue: int = 10000,
+                 snapshot: Optional[Callable[[], bool]] = None, snapshot_interval: Optional[float] = None,
+                 name: str = "default"):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.snapshot = snapshot
+        self.snapshot_interval = snapshot_interval if snapshot is not None else None
+        self.name = name
+
+        self.submitted = 0
+        self.batches = 0
+        self.snapshots = 0
+        self.errors = 0
+        self._reset()
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        # Also the after-fork hook: the worker thread and the parent's queued
+        # writes stay with the parent, which still writes them
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._pending: Dict[str, PendingWrite] = {}
+        self._pending_lock = threading.Lock()
+        self._idle = threading.Condition(self._pending_lock)
+        self._unfinished = 0
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._closed = False
+
+    def start(self) -> None:
+        """Start the worker now rather than on the first write (e.g. for snapshots alone)"""
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+                self._worker.start()
+
+    def submit(self, write: PendingWrite) -> None:
+        self.start()
+        with self._pending_lock:
+            self._pending[write.key] = write
+            self._unfinished += 1
+            self.submitted += 1
+        self._queue.put(write)
+
+    def pending(self, key: str) -> Optional[PendingWrite]:
+        """The queued write for a normalized query, if any"""
+        with self._pending_lock:
+            return self._pending.get(key)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted write has been stored; False on timeout"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._idle:
+            while self._unfinished:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def discard(self) -> int:
+        """Drop queued writes that have not been taken by the worker yet (e.g. on clear)"""
+        dropped = 0
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            dropped += 1
+        with self._idle:
+            self._pending.clear()
+            self._unfinished -= dropped
+            self._idle.notify_all()
+        return dropped
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Store what is queued and take a last snapshot; called at exit"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._worker is not None and not self.flush(timeout):
+            logger.warning("⚠️ Exiting with %d unwritten cache entries in '%s'", self._unfinished, self.name)
+        if self.snapshot_interval:
+            self._snapshot()
+
+    def _run(self) -> None:
+        next_snapshot = time.monotonic() + self.snapshot_interval if self.snapshot_interval else None
+        while True:
+            timeout = max(0.0, next_snapshot - time.monotonic()) if next_snapshot is not None else None
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            if batch:
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                self._write(batch)
+            if next_snapshot is not None and time.monotonic() >= next_snapshot:
+                self._snapshot()
+                next_snapshot = time.monotonic() + self.snapshot_interval
+
+    def _write(self, batch: List[PendingWrite]) -> None:
+        try:
+            self.write_batch(batch)
+            self.batches += 1
+        except Exception as e:
+            self.errors += 1
+            logger.exception("❌ Write-behind batch of %d for '%s' failed: %s", len(batch), self.name, e)
+        finally:
+            with self._idle:
+                for write in batch:
+                    # A newer write for the same query may have replaced it
+                    if self._pending.get(write.key) is write:
+                        del self._pending[write.key]
+                self._unfinished -= len(batch)
+                self._idle.notify_all()
+
+    def _snapshot(self) -> None:
+        try:
+            if self.snapshot():
+                self.snapshots += 1
+        except Exception as e:
+            self.errors += 1
+            logger.exception("❌ Snapshot of '%s' failed: %s", self.name, e)
+
+    def get_stats(self) -> dict:
+        return {
+            "write_queue": self._unfinished,
+            "write_batches": self.batches,
+            "writes_submitted": self.submitted,
+            "snapshots": self.snapshots,
+            "write_errors": self.errors
+        }
@@ -0,0 +1,12 @@
+"""WSGI entry point for production serving.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every worker opens the same MEMORY_DIR store, so entries cached by one worker
+are served by the others after at most one sync interval.
+"""
+
+from app import app
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000, threaded=True)